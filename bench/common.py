@@ -0,0 +1,29 @@
+"""Helpers shared by the benchmarks in bench/."""
+import itertools, os, subprocess, sys
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+
+def read_games(path, limit=None):
+    """The first `limit` (default: all) games of a plain or gzipped PGN file."""
+    from src.archive import read_games as iter_games  # keeps bench/startup.py's children light
+    return list(itertools.islice(iter_games(path), limit))
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile, `pct` in 0-100; None for no values."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(pct / 100 * (len(values) - 1))))]
+
+
+def git_commit():
+    """Short hash of HEAD, so reports can be compared between commits."""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
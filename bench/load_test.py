@@ -0,0 +1,178 @@
+"""Load test for the Flask game API.
+
+Drives N simulated players through /new -> /move ... -> /resign using the
+app's test client (no network, real request handling) and reports throughput,
+p50/p95/p99 latency per endpoint and process memory growth. User moves are
+taken from data/all_games.pgn whenever the current position occurs there,
+otherwise a random legal move is played.
+
+    python bench/load_test.py --players 16 --moves 20 --engine stub
+    python bench/load_test.py --engine real --out bench/results/real.json
+
+Results are written as JSON so runs can be compared between commits.
+"""
+import argparse, json, os, platform, random, sys, threading, time
+from collections import defaultdict
+
+import chess, chess.engine
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(BASE_DIR, "web"))
+
+from common import git_commit, percentile, read_games
+
+
+def position_key(board):
+    return board.fen().rsplit(" ", 2)[0]  # ignore move counters
+
+
+def load_corpus(pgn_path, max_games):
+    """position -> moves played there, from the first `max_games` games."""
+    corpus = defaultdict(list)
+    for game in read_games(pgn_path, max_games):
+        board = game.board()
+        for move in game.mainline_moves():
+            corpus[position_key(board)].append(move)
+            board.push(move)
+    return corpus
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def stub_engine(eng, think):
+    """Replace engine calls with a random legal move after `think` seconds."""
+    def play(board, limit):
+        time.sleep(think)
+        return chess.engine.PlayResult(random.choice(list(board.legal_moves)), None)
+    eng.play = play
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def call(self, name, fn, *args, **kwargs):
+        start = time.perf_counter()
+        resp = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        data = resp.get_json(silent=True) or {}
+        with self.lock:
+            self.latency[name].append(elapsed)
+            if resp.status_code != 200 or not data.get("ok", False):
+                self.errors[name] += 1
+        return data
+
+    def add(self, name, elapsed):
+        with self.lock:
+            self.latency[name].append(elapsed)
+
+
+def play_session(app, corpus, args, rec, rng):
+    client = app.test_client()
+    for _ in range(args.games):
+        color = rng.choice("wb")
+        data = rec.call("/new", client.post, "/new", json={"color": color})
+        board = chess.Board(data.get("fen", chess.STARTING_FEN))
+        for _ in range(args.moves):
+            if board.is_game_over():
+                break
+            options = [m for m in corpus.get(position_key(board), []) if board.is_legal(m)]
+            move = rng.choice(options) if options else rng.choice(list(board.legal_moves))
+            start = time.perf_counter()
+            data = rec.call("/move", client.post, "/move", json={"uci": move.uci()})
+            while data.get("pending"):
+                time.sleep(args.poll)
+                data = rec.call("/bot_move", client.get, "/bot_move")
+            rec.add("move round-trip", time.perf_counter() - start)
+            if not data.get("ok") or "result" in data:
+                break
+            board = chess.Board(data["fen"])
+        rec.call("/resign", client.post, "/resign")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--players", type=int, default=8, help="concurrent simulated players")
+    ap.add_argument("--games", type=int, default=2, help="games per player")
+    ap.add_argument("--moves", type=int, default=20, help="user moves per game")
+    ap.add_argument("--engine", choices=["stub", "real"], default="stub")
+    ap.add_argument("--think", type=float, default=0.05, help="stub engine think time (s)")
+    ap.add_argument("--poll", type=float, default=0.02, help="/bot_move poll interval (s)")
+    ap.add_argument("--pgn", default=os.path.join(BASE_DIR, "data", "all_games.pgn"))
+    ap.add_argument("--corpus-games", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--record", action="store_true", help="archive finished games and record them into move_db")
+    ap.add_argument("--out", default=None, help="write results JSON here")
+    args = ap.parse_args()
+
+    corpus = load_corpus(args.pgn, args.corpus_games)
+    rss_before = rss_mb()
+    import app as web_app  # noqa: E402  (imports load the persona and engine)
+    import bot_core
+    if args.engine == "stub":
+        stub_engine(bot_core.shared_assets().eng, args.think)
+    if not args.record:
+        # Keep benchmark games out of the archive and don't teach the persona random moves.
+        bot_core.shared_assets().archive = None
+        bot_core.BotGame._update_db = lambda self: None
+    rss_loaded = rss_mb()
+
+    rec = Recorder()
+    seeds = random.Random(args.seed)
+    threads = [threading.Thread(target=play_session,
+                                args=(web_app.app, corpus, args, rec, random.Random(seeds.random())))
+               for _ in range(args.players)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    rss_after = rss_mb()
+
+    endpoints = {}
+    for name, values in sorted(rec.latency.items()):
+        endpoints[name] = {
+            "requests": len(values),
+            "errors": rec.errors.get(name, 0),
+            "throughput_rps": round(len(values) / wall, 2),
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p95_ms": round(percentile(values, 95) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+            "max_ms": round(max(values) * 1000, 2),
+        }
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "params": vars(args),
+        "wall_seconds": round(wall, 3),
+        "moves_per_second": round(len(rec.latency["move round-trip"]) / wall, 2),
+        "memory_mb": {
+            "before_import": round(rss_before, 1),
+            "after_import": round(rss_loaded, 1),
+            "after_run": round(rss_after, 1),
+            "growth_during_run": round(rss_after - rss_loaded, 1),
+        },
+        "endpoints": endpoints,
+    }
+
+    print(json.dumps(results, indent=2))
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
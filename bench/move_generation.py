@@ -0,0 +1,177 @@
+"""Move-generation and per-ply overhead micro-benchmarks.
+
+- perft: node counts for standard test positions (checked against the known
+  values) and nodes/sec, as the unit cost of move generation here
+- bot_move: BotGame.bot_move latency with the engine stubbed out; with
+  --baseline REV, the same run against that revision's code (exported with
+  git archive and run in a child process), e.g. the commit before the
+  per-ply cache (web/plies.py) as below; older revisions predate
+  shared_assets and can't be benchmarked
+- update_db: end-of-game learning from the cached rows against replaying
+  the finished game (record_game, what _update_db used to call)
+
+    python bench/move_generation.py --games 50 --out bench/results/movegen.json \\
+        --baseline "$(git rev-list HEAD -- web/plies.py | tail -1)^"
+"""
+import argparse, io, json, os, platform, random, shutil, statistics, subprocess, sys, tarfile, tempfile, time
+
+import chess, chess.engine, chess.pgn
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(BASE_DIR, "web"))
+
+from common import git_commit, read_games
+
+PERFT = [
+    ("startpos", chess.STARTING_FEN, 3, 8902),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", 2, 2039),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", 3, 2812),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", 2, 264),
+]
+
+
+def perft(board, depth):
+    if depth == 1:
+        return board.legal_moves.count()
+    nodes = 0
+    for move in board.legal_moves:
+        board.push(move)
+        nodes += perft(board, depth - 1)
+        board.pop()
+    return nodes
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+# -------------------------------
+# benchmarks
+# -------------------------------
+def bench_perft():
+    out = {}
+    for name, fen, depth, expected in PERFT:
+        board = chess.Board(fen)
+        start = time.perf_counter()
+        nodes = perft(board, depth)
+        elapsed = time.perf_counter() - start
+        if nodes != expected:
+            raise SystemExit(f"perft {name} depth {depth}: {nodes} nodes, expected {expected}")
+        out[name] = {"depth": depth, "nodes": nodes, "nodes_per_second": round(nodes / elapsed)}
+    return out
+
+
+def bench_bot_move(games, rng):
+    import bot_core
+    latencies = []
+    for game in games:
+        bot = bot_core.BotGame(user_is_white=True, ponder=False)
+        bot.sampler = None
+        bot.new_game("w")
+        for ply, move in enumerate(game.mainline_moves()):
+            # Only board calls out here, so any revision's BotGame can run this
+            if bot.board.is_game_over() or ply >= 60:
+                break
+            if ply % 2 == 0:  # the user follows the corpus game while it is legal
+                if not bot.board.is_legal(move):
+                    move = rng.choice(list(bot.board.legal_moves))
+                bot.user_move(move.uci())
+            else:
+                latencies.append(timed(bot.bot_move))
+    latencies.sort()
+    return {"moves": len(latencies),
+            "mean_us": round(statistics.mean(latencies) * 1e6, 1),
+            "p50_us": round(latencies[len(latencies) // 2] * 1e6, 1),
+            "p95_us": round(latencies[int(len(latencies) * 0.95)] * 1e6, 1)}
+
+
+def bench_update_db(games, store):
+    import bot_core
+    replay, cached = [], []
+    for game in games:
+        bot = bot_core.BotGame(ponder=False)
+        bot.game = chess.pgn.Game()
+        bot.node = bot.game
+        for move in game.mainline_moves():
+            bot.push(move)
+        replay.append(timed(store.record_game, bot.game))
+        cached.append(timed(lambda: store.record_plies(bot.plies.rows(bot.game))))
+    return {"games": len(games),
+            "replay_ms_per_game": round(statistics.mean(replay) * 1000, 3),
+            "cached_ms_per_game": round(statistics.mean(cached) * 1000, 3)}
+
+
+def bench_baseline(rev, args):
+    """bench_bot_move against the code at `rev`, run from an exported copy of that tree."""
+    tree = tempfile.mkdtemp(prefix="movegen-baseline-")
+    try:
+        archive = subprocess.run(["git", "archive", rev, "web", "src", "persona", "config.json"],
+                                 cwd=BASE_DIR, capture_output=True, check=True).stdout
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            tar.extractall(tree)
+        os.makedirs(os.path.join(tree, "data"), exist_ok=True)  # its analysis cache goes here
+        out = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--tree", tree,
+                                       "--pgn", os.path.abspath(args.pgn), "--games", str(args.games),
+                                       "--seed", str(args.seed)], cwd=tree)
+    finally:
+        shutil.rmtree(tree, ignore_errors=True)
+    return {"rev": rev, "bot_move": json.loads(out.decode().strip().splitlines()[-1])}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--pgn", default=os.path.join(BASE_DIR, "data", "all_games.pgn"))
+    ap.add_argument("--games", type=int, default=50, help="corpus games to replay")
+    ap.add_argument("--baseline", default=None, help="also time bot_move at this git revision")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None, help="write the JSON report here")
+    ap.add_argument("--tree", default=None, help=argparse.SUPPRESS)  # baseline child: run that tree's code
+    args = ap.parse_args()
+
+    if args.tree:
+        sys.path[:0] = [args.tree, os.path.join(args.tree, "web")]
+    games = read_games(args.pgn, args.games)
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+
+    import bot_core
+    from src.move_store import SqliteMoveStore
+    assets = bot_core.shared_assets()
+    assets.archive = None
+    # Stub the engine: these numbers are about board bookkeeping, not search.
+    assets.eng.play = lambda board, limit: chess.engine.PlayResult(rng.choice(list(board.legal_moves)), None)
+    scratch = tempfile.mkdtemp(prefix="movegen-")
+    store = SqliteMoveStore(os.path.join(scratch, "move_db.sqlite"), import_legacy=None)
+    assets.move_db = store  # never learn into the real move_db
+
+    try:
+        if args.tree:
+            print(json.dumps(bench_bot_move(games, rng)))
+            return
+        report = {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "params": vars(args),
+            "perft": bench_perft(),
+            "bot_move": bench_bot_move(games, rng),
+            "update_db": bench_update_db(games, store),
+        }
+    finally:
+        store.close()
+        shutil.rmtree(scratch, ignore_errors=True)
+    if args.baseline:
+        report["baseline"] = bench_baseline(args.baseline, args)
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""Nearest-neighbour position index: imitation quality and lookup latency.
+
+- fidelity: build the index from most of the corpus and ask it for the
+  persona's move in the held-out games past the opening book; how often its
+  top move is the one actually played, and how many positions it answers at
+  all, per max_distance (random legal move as the baseline)
+- sampler: the style sampler over a fixed-depth MultiPV search of the same
+  positions, with and without the index's votes as a prior; how often it
+  plays the move actually played
+- scale: an index of --positions positions (corpus positions plus short
+  random continuations of them) queried with held-out positions; exact
+  scan against LSH latency, and how often LSH finds the true nearest
+
+    python bench/neighbours.py --positions 120000 --out bench/results/neighbours.json
+"""
+import argparse, json, os, platform, random, statistics, sys, time
+from collections import Counter, defaultdict
+
+import chess, chess.engine
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BASE_DIR)
+
+from common import git_commit, percentile, read_games
+from src.move_sampler import StyleSampler
+from src.position_index import PositionIndex, corpus_player, encode_move, features, record_game
+from src.search import Searcher
+
+DISTANCES = (0, 8, 16, 24, 32, 48)
+
+
+def player_positions(games, player, min_ply):
+    """(board, move played) for every held-out position the player moved from."""
+    out = []
+    for game in games:
+        board = game.board()
+        for ply, move in enumerate(game.mainline_moves()):
+            color = "White" if board.turn == chess.WHITE else "Black"
+            if ply >= min_ply and game.headers.get(color) == player:
+                out.append((board.copy(stack=False), move))
+            board.push(move)
+    return out
+
+
+# -------------------------------
+# benchmarks
+# -------------------------------
+def build_index(games, player):
+    positions = defaultdict(Counter)
+    for game in games:
+        record_game(positions, game, player)
+    return PositionIndex.build(positions)
+
+
+def bench_fidelity(index, queries, k):
+    out = {"indexed": len(index), "queries": len(queries),
+           "random_top1": round(statistics.mean(1 / b.legal_moves.count() for b, _ in queries), 3)}
+    nearest = []
+    by_distance = {d: [0, 0] for d in DISTANCES}  # answered, top move was the one played
+    for board, played in queries:
+        ranked = index.moves(board, k=k, max_distance=max(DISTANCES))
+        _, dist = index.nearest(board, 1)
+        nearest.append(int(dist[0]))
+        for d in DISTANCES:
+            within = index.moves(board, k=k, max_distance=d) if d < max(DISTANCES) else ranked
+            if within:
+                by_distance[d][0] += 1
+                by_distance[d][1] += within[0][0] == played
+    out["nearest_distance_p50"] = percentile(nearest, 50)
+    out["nearest_distance_p90"] = percentile(nearest, 90)
+    out["by_max_distance"] = {
+        str(d): {"answered": round(a / len(queries), 3), "top1": round(hit / a, 3) if a else None}
+        for d, (a, hit) in by_distance.items()}
+    return out
+
+
+def bench_sampler(index, queries, k, max_distance, depth):
+    with open(os.path.join(BASE_DIR, "persona", "style.json"), encoding="utf-8") as f:
+        style = json.load(f)
+    searcher = Searcher(max_depth=depth)
+    sampler = StyleSampler(searcher, style, chess.engine.Limit(depth=depth))
+    plain, steered, changed = [], [], 0
+    for board, played in queries:
+        infos = searcher.analyse(board, sampler.limit, multipv=sampler.multipv)
+        prior = dict(index.moves(board, k=k, max_distance=max_distance))
+        for probs, candidates in ((plain, sampler.candidates(board, infos)),
+                                  (steered, sampler.candidates(board, infos, prior))):
+            total = sum(w for _, w, _ in candidates) or 1
+            probs.append(sum(w for m, w, _ in candidates if m == played) / total)
+        changed += prior != {}
+    return {"positions": len(queries), "with_votes": changed, "depth": depth,
+            "p_played_plain": round(statistics.mean(plain), 3),
+            "p_played_with_votes": round(statistics.mean(steered), 3)}
+
+
+def random_continuation(board, rng, plies):
+    board = board.copy(stack=False)
+    for _ in range(plies):
+        moves = list(board.legal_moves)
+        if not moves:
+            break
+        board.push(rng.choice(moves))
+    return board
+
+
+def bench_scale(games, queries, size, k, rng):
+    boards = []
+    for game in games:
+        board = game.board()
+        for move in game.mainline_moves():
+            boards.append(board.copy(stack=False))
+            board.push(move)
+    positions = defaultdict(Counter)
+    for board in boards:
+        positions[features(board)][encode_move(next(iter(board.legal_moves), chess.Move.null()))] += 1
+    while len(positions) < size:
+        board = random_continuation(rng.choice(boards), rng, rng.randint(1, 8))
+        move = next(iter(board.legal_moves), None)
+        if move is not None:
+            positions[features(board)][encode_move(move)] += 1
+    start = time.perf_counter()
+    index = PositionIndex.build(positions)
+    out = {"positions": len(index), "build_seconds": round(time.perf_counter() - start, 2),
+           "lsh_tables": 0 if index.lsh_bits is None else len(index.lsh_bits)}
+    exact, lsh, candidates, found = [], [], [], 0
+    for board, _ in queries:
+        t0 = time.perf_counter()
+        _, want = index.nearest(board, k, exact=True)
+        t1 = time.perf_counter()
+        _, got = index.nearest(board, k)
+        t2 = time.perf_counter()
+        exact.append(t1 - t0)
+        lsh.append(t2 - t1)
+        rows = index.candidates(features(board), k)
+        candidates.append(len(index) if rows is None else len(rows))
+        found += got[0] == want[0]
+    for name, times in (("exact", exact), ("lsh", lsh)):
+        out[f"{name}_p50_ms"] = round(percentile(times, 50) * 1000, 3)
+        out[f"{name}_p95_ms"] = round(percentile(times, 95) * 1000, 3)
+    out["lsh_candidates_p50"] = percentile(candidates, 50)
+    out["lsh_found_nearest"] = round(found / len(queries), 3)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--pgn", default=os.path.join(BASE_DIR, "data", "all_games.pgn"))
+    ap.add_argument("--held-out", type=float, default=0.1, help="share of games kept out of the index")
+    ap.add_argument("--min-ply", type=int, default=16, help="skip positions the opening book covers")
+    ap.add_argument("--positions", type=int, default=120000, help="index size for the latency run")
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("-k", type=int, default=16)
+    ap.add_argument("--max-distance", type=int, default=32)
+    ap.add_argument("--sampler-positions", type=int, default=200)
+    ap.add_argument("--depth", type=int, default=3, help="search depth for the sampler run")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None, help="write the JSON report here")
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    games = read_games(args.pgn)
+    split = int(len(games) * (1 - args.held_out))
+    train, held_out = games[:split], games[split:]
+    player = corpus_player([args.pgn])
+    queries = player_positions(held_out, player, args.min_ply)
+    rng.shuffle(queries)
+    index = build_index(train, player)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "params": vars(args),
+        "player": player,
+        "fidelity": bench_fidelity(index, queries, args.k),
+        "sampler": bench_sampler(index, queries[:args.sampler_positions], args.k,
+                                 args.max_distance, args.depth),
+        "scale": bench_scale(train, queries[:args.queries], args.positions, args.k, rng),
+    }
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
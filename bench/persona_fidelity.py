@@ -0,0 +1,205 @@
+"""Persona fidelity evaluation.
+
+Replays the persona's own moves from a held-out split of data/all_games.pgn
+through BotGame.select_move (nothing is pushed, learned or archived) and
+reports how often the bot would have played the same move:
+
+- top-1 / top-3 match rate against the move actually played
+- where decisions came from (book, move_db, engine, ...) and the book hit rate
+- average and tail decision latency
+
+Positions are batched across a process pool. The held-out split is the last
+`--holdout` fraction of games in file order; for an unbiased number build the
+persona from the training split only (`--split-out` writes both halves). The
+neighbour index is always rebuilt from the training split, since the one in
+persona/ has seen the held-out games (`--no-neighbours` turns it off).
+
+    python bench/persona_fidelity.py --time 0.05 --out bench/results/fidelity.json
+"""
+import argparse, json, os, platform, random, sys, time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import chess
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, "web"))
+
+from common import git_commit, percentile, read_games
+from src.position_index import INDEX_FILE, PositionIndex, np, record_game
+
+_game = None
+
+# Sources whose move came out of a search (pondered, steered by the
+# neighbour index, or shortened under load), not a lookup
+ENGINE_SOURCES = ("engine", "similar", "ponder", "shed")
+
+
+def detect_player(games):
+    names = Counter()
+    for game in games:
+        names[game.headers.get("White", "?")] += 1
+        names[game.headers.get("Black", "?")] += 1
+    return names.most_common(1)[0][0]
+
+
+def train_index(games, player):
+    """Neighbour index over the persona's positions in the training games only."""
+    positions = defaultdict(Counter)
+    for game in games:
+        record_game(positions, game, player)
+    return PositionIndex.build(positions)
+
+
+def persona_positions(game, player):
+    """(fen, uci, ply) for every position where `player` was to move."""
+    if game.headers.get("White") == player:
+        color = chess.WHITE
+    elif game.headers.get("Black") == player:
+        color = chess.BLACK
+    else:
+        return
+    board = game.board()
+    for ply, move in enumerate(game.mainline_moves()):
+        if board.turn == color:
+            yield board.fen(), move.uci(), ply
+        board.push(move)
+
+
+# -------------------------------
+# worker side
+# -------------------------------
+def init_worker(time_limit, neighbours):
+    global _game
+    import bot_core
+    assets = bot_core.shared_assets()
+    assets.neighbours = neighbours  # built from the training split, or None
+    if time_limit is not None:
+        assets.eng.config["time_limit"] = time_limit
+        assets.eng.config["think_time"] = time_limit
+    _game = bot_core.BotGame(assets=assets, ponder=False)
+
+
+def evaluate_batch(batch, seed):
+    random.seed(seed)  # book, move_db and sampler picks are reproducible per batch
+    out = []
+    for fen, uci, ply in batch:
+        _game.board = chess.Board(fen)
+        start = time.perf_counter()
+        move, source, candidates = _game.select_move()
+        elapsed = time.perf_counter() - start
+        played = chess.Move.from_uci(uci)
+        out.append({
+            "ply": ply,
+            "source": source,
+            "top1": move == played,
+            "top3": played in candidates[:3] or move == played,
+            "latency": elapsed,
+        })
+    return out
+
+
+# -------------------------------
+# report
+# -------------------------------
+def summarize(results):
+    n = len(results) or 1
+    sources = Counter(r["source"] for r in results)
+    latency = [r["latency"] for r in results]
+    phases = {"opening (ply < 20)": lambda p: p < 20, "middlegame (20-59)": lambda p: 20 <= p < 60,
+              "late (60+)": lambda p: p >= 60}
+    by_phase = {}
+    for name, test in phases.items():
+        subset = [r for r in results if test(r["ply"])]
+        if subset:
+            by_phase[name] = {"positions": len(subset),
+                              "top1": round(sum(r["top1"] for r in subset) / len(subset), 4),
+                              "top3": round(sum(r["top3"] for r in subset) / len(subset), 4)}
+    return {
+        "positions": len(results),
+        "top1": round(sum(r["top1"] for r in results) / n, 4),
+        "top3": round(sum(r["top3"] for r in results) / n, 4),
+        "book_hit_rate": round(sources["book"] / n, 4),
+        "engine_call_rate": round(sum(sources[s] for s in ENGINE_SOURCES) / n, 4),
+        "sources": {k: round(v / n, 4) for k, v in sorted(sources.items())},
+        "latency_ms": {
+            "mean": round(sum(latency) / n * 1000, 2),
+            "p50": round(percentile(latency, 50) * 1000, 2) if latency else None,
+            "p95": round(percentile(latency, 95) * 1000, 2) if latency else None,
+            "max": round(max(latency) * 1000, 2) if latency else None,
+        },
+        "by_phase": by_phase,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--pgn", default=os.path.join(BASE_DIR, "data", "all_games.pgn"))
+    ap.add_argument("--player", default=None, help="persona's PGN name (default: most frequent player)")
+    ap.add_argument("--holdout", type=float, default=0.2, help="fraction of games held out (last in file)")
+    ap.add_argument("--split-out", default=None, help="write train.pgn / holdout.pgn here")
+    ap.add_argument("--no-neighbours", action="store_true", help="evaluate without the neighbour index")
+    ap.add_argument("--time", type=float, default=None, help="engine time per decision (default: config)")
+    ap.add_argument("--max-positions", type=int, default=None)
+    ap.add_argument("--batch", type=int, default=64)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None, help="write the JSON report here")
+    args = ap.parse_args()
+
+    games = read_games(args.pgn)
+    player = args.player or detect_player(games)
+    cut = len(games) - max(1, round(len(games) * args.holdout))
+    train, holdout = games[:cut], games[cut:]
+    if args.split_out:
+        os.makedirs(args.split_out, exist_ok=True)
+        for name, part in (("train.pgn", train), ("holdout.pgn", holdout)):
+            with open(os.path.join(args.split_out, name), "w", encoding="utf-8") as f:
+                f.writelines(f"{game}\n\n" for game in part)
+
+    neighbours = None
+    if not args.no_neighbours and np is not None:
+        import bot_core
+        if bot_core.shared_assets().neighbours is not None:  # enabled and built for the app
+            neighbours = train_index(train, player)
+            if args.split_out:
+                neighbours.save(os.path.join(args.split_out, INDEX_FILE))
+
+    positions = [p for game in holdout for p in persona_positions(game, player)]
+    if args.max_positions:
+        positions = positions[:args.max_positions]
+    batches = [positions[i:i + args.batch] for i in range(0, len(positions), args.batch)]
+    print(f"Evaluating {len(positions)} positions from {len(holdout)} held-out games "
+          f"as {player!r} on {args.workers} worker(s)...")
+
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                             initargs=(args.time, neighbours)) as pool:
+        futures = [pool.submit(evaluate_batch, b, args.seed + i) for i, b in enumerate(batches)]
+        for fut in futures:
+            results.extend(fut.result())
+    wall = time.perf_counter() - start
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "params": {**vars(args), "player": player},
+        "games": {"train": len(train), "holdout": len(holdout)},
+        "neighbour_positions": len(neighbours) if neighbours is not None else 0,
+        "wall_seconds": round(wall, 2),
+        "positions_per_second": round(len(results) / wall, 2) if wall else None,
+        **summarize(results),
+    }
+    print(json.dumps(report, indent=2))
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
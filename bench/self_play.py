@@ -0,0 +1,176 @@
+"""Bot-vs-bot self-play simulator.
+
+Plays games between the persona (the full BotGame move-selection stack) and
+either itself, the plain engine, or a random mover, spread over a process
+pool. Each game starts from a short random line drawn from the persona's
+opening book so games don't all repeat. Games are streamed to a PGN file as
+they finish and a JSON report gives games/sec, moves/sec, per-move latency
+(overall and per move source) and results.
+
+    python bench/self_play.py --games 200 --opponent engine --time 0.05 --pgn-out /tmp/selfplay.pgn
+
+Nothing is archived or learned: finished games never reach end_game().
+"""
+import argparse, gzip, json, os, platform, random, sys, time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import chess, chess.engine
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(BASE_DIR, "web"))
+
+from common import git_commit, percentile
+
+_assets = None
+_limit = None
+
+
+def init_worker(time_limit):
+    global _assets, _limit
+    import bot_core
+    _assets = bot_core.shared_assets()
+    if time_limit is not None:
+        _assets.eng.config["time_limit"] = time_limit
+        _assets.eng.config["think_time"] = time_limit
+    _limit = chess.engine.Limit(time=_assets.eng.config["time_limit"])
+
+
+def opponent_move(kind, game, rng):
+    if kind == "random":
+        return rng.choice(list(game.board.legal_moves)), "random"
+    return _assets.eng.play(game.board, _limit).move, "baseline"
+
+
+def play_game(number, args):
+    import bot_core
+    seed = args.seed + number
+    random.seed(seed)
+    rng = random.Random(seed)
+    persona_white = number % 2 == 0  # alternate colours against a baseline
+    game = bot_core.BotGame(user_is_white=not persona_white, assets=_assets, ponder=False)
+
+    # Opening diversity: follow weighted book moves for a few plies
+    for _ in range(args.opening_plies):
+        move = game.book.choose(game.board, rng)
+        if move is None:
+            break
+        game.user_move(move.uci())
+    opening = len(game.board.move_stack)
+
+    latencies = defaultdict(list)
+    while not game.board.is_game_over(claim_draw=True) and len(game.board.move_stack) < args.max_plies:
+        start = time.perf_counter()
+        if args.opponent == "persona" or (game.board.turn == chess.WHITE) == persona_white:
+            game.bot_move()
+            source = game.last_source
+        else:
+            move, source = opponent_move(args.opponent, game, rng)
+            game.user_move(move.uci())
+        latencies[source].append(time.perf_counter() - start)
+
+    outcome = game.board.outcome(claim_draw=True)
+    result = outcome.result() if outcome else "1/2-1/2"  # adjudicate over-long games as draws
+    headers = game.game.headers
+    headers["Event"] = "ReallyBot self-play"
+    headers["Round"] = str(number + 1)
+    headers["White"] = "ReallyBot" if persona_white or args.opponent == "persona" else args.opponent
+    headers["Black"] = "ReallyBot" if not persona_white or args.opponent == "persona" else args.opponent
+    headers["Result"] = result
+    headers["Termination"] = outcome.termination.name.lower() if outcome else "adjudicated"
+    headers["Opening"] = " ".join(m.uci() for m in game.board.move_stack[:opening]) or "-"
+    return {
+        "pgn": str(game.game),
+        "result": result,
+        "persona_white": persona_white,
+        "plies": len(game.board.move_stack) - opening,
+        "latencies": dict(latencies),
+    }
+
+
+# -------------------------------
+# report
+# -------------------------------
+def latency_summary(values):
+    return {
+        "moves": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 2),
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "max_ms": round(max(values) * 1000, 2),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--games", type=int, default=20)
+    ap.add_argument("--opponent", choices=["persona", "engine", "random"], default="persona")
+    ap.add_argument("--time", type=float, default=None, help="engine time per move (default: config)")
+    ap.add_argument("--opening-plies", type=int, default=4, help="random book plies before play starts")
+    ap.add_argument("--max-plies", type=int, default=300, help="adjudicate as a draw after this many plies")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--pgn-out", default=None, help="stream finished games here (.gz to compress)")
+    ap.add_argument("--out", default=None, help="write the JSON report here")
+    args = ap.parse_args()
+
+    pgn = None
+    if args.pgn_out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.pgn_out)), exist_ok=True)
+        opener = gzip.open if args.pgn_out.endswith(".gz") else open
+        pgn = opener(args.pgn_out, "wt", encoding="utf-8")
+
+    results = Counter()
+    persona_points = 0.0
+    latencies = defaultdict(list)
+    plies = 0
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                                 initargs=(args.time,)) as pool:
+            futures = [pool.submit(play_game, n, args) for n in range(args.games)]
+            for done, fut in enumerate(as_completed(futures), 1):
+                game = fut.result()
+                results[game["result"]] += 1
+                plies += game["plies"]
+                if game["result"] == "1/2-1/2":
+                    persona_points += 0.5
+                elif (game["result"] == "1-0") == game["persona_white"]:
+                    persona_points += 1
+                for source, values in game["latencies"].items():
+                    latencies[source].extend(values)
+                if pgn:
+                    pgn.write(game["pgn"] + "\n\n")
+                    pgn.flush()
+                if done % 10 == 0 or done == args.games:
+                    print(f"{done}/{args.games} games, {done / (time.perf_counter() - start):.2f} games/s")
+    finally:
+        if pgn:
+            pgn.close()
+    wall = time.perf_counter() - start
+
+    everything = [v for values in latencies.values() for v in values]
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "params": vars(args),
+        "wall_seconds": round(wall, 2),
+        "games_per_second": round(args.games / wall, 3),
+        "moves_per_second": round(plies / wall, 2),
+        "results": dict(results),
+        "persona_score": round(persona_points / args.games, 3) if args.opponent != "persona" else None,
+        "latency": latency_summary(everything) if everything else None,
+        "latency_by_source": {k: latency_summary(v) for k, v in sorted(latencies.items())},
+    }
+    print(json.dumps(report, indent=2))
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Startup-time benchmark.
+
+Measures how long a web worker takes to become useful, three ways:
+
+- eager:  fresh interpreter, import the app, then load every asset and start
+          the engine pool up front (what importing the app used to do)
+- cold:   fresh interpreter, import the app, assets load on first use
+- forked: a parent that imported the app and ran preload() forks the worker
+          (gunicorn --preload, see web/gunicorn.conf.py)
+
+For each, the time to import, to the bot's first (book) move and to the
+first engine search, and the worker's private memory where /proc allows.
+Also compares loading the persona from JSON against persona.marshal.
+
+    python bench/startup.py --runs 5 --out bench/results/startup.json
+"""
+import argparse, gc, json, os, platform, statistics, subprocess, sys, time
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+WEB_DIR = os.path.join(BASE_DIR, "web")
+sys.path.insert(0, WEB_DIR)
+
+from common import git_commit
+
+# Out of book after 1.e4 a5 2.Qh5 so the search really runs.
+SEARCH_FEN = "rnbqkbnr/1ppppppp/8/p6Q/4P3/8/PPPP1PPP/RNB1KBNR b KQkq - 1 2"
+
+
+def private_mb():
+    """Memory this process does not share with its parent (Linux only)."""
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        kb = sum(int(fields[k].split()[0]) for k in ("Private_Clean", "Private_Dirty"))
+        return round(kb / 1024, 1)
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def no_cache(bot_core):
+    # An analysis cache warmed by an earlier run would answer the first search.
+    bot_core.shared_assets().config["analysis_cache"] = {"enabled": False}
+
+
+def first_moves(think, start=None):
+    """Seconds from `start` (default: now) to the bot's first move and first engine search."""
+    import chess, chess.engine
+    import bot_core
+    start = start or time.perf_counter()
+    game = bot_core.BotGame(user_is_white=False, ponder=False)
+    game.bot_move()
+    first_move = time.perf_counter() - start
+    game.eng.play(chess.Board(SEARCH_FEN), chess.engine.Limit(time=think))
+    first_search = time.perf_counter() - start
+    return {"first_move": first_move, "first_search": first_search, "private_mb": private_mb()}
+
+
+# -------------------------------
+# measurements
+# -------------------------------
+def child(mode, think):
+    """Run in a fresh interpreter by run_fresh(); prints one JSON line."""
+    os.chdir(WEB_DIR)
+    start = time.perf_counter()
+    import app  # noqa: F401
+    import bot_core
+    ready = time.perf_counter()
+    no_cache(bot_core)
+    if mode == "eager":
+        bot_core.shared_assets().preload().eng.warm()
+    print(json.dumps({"import": ready - start, **first_moves(think, ready)}))
+
+
+def run_fresh(mode, think):
+    out = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--child", mode,
+                                   "--think", str(think)], cwd=BASE_DIR)
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+def run_forked(runs, think):
+    """Preload once in this process, then fork one worker per run."""
+    os.chdir(WEB_DIR)
+    import app  # noqa: F401
+    import bot_core
+    no_cache(bot_core)
+    bot_core.shared_assets().preload()
+    gc.freeze()
+    results = []
+    for _ in range(runs):
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read)
+            try:
+                payload = json.dumps({"import": 0.0, **first_moves(think)}).encode()
+                os.write(write, payload)
+            finally:
+                os._exit(0)
+        os.close(write)
+        with os.fdopen(read, "rb") as f:
+            results.append(json.loads(f.read()))
+        os.waitpid(pid, 0)
+    os.chdir(BASE_DIR)
+    return results
+
+
+def persona_load_times(repeat=5):
+    import bot_core
+    from src.snapshot import load_snapshot
+
+    def best(fn):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        return round(min(times) * 1000, 2)
+
+    def from_json():
+        with open(os.path.join(bot_core.PERSONA_DIR, "opening_book.json")) as f:
+            bot_core.JsonBook.from_json(json.load(f))
+        with open(os.path.join(bot_core.PERSONA_DIR, "style.json")) as f:
+            json.load(f)
+
+    def from_snapshot():
+        snapshot = load_snapshot(bot_core.PERSONA_DIR)
+        bot_core.JsonBook(snapshot["positions"])
+
+    out = {"json_ms": best(from_json)}
+    if load_snapshot(bot_core.PERSONA_DIR) is not None:
+        out["snapshot_ms"] = best(from_snapshot)
+    return out
+
+
+# -------------------------------
+# report
+# -------------------------------
+def summarize(results):
+    def median_ms(key):
+        return round(statistics.median(r[key] for r in results) * 1000, 1)
+    out = {"runs": len(results), "import_ms": median_ms("import"),
+           "first_move_ms": median_ms("first_move"), "first_search_ms": median_ms("first_search")}
+    memory = [r["private_mb"] for r in results if r.get("private_mb") is not None]
+    if memory:
+        out["private_mb"] = statistics.median(memory)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--think", type=float, default=0.05, help="time limit of the first search")
+    ap.add_argument("--out", default=None, help="write the JSON report here")
+    ap.add_argument("--child", choices=["eager", "cold"], help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        child(args.child, args.think)
+        return
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "params": vars(args),
+    }
+    for mode in ("eager", "cold"):
+        print(f"{mode}: {args.runs} fresh interpreters...")
+        report[mode] = summarize([run_fresh(mode, args.think) for _ in range(args.runs)])
+    if hasattr(os, "fork"):
+        print(f"forked: {args.runs} workers from a preloaded parent...")
+        report["forked"] = summarize(run_forked(args.runs, args.think))
+    report["persona_load"] = persona_load_times()
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import chess
+import chess.engine
+import chess.polyglot
+
+# Cache of engine results keyed by (position, limit, engine options, multipv).
+#
+# An in-memory LRU sits in front of an optional SQLite tier that survives
+# restarts. Results are stored as plain JSON (UCI moves, centipawn/mate
+# scores) so both tiers hold the same thing, plus the engine time the result
+# originally cost, which is what the hit counters report as saved.
+#
+# The key is the Zobrist hash, so move counters and game history are not part
+# of it: a cached reply ignores repetition context, like a book move does.
+
+
+def limit_signature(limit):
+    if limit is None:
+        return "-"
+    parts = []
+    for name in ("time", "depth", "nodes", "mate"):
+        value = getattr(limit, name)
+        if value is not None:
+            parts.append(f"{name}={round(value, 3) if isinstance(value, float) else value}")
+    return ",".join(parts) or "-"
+
+
+def encode_score(pov_score):
+    score = pov_score.relative
+    if score.is_mate():
+        return {"mate": score.mate()}
+    return {"cp": score.score()}
+
+
+def decode_score(raw, turn):
+    if "mate" in raw:
+        return chess.engine.PovScore(chess.engine.Mate(raw["mate"]), turn)
+    return chess.engine.PovScore(chess.engine.Cp(raw["cp"]), turn)
+
+
+class AnalysisCache:
+    def __init__(self, max_entries=20000, path=None, options=None):
+        self.max_entries = max_entries
+        self.options = json.dumps(options or {}, sort_keys=True)
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.path = path
+        self.local = threading.local()
+        self.hits = self.disk_hits = self.misses = 0
+        self.saved_seconds = 0.0
+        if path:
+            conn = self._conn()
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS analysis (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.commit()
+
+    def _conn(self):
+        # A connection opened before a fork (preloaded app) must not be used
+        # by the child, even from the thread that survived the fork.
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn, self.local.pid = conn, os.getpid()
+        return conn
+
+    def key(self, board, limit, multipv=1, kind="play"):
+        return (f"{chess.polyglot.zobrist_hash(board):016x}|{kind}|{multipv}|"
+                f"{limit_signature(limit)}|{self.options}")
+
+    # -------------------------------
+    # lookups
+    # -------------------------------
+    def get(self, key):
+        with self.lock:
+            value = self.memory.get(key)
+            if value is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                self.saved_seconds += value.get("elapsed", 0.0)
+                return value
+        if self.path:
+            row = self._conn().execute("SELECT value FROM analysis WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                value = json.loads(row[0])
+                with self.lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                    self.saved_seconds += value.get("elapsed", 0.0)
+                    self._remember(key, value)
+                return value
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        with self.lock:
+            self._remember(key, value)
+        if self.path:
+            conn = self._conn()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO analysis (key, value) VALUES (?, ?)",
+                             (key, json.dumps(value)))
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.memory),
+                "engine_seconds_saved": round(self.saved_seconds, 3),
+            }
+
+    # -------------------------------
+    # engine results <-> cache values
+    # -------------------------------
+    @staticmethod
+    def encode_play(result, elapsed):
+        score = result.info.get("score") if result.info else None
+        return {
+            "move": result.move.uci(),
+            "ponder": result.ponder.uci() if result.ponder else None,
+            "score": encode_score(score) if score else None,
+            "elapsed": elapsed,
+        }
+
+    @staticmethod
+    def decode_play(value, board):
+        move = chess.Move.from_uci(value["move"])
+        if not board.is_legal(move):
+            return None
+        ponder = chess.Move.from_uci(value["ponder"]) if value["ponder"] else None
+        info = {"cached": True}
+        if value["score"]:
+            info["score"] = decode_score(value["score"], board.turn)
+        return chess.engine.PlayResult(move, ponder, info=info)
+
+    @staticmethod
+    def encode_analysis(infos, elapsed):
+        lines = []
+        for info in infos:
+            lines.append({
+                "pv": [m.uci() for m in info.get("pv", [])],
+                "score": encode_score(info["score"]) if "score" in info else None,
+                "depth": info.get("depth"),
+            })
+        return {"lines": lines, "elapsed": elapsed}
+
+    @staticmethod
+    def decode_analysis(value, board):
+        infos = []
+        for i, line in enumerate(value["lines"]):
+            pv = [chess.Move.from_uci(u) for u in line["pv"]]
+            if pv and not board.is_legal(pv[0]):
+                return None
+            info = {"multipv": i + 1, "pv": pv, "depth": line["depth"], "cached": True}
+            if line["score"]:
+                info["score"] = decode_score(line["score"], board.turn)
+            infos.append(info)
+        return infos
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
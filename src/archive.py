@@ -0,0 +1,185 @@
+import atexit
+import glob
+import gzip
+import io
+import os
+import queue
+import re
+import threading
+import uuid
+from datetime import datetime, timezone
+
+import chess.pgn
+
+# Archive of finished games.
+#
+# Requests hand the finished game to a queue and return; a writer thread
+# appends batches of games to multi-game PGN files in one directory, rotating
+# by size and/or day. Each process writes its own files (the pid is in the
+# name), so several web workers can share a directory without interleaving.
+#
+# Compressed archives are written as one gzip member per batch. The file on
+# disk is therefore always a run of complete members, and a reader that
+# remembered the old size can decompress just the bytes appended since.
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+FSYNC_POLICIES = ("always", "batch", "never")
+ARCHIVE_SUFFIXES = (".pgn", ".pgn.gz")
+
+
+def new_game_id():
+    """Sortable and unique across processes: UTC timestamp + random suffix."""
+    return f"{datetime.now(timezone.utc):%Y%m%d%H%M%S}-{uuid.uuid4().hex[:12]}"
+
+
+def is_pgn_path(path):
+    return path.endswith(ARCHIVE_SUFFIXES)
+
+
+def read_text(path, start=0, end=None):
+    """Decoded PGN text for bytes [start, end) of a plain or gzip archive file."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        raw = f.read() if end is None else f.read(end - start)
+    if path.endswith(".gz"):
+        raw = gzip.decompress(raw) if raw else b""
+    return raw.decode("utf-8", errors="ignore")
+
+
+def read_games(path, start=0, end=None):
+    stream = io.StringIO(read_text(path, start, end))
+    while True:
+        game = chess.pgn.read_game(stream)
+        if game is None:
+            break
+        yield game
+
+
+def archive_files(directory):
+    files = []
+    for suffix in ARCHIVE_SUFFIXES:
+        files.extend(glob.glob(os.path.join(directory, "games_*" + suffix)))
+    return sorted(files)
+
+
+def iter_archive(directory):
+    """Every archived game, oldest file first."""
+    for path in archive_files(directory):
+        yield from read_games(path)
+
+
+class GameArchive:
+    def __init__(self, directory, rotate_bytes=16 << 20, rotate_daily=True, compress=False,
+                 fsync="batch", flush_interval=1.0, max_batch=64):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, not {fsync!r}")
+        self.directory = directory
+        self.rotate_bytes = rotate_bytes
+        self.rotate_daily = rotate_daily
+        self.compress = compress
+        self.fsync = fsync
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.path = None
+        self.written = 0
+        os.makedirs(directory, exist_ok=True)
+        self.writer = threading.Thread(target=self._run, name="game-archive", daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    def submit(self, game):
+        """Queue a finished game; returns its archive id (also set as the GameId header)."""
+        game_id = game.headers.get("GameId") or new_game_id()
+        game.headers["GameId"] = game_id
+        self.queue.put(str(game))  # render now; the game object may be reused
+        return game_id
+
+    # -------------------------------
+    # writer thread
+    # -------------------------------
+    def _run(self):
+        while True:
+            try:
+                first = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [first]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            games = [g for g in batch if g is not None]
+            if games:
+                try:
+                    self._write(games)
+                except OSError as e:
+                    print(f"⚠️ Could not archive {len(games)} game(s): {e}")
+            for _ in batch:
+                self.queue.task_done()
+            if stop:
+                return
+
+    def _write(self, games):
+        if self.fsync == "always":
+            for game in games:
+                self._append([game])
+        else:
+            self._append(games)
+
+    def _append(self, games):
+        path = self._current_path()
+        data = "".join(game + "\n\n" for game in games).encode("utf-8")
+        if self.compress:
+            data = gzip.compress(data)
+        with open(path, "ab") as f:
+            f.write(data)
+            if self.fsync != "never":
+                f.flush()
+                os.fsync(f.fileno())
+        self.written += len(games)
+
+    def _current_path(self):
+        day = datetime.now(timezone.utc).strftime("%Y%m%d") if self.rotate_daily else "all"
+        if self.path is not None and os.path.basename(self.path).startswith(f"games_{day}_"):
+            if os.path.getsize(self.path) < self.rotate_bytes:
+                return self.path
+        # Pick up where this pid left off (restarts reuse pids), else start a new part.
+        prefix = f"games_{day}_p{os.getpid()}_"
+        suffix = ".pgn.gz" if self.compress else ".pgn"
+        pattern = re.compile(re.escape(prefix) + r"(\d+)" + re.escape(suffix) + "$")
+        parts = [int(m.group(1)) for name in os.listdir(self.directory)
+                 if (m := pattern.match(name))]
+        seq = max(parts, default=1)
+        path = os.path.join(self.directory, f"{prefix}{seq:03d}{suffix}")
+        if os.path.exists(path) and os.path.getsize(path) >= self.rotate_bytes:
+            path = os.path.join(self.directory, f"{prefix}{seq + 1:03d}{suffix}")
+        self.path = path
+        return path
+
+    def flush(self):
+        """Block until everything queued so far is on disk."""
+        self.queue.join()
+
+    def close(self):
+        if self.writer.is_alive():
+            self.queue.put(None)
+            self.writer.join()
+
+
+def open_archive(config, base_dir=BASE_DIR):
+    """Build the archive described by config["archive"], or None if disabled."""
+    opts = config.get("archive", {})
+    if not opts.get("enabled", True):
+        return None
+    directory = opts.get("dir", "data/archive")
+    return GameArchive(
+        os.path.join(base_dir, directory),
+        rotate_bytes=int(float(opts.get("rotate_mb", 16)) * (1 << 20)),
+        rotate_daily=bool(opts.get("rotate_daily", True)),
+        compress=bool(opts.get("compress", False)),
+        fsync=opts.get("fsync", "batch"),
+        flush_interval=float(opts.get("flush_interval", 1.0)),
+    )
@@ -1,26 +1,118 @@
-import argparse, json, os
-import chess.pgn
+import argparse, io, json, os, struct, time
+import chess, chess.pgn, chess.polyglot
 from collections import defaultdict, Counter
+from concurrent.futures import ProcessPoolExecutor
 
-def build_opening_book(pgn_path, max_plies=16):
-    book = defaultdict(Counter)
-    games = 0
-    with open(pgn_path, encoding="utf-8", errors="ignore") as f:
-        while True:
-            game = chess.pgn.read_game(f)
-            if game is None:
-                break
-            games += 1
-            board = game.board()
-            ply = 0
-            for mv in game.mainline_moves():
-                fen_key = board.fen()  # key BEFORE the move
-                san = board.san(mv)
-                book[fen_key][san] += 1
-                board.push(mv)
-                ply += 1
-                if ply >= max_plies:
+try:
+    from src.archive import read_text
+    from src.manifest import expand_pgn_paths, file_entry, load_manifest, plan_ingest, save_manifest
+    from src.snapshot import write_snapshot
+except ImportError:  # run as a script from src/
+    from archive import read_text
+    from manifest import expand_pgn_paths, file_entry, load_manifest, plan_ingest, save_manifest
+    from snapshot import write_snapshot
+
+# Polyglot entry: key, move, weight, learn. We keep the per-position running
+# total of weights in the (otherwise unused) learn field so readers can pick a
+# weighted move with a binary search instead of summing weights per lookup.
+BOOK_ENTRY = struct.Struct(">QHHI")
+
+# -------------------------------
+# PGN ingestion (single pass, parallel)
+# -------------------------------
+def split_pgn(pgn_path, parts, start=0):
+    """Byte offsets that cut [start, EOF) into ~`parts` ranges, each starting at an [Event tag."""
+    size = os.path.getsize(pgn_path)
+    if pgn_path.endswith(".gz"):
+        return [(start, size)] if size > start else []  # compressed: no byte-level splitting
+    offsets = [start]
+    with open(pgn_path, "rb") as f:
+        for i in range(1, parts):
+            f.seek(start + (size - start) * i // parts)
+            f.readline()  # skip the partial line we landed in
+            while True:
+                pos = f.tell()
+                line = f.readline()
+                if not line:
+                    pos = size
                     break
+                if line.startswith(b"[Event "):
+                    break
+            if pos > offsets[-1]:
+                offsets.append(pos)
+    if offsets[-1] < size:
+        offsets.append(size)
+    return list(zip(offsets, offsets[1:]))
+
+def new_tallies():
+    return {"games": 0, "moves": 0, "captures": 0, "checks": 0}
+
+def scan_chunk(pgn_path, start, end, max_plies):
+    """Parse games in [start, end) once, collecting book counts and style tallies."""
+    book = defaultdict(Counter)
+    tallies = new_tallies()
+    stream = io.StringIO(read_text(pgn_path, start, end))
+    while True:
+        game = chess.pgn.read_game(stream)
+        if game is None:
+            break
+        tallies["games"] += 1
+        board = game.board()
+        for ply, mv in enumerate(game.mainline_moves()):
+            capture = board.is_capture(mv)
+            if ply < max_plies:
+                book[board.fen()][board.san(mv)] += 1  # key BEFORE the move
+            board.push(mv)
+            tallies["moves"] += 1
+            if capture:
+                tallies["captures"] += 1
+            if board.is_check() and not board.is_checkmate():  # SAN "+" (mate is "#")
+                tallies["checks"] += 1
+    return book, tallies
+
+def merge_results(results):
+    """Reduce per-chunk (book, tallies) pairs in file order."""
+    book = defaultdict(Counter)
+    tallies = new_tallies()
+    for chunk_book, chunk_tallies in results:
+        for fen, counter in chunk_book.items():
+            book[fen].update(counter)
+        for k, v in chunk_tallies.items():
+            tallies[k] += v
+    return book, tallies
+
+def ingest(sources, max_plies=16, workers=None):
+    """Parse every (path, start_offset) source and return merged (book, tallies)."""
+    workers = workers or os.cpu_count() or 1
+    sizes = [max(0, os.path.getsize(path) - start) for path, start in sources]
+    total = sum(sizes) or 1
+    # A few chunks per worker keeps the pool busy when games vary in length.
+    chunks = workers * 4 if workers > 1 else 1
+    tasks = []
+    for (path, start), size in zip(sources, sizes):
+        parts = max(1, round(chunks * size / total))
+        tasks.extend((path, a, b) for a, b in split_pgn(path, parts, start))
+    if workers == 1:
+        results = [scan_chunk(path, a, b, max_plies) for path, a, b in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(scan_chunk, path, a, b, max_plies) for path, a, b in tasks]
+            results = [fut.result() for fut in futures]
+    return merge_results(results)
+
+def load_counters(path):
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    book = defaultdict(Counter, {fen: Counter(moves) for fen, moves in raw["book"].items()})
+    return book, raw["tallies"]
+
+def save_counters(path, book, tallies):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"book": book, "tallies": tallies}, f)
+    os.replace(tmp, path)
+
+def finalize_book(book):
     # convert counters to sorted lists
     out = {}
     for fen, counter in book.items():
@@ -28,24 +120,59 @@ def build_opening_book(pgn_path, max_plies=16):
             [{"san": san, "count": cnt} for san, cnt in counter.items()],
             key=lambda x: x["count"], reverse=True
         )
-    return out, games
-
-def build_style(pgn_path):
-    captures = checks = total = 0
-    with open(pgn_path, encoding="utf-8", errors="ignore") as f:
-        while True:
-            game = chess.pgn.read_game(f)
-            if game is None:
-                break
-            board = game.board()
-            for mv in game.mainline_moves():
-                san = board.san(mv)
-                total += 1
-                if "x" in san: captures += 1
-                if "+" in san: checks += 1
-                board.push(mv)
-    cap_ratio = captures / total if total else 0.2
-    chk_ratio = checks / total if total else 0.05
+    return out
+
+def polyglot_move(board, move):
+    # Polyglot encodes castling as "king takes own rook" (e1h1, e1a1, ...).
+    to_sq = move.to_square
+    if board.is_castling(move):
+        rank = chess.square_rank(move.from_square)
+        to_sq = chess.square(7 if board.is_kingside_castling(move) else 0, rank)
+    promo = move.promotion - 1 if move.promotion else 0
+    return to_sq | (move.from_square << 6) | (promo << 12)
+
+def write_json(path, data, **kwargs):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, **kwargs)
+    os.replace(tmp, path)
+
+def write_binary_book(book, path):
+    """Write a sorted Polyglot-compatible book keyed by Zobrist hash.
+
+    FEN keys that differ only in move counters collapse into one entry, so
+    transpositions share their statistics.
+    """
+    merged = defaultdict(Counter)
+    for fen, moves in book.items():
+        board = chess.Board(fen)
+        key = chess.polyglot.zobrist_hash(board)
+        for m in moves:
+            try:
+                move = board.parse_san(m["san"])
+            except ValueError:
+                continue
+            merged[key][polyglot_move(board, move)] += m["count"]
+
+    entries = 0
+    tmp = path + ".tmp"  # the web app mmaps the live file; never truncate it
+    with open(tmp, "wb") as f:
+        for key in sorted(merged):
+            counter = merged[key]
+            scale = max(1, -(-max(counter.values()) // 0xFFFF))  # keep weights within u16
+            cumulative = 0
+            for raw, cnt in sorted(counter.items(), key=lambda x: (-x[1], x[0])):
+                weight = max(1, cnt // scale)
+                cumulative += weight
+                f.write(BOOK_ENTRY.pack(key, raw, weight, cumulative))
+                entries += 1
+    os.replace(tmp, path)
+    return len(merged), entries
+
+def build_style(tallies):
+    total = tallies["moves"]
+    cap_ratio = tallies["captures"] / total if total else 0.2
+    chk_ratio = tallies["checks"] / total if total else 0.05
     # heuristic style knobs (simple, editable later)
     randomness = min(0.6, 0.15 + 0.7 * chk_ratio)   # more checks → more spice
     blunder = max(0.01, 0.03 - 0.02 * cap_ratio)    # more captures → slightly fewer blunders
@@ -59,22 +186,82 @@ def build_style(pgn_path):
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--pgn", default=os.path.join("data", "all_games.pgn"))
+    ap.add_argument("--pgn", nargs="+", default=[os.path.join("data", "all_games.pgn")],
+                    help="PGN files or directories of *.pgn files")
     ap.add_argument("--out", default="persona")
     ap.add_argument("--plies", type=int, default=16)
+    ap.add_argument("--no-binary", dest="binary", action="store_false",
+                    help="skip opening_book.bin (Polyglot layout, Zobrist keys) and remove a stale one")
+    ap.add_argument("--binary", action="store_true", help=argparse.SUPPRESS)  # now the default
+    ap.add_argument("--workers", type=int, default=None,
+                    help="parser processes (default: CPU count)")
+    ap.add_argument("--incremental", action="store_true",
+                    help="only parse PGN files (or appended games) not seen by the last build")
     args = ap.parse_args()
 
     os.makedirs(args.out, exist_ok=True)
-    book, games = build_opening_book(args.pgn, args.plies)
-    style = build_style(args.pgn)
+    paths = expand_pgn_paths(args.pgn)
+    manifest_path = os.path.join(args.out, "manifest.json")
+    counters_path = os.path.join(args.out, "counters.json")
+
+    # Raw counters from earlier builds; the manifest says which bytes they cover.
+    base = (defaultdict(Counter), new_tallies())
+    sources = [(p, 0) for p in paths]
+    manifest = load_manifest(manifest_path)
+    if args.incremental:
+        if manifest.get("plies") != args.plies or not os.path.exists(counters_path):
+            reason = "no previous build with these settings"
+        else:
+            todo, stale = plan_ingest(paths, manifest)
+            reason = f"{stale[0]} was modified or removed" if stale else None
+        if reason:
+            print(f"Full rebuild: {reason}.")
+        elif not todo:
+            print("Persona is up to date, nothing new to ingest.")
+            return
+        else:
+            base = load_counters(counters_path)
+            sources = todo
+
+    t0 = time.perf_counter()
+    fresh_counts, fresh_tallies = ingest(sources, args.plies, args.workers)
+    elapsed = time.perf_counter() - t0
+    games = fresh_tallies["games"]
+    counts, tallies = merge_results([base, (fresh_counts, fresh_tallies)])
+    book = finalize_book(counts)
+    style = build_style(tallies)
 
-    with open(os.path.join(args.out, "opening_book.json"), "w", encoding="utf-8") as f:
-        json.dump(book, f)
-    with open(os.path.join(args.out, "style.json"), "w", encoding="utf-8") as f:
-        json.dump(style, f, indent=2)
+    # Replace, don't rewrite in place: a running server may reload these at any moment.
+    write_json(os.path.join(args.out, "opening_book.json"), book)
+    write_json(os.path.join(args.out, "style.json"), style, indent=2)
 
-    print(f"Built opening book from {games} games → {len(book)} positions.")
+    # Files we skipped were verified unchanged by plan_ingest; don't hash them again.
+    parsed = {path for path, _ in sources}
+    known = manifest.get("files", {})
+    files = {}
+    for p in paths:
+        if p in parsed or p not in known:
+            files[p] = file_entry(p)
+        else:
+            files[p] = dict(known[p], mtime=os.stat(p).st_mtime)
+    save_counters(counters_path, counts, tallies)
+    save_manifest(manifest_path, {"plies": args.plies, "files": files})
+
+    print(f"Built opening book from {tallies['games']} games → {len(book)} positions.")
+    print(f"Parsed {games} new games / {fresh_tallies['moves']} moves in {elapsed:.2f}s "
+          f"({games / elapsed if elapsed else 0:.0f} games/sec).")
     print("Saved persona/opening_book.json and persona/style.json")
 
+    # Rewritten on every build (the web app prefers it), and before the
+    # snapshot, which records its hash
+    bin_path = os.path.join(args.out, "opening_book.bin")
+    if args.binary:
+        positions, entries = write_binary_book(book, bin_path)
+        print(f"Saved persona/opening_book.bin ({positions} positions, {entries} entries).")
+    elif os.path.exists(bin_path):
+        os.remove(bin_path)
+        print("Removed stale persona/opening_book.bin")
+    print(f"Saved {write_snapshot(args.out, style, book)} (fast-loading style + book).")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,324 @@
+import argparse
+import mmap
+import os
+import time
+from array import array
+
+import chess
+import chess.engine
+
+# Endgame tables for king + one piece vs king (KQK, KRK, KPK).
+#
+# Generated offline by retrograde analysis and stored as distance-to-mate in
+# plies, one byte per position, so the engine wrapper can answer these
+# endings perfectly before any search runs. Tables are always built with the
+# strong side as White; positions where Black is the strong side are probed
+# through a colour-flipped board.
+#
+# File layout: MAGIC, then 64^3 bytes for White (strong side) to move, then
+# 64^3 bytes for Black to move, indexed by (white king, piece, black king).
+# Byte 0 means draw or illegal; n > 0 means decided in n - 1 plies (a win for
+# White to move, a loss for Black to move).
+#
+# KBNK would need 64^4 positions per side and a few hundred million move
+# edges, which is beyond what this pure-Python generator can do in memory or
+# in reasonable time, so it is not offered.
+
+MAGIC = b"RBEG1\n"
+N = 64 * 64 * 64
+TABLES = {"kqk": chess.QUEEN, "krk": chess.ROOK, "kpk": chess.PAWN}
+REQUIRES = {"kpk": ("kqk", "krk")}  # pawn promotions continue in these tables
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def index(wk, piece, bk):
+    return (wk * 64 + piece) * 64 + bk
+
+
+def piece_attacks(piece_type, square, occupied):
+    if piece_type == chess.PAWN:
+        return chess.BB_PAWN_ATTACKS[chess.WHITE][square]
+    attacks = 0
+    if piece_type in (chess.ROOK, chess.QUEEN):
+        attacks |= (chess.BB_RANK_ATTACKS[square][occupied & chess.BB_RANK_MASKS[square]]
+                    | chess.BB_FILE_ATTACKS[square][occupied & chess.BB_FILE_MASKS[square]])
+    if piece_type == chess.QUEEN:
+        attacks |= chess.BB_DIAG_ATTACKS[square][occupied & chess.BB_DIAG_MASKS[square]]
+    return attacks
+
+
+# -------------------------------
+# generation
+# -------------------------------
+def _pawn_moves(piece, occupied):
+    """(to_square, promotes) for a white pawn's pushes."""
+    out = []
+    one = piece + 8
+    if not occupied & chess.BB_SQUARES[one]:
+        out.append((one, one >= 56))
+        if piece < 16 and not occupied & chess.BB_SQUARES[piece + 16]:
+            out.append((piece + 16, False))
+    return out
+
+
+def _invert(edges_from, edges_to):
+    """CSR predecessor lists: preds[offsets[j]:offsets[j+1]] are the nodes with an edge to j."""
+    offsets = array("I", bytes(4 * (N + 1)))
+    for j in edges_to:
+        offsets[j + 1] += 1
+    for j in range(N):
+        offsets[j + 1] += offsets[j]
+    fill = array("I", offsets)
+    preds = array("I", bytes(4 * len(edges_to)))
+    for i, j in zip(edges_from, edges_to):
+        preds[fill[j]] = i
+        fill[j] += 1
+    return offsets, preds
+
+
+def generate(name, tables=None, log=print):
+    """Retrograde analysis for one table. `tables` holds already built tables
+    (EndgameTable) that pawn promotions lead into. Returns (white, black) bytearrays."""
+    piece_type = TABLES[name]
+    tables = tables or {}
+    start = time.perf_counter()
+    w_from, w_to = array("I"), array("I")  # White moves: wtm index -> btm index
+    b_from, b_to = array("I"), array("I")  # Black moves: btm index -> wtm index
+    moves_left = array("H", bytes(2 * N))  # Black's legal moves not yet known to lose
+    mates, seeds = [], []                  # btm mated positions; (plies, wtm) promotion wins
+    squares = range(8, 56) if piece_type == chess.PAWN else range(64)
+
+    for wk in range(64):
+        wk_zone = chess.BB_KING_ATTACKS[wk]
+        for piece in squares:
+            if piece == wk:
+                continue
+            for bk in range(64):
+                if bk == wk or bk == piece or wk_zone & chess.BB_SQUARES[bk]:
+                    continue
+                occupied = chess.BB_SQUARES[wk] | chess.BB_SQUARES[piece] | chess.BB_SQUARES[bk]
+                i = index(wk, piece, bk)
+                attacks = piece_attacks(piece_type, piece, occupied)
+                in_check = bool(attacks & chess.BB_SQUARES[bk])
+                bk_zone = chess.BB_KING_ATTACKS[bk]
+
+                # White to move (legal only if Black is not in check)
+                if not in_check:
+                    for to in chess.scan_forward(wk_zone & ~bk_zone & ~chess.BB_SQUARES[piece]):
+                        w_from.append(i)
+                        w_to.append(index(to, piece, bk))
+                    if piece_type == chess.PAWN:
+                        for to, promotes in _pawn_moves(piece, occupied):
+                            if not promotes:
+                                w_from.append(i)
+                                w_to.append(index(wk, to, bk))
+                                continue
+                            for promo in ("kqk", "krk"):
+                                value = tables[promo].black[index(wk, to, bk)]
+                                if value:
+                                    seeds.append((value, i))  # lost in value-1 -> win in value
+                    else:
+                        for to in chess.scan_forward(attacks & ~occupied):
+                            w_from.append(i)
+                            w_to.append(index(wk, to, bk))
+
+                # Black to move: the king steps off squares the piece would see through it
+                guarded = wk_zone | piece_attacks(piece_type, piece, occupied & ~chess.BB_SQUARES[bk])
+                count = 0
+                for to in chess.scan_forward(bk_zone & ~guarded):
+                    count += 1
+                    if to != piece:  # capturing the lone piece is a draw
+                        b_from.append(i)
+                        b_to.append(index(wk, piece, to))
+                moves_left[i] = count
+                if count == 0 and in_check:
+                    mates.append(i)
+
+    log(f"{name}: {len(w_to)} white and {len(b_to)} black moves in {time.perf_counter() - start:.1f}s")
+    w_off, w_preds = _invert(w_from, w_to)   # btm node -> white predecessors
+    b_off, b_preds = _invert(b_from, b_to)   # wtm node -> black predecessors
+    del w_from, w_to, b_from, b_to
+
+    white, black = bytearray(N), bytearray(N)
+    # Work through positions in order of distance to mate. A White win is the
+    # shortest route to a lost Black position; a Black loss is fixed once its
+    # last move is known to lose, which is also its longest.
+    w_levels, b_levels = {}, {0: mates}
+    for value, i in seeds:
+        w_levels.setdefault(value, []).append(i)
+    plies = 0
+    while plies <= 254 and (any(k >= plies for k in w_levels) or any(k >= plies for k in b_levels)):
+        for j in b_levels.pop(plies, ()):
+            if black[j]:
+                continue
+            black[j] = plies + 1
+            nxt = w_levels.setdefault(plies + 1, [])
+            for k in range(w_off[j], w_off[j + 1]):
+                if not white[w_preds[k]]:
+                    nxt.append(w_preds[k])
+        for i in w_levels.pop(plies, ()):
+            if white[i]:
+                continue
+            white[i] = plies + 1
+            nxt = b_levels.setdefault(plies + 1, [])
+            for k in range(b_off[i], b_off[i + 1]):
+                j = b_preds[k]
+                moves_left[j] -= 1
+                if moves_left[j] == 0:
+                    nxt.append(j)
+        plies += 1
+
+    wins = N - white.count(0)
+    log(f"{name}: {wins} won positions with White to move, longest mate {max(white) - 1} plies, "
+        f"{time.perf_counter() - start:.1f}s total")
+    return white, black
+
+
+def write_table(path, white, black):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(white)
+        f.write(black)
+    os.replace(tmp, path)
+
+
+# -------------------------------
+# probing
+# -------------------------------
+class EndgameTable:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(MAGIC)] != MAGIC or len(self.mm) != len(MAGIC) + 2 * N:
+            raise ValueError(f"{path} is not an endgame table")
+        self.white = memoryview(self.mm)[len(MAGIC):len(MAGIC) + N]
+        self.black = memoryview(self.mm)[len(MAGIC) + N:]
+
+
+class EndgameTables:
+    """Perfect play for positions covered by the loaded tables."""
+
+    def __init__(self, directory):
+        self.tables = {}
+        for name in TABLES:
+            path = os.path.join(directory, name + ".bin")
+            if os.path.exists(path):
+                self.tables[TABLES[name]] = EndgameTable(path)
+
+    def __len__(self):
+        return len(self.tables)
+
+    def probe(self, board):
+        """(result, plies) for the side to move: result 1 win, 0 draw, -1 loss.
+
+        None if the position is not covered.
+        """
+        if board.is_insufficient_material():
+            return 0, 0
+        if chess.popcount(board.occupied) != 3 or board.castling_rights:
+            return None
+        strong = chess.WHITE if chess.popcount(board.occupied_co[chess.WHITE]) == 2 else chess.BLACK
+        if strong == chess.BLACK:
+            board = board.mirror()
+        piece = chess.msb(board.occupied_co[chess.WHITE] & ~board.kings)
+        table = self.tables.get(board.piece_type_at(piece))
+        if table is None:
+            return None
+        i = index(board.king(chess.WHITE), piece, board.king(chess.BLACK))
+        if board.turn == chess.WHITE:
+            value = table.white[i]
+            return (1, value - 1) if value else (0, 0)
+        value = table.black[i]
+        return (-1, value - 1) if value else (0, 0)
+
+    def best_moves(self, board):
+        """All optimal moves with the side to move's (result, plies), or None."""
+        here = self.probe(board)
+        if here is None:
+            return None
+        ranked = []
+        for move in board.legal_moves:
+            board.push(move)
+            try:
+                child = self.probe(board)
+            finally:
+                board.pop()
+            if child is None:
+                return None
+            result, plies = -child[0], child[1] + 1
+            # Win fast, lose slow.
+            ranked.append(((-result, plies if result > 0 else -plies), move, (result, plies)))
+        if not ranked:
+            return None
+        ranked.sort(key=lambda r: r[0])
+        best = ranked[0][0]
+        return [move for key, move, _ in ranked if key == best], ranked[0][2]
+
+    @staticmethod
+    def score(value, turn):
+        result, plies = value
+        if result > 0:
+            return chess.engine.PovScore(chess.engine.Mate((plies + 1) // 2), turn)
+        if result < 0:
+            return chess.engine.PovScore(chess.engine.Mate(-(plies // 2)), turn)
+        return chess.engine.PovScore(chess.engine.Cp(0), turn)
+
+    def play(self, board):
+        found = self.best_moves(board)
+        if found is None:
+            return None
+        moves, value = found
+        return chess.engine.PlayResult(moves[0], None,
+                                       info={"score": self.score(value, board.turn), "tablebase": True})
+
+    def analyse(self, board, multipv=1):
+        """One line per optimal move (never a worse one, so samplers can't dawdle)."""
+        found = self.best_moves(board)
+        if found is None:
+            return None
+        moves, value = found
+        score = self.score(value, board.turn)
+        return [{"multipv": n + 1, "pv": [move], "score": score, "depth": 0, "tablebase": True}
+                for n, move in enumerate(moves[:multipv])]
+
+
+def open_endgame_tables(config, base_dir=BASE_DIR):
+    opts = config.get("endgames", {})
+    if not opts.get("enabled", True):
+        return None
+    tables = EndgameTables(os.path.join(base_dir, opts.get("dir", "data/endgames")))
+    return tables if len(tables) else None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate endgame tables by retrograde analysis.")
+    ap.add_argument("tables", nargs="*", help=f"any of {', '.join(TABLES)} (default: all)")
+    ap.add_argument("--out", default=os.path.join(BASE_DIR, "data", "endgames"))
+    args = ap.parse_args()
+
+    for name in args.tables:
+        if name not in TABLES:
+            ap.error(f"unknown table {name!r}")
+    args.tables = args.tables or list(TABLES)
+
+    os.makedirs(args.out, exist_ok=True)
+    wanted = []
+    for name in args.tables:
+        for dep in REQUIRES.get(name, ()) + (name,):
+            if dep not in wanted:
+                wanted.append(dep)
+    built = {}
+    for name in wanted:
+        path = os.path.join(args.out, name + ".bin")
+        if name not in args.tables and os.path.exists(path):
+            built[name] = EndgameTable(path)  # dependency already on disk
+            continue
+        white, black = generate(name, built)
+        write_table(path, white, black)
+        built[name] = EndgameTable(path)
+        print(f"Saved {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,23 +3,122 @@ import chess.engine
 import json
 import os
 import platform
-import random
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    from src.search import Searcher, strength_from_config
+    from src.analysis_cache import AnalysisCache, timed
+    from src.endgame import open_endgame_tables
+except ImportError:  # run as a script from src/
+    from search import Searcher, strength_from_config
+    from analysis_cache import AnalysisCache, timed
+    from endgame import open_endgame_tables
+
+
+# Anything that means "this engine process is no longer usable".
+ENGINE_FAILURES = (chess.engine.EngineError, chess.engine.EngineTerminatedError,
+                   TimeoutError, OSError)
+
+
+class EnginePool:
+    """Fixed set of pre-spawned engines handed out one search at a time.
+
+    `spawn()` returns a ready engine and `check(engine)` raises if it is dead
+    or hung. Engines that fail a check or a search are closed and replaced
+    transparently, so callers only ever see a healthy one.
+    """
+
+    def __init__(self, spawn, size=1, check=None, close=None, health_interval=30.0):
+        self.spawn = spawn
+        self.check = check
+        self.close = close
+        self.health_interval = health_interval
+        self.size = size
+        self.idle = queue.LifoQueue()  # reuse warm engines first
+        for _ in range(size):
+            self.idle.put((self._spawn_checked(), time.monotonic()))
+
+    def _spawn_checked(self):
+        engine = self.spawn()
+        if self.check:
+            self.check(engine)  # warm-up: first isready can be slow
+        return engine
+
+    def _discard(self, engine):
+        if self.close:
+            try:
+                self.close(engine)
+            except Exception:
+                pass
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        try:
+            engine, last_used = self.idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("no engine became free in time") from None
+        try:
+            if self.check and time.monotonic() - last_used > self.health_interval:
+                try:
+                    self.check(engine)
+                except ENGINE_FAILURES:
+                    self._discard(engine)
+                    engine = self._spawn_checked()
+            try:
+                yield engine
+            except ENGINE_FAILURES:
+                self._discard(engine)
+                engine = self._spawn_checked()
+                raise
+        except BaseException:
+            # Always return a slot, even if respawning failed, so the pool
+            # doesn't shrink; a stale timestamp forces a health check next time.
+            self.idle.put((engine, float("-inf")))
+            raise
+        self.idle.put((engine, time.monotonic()))
+
+    def shutdown(self):
+        while True:
+            try:
+                engine, _ = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(engine)
 
 
 class EngineWrapper:
-    def __init__(self, config_path):
-        with open(config_path, encoding="utf-8") as f:
-            self.config = json.load(f)
+    def __init__(self, config_path, config=None):
+        if config is None:
+            with open(config_path, encoding="utf-8") as f:
+                config = json.load(f)
+        self.config = config
 
         self.use_fallback = False
-        self.engine = None
+        self.timeout = float(self.config.get("engine_timeout", 10))
+        size = max(1, int(self.config.get("engine_pool_size", 1)))
+        # Engines are spawned on the first search, not here, so a server that
+        # preloads the app and then forks has no engine processes or pipes
+        # to share between workers.
+        self.pool = None
+        self._pool_lock = threading.Lock()
 
         system = platform.system().lower()
+        base_dir = os.path.dirname(os.path.abspath(config_path))
+        self.cache = self._make_cache(base_dir, system)
+        # Solved endings (KQK, KRK, KPK) are answered from tables, before any search
+        self.endgames = open_endgame_tables(self.config, base_dir)
 
-        # 🚀 RENDER / LINUX → fallback engine
+        # 🚀 RENDER / LINUX → built-in alpha-beta engine
         if system == "linux":
-            print("⚠️ Stockfish disabled on Render. Using fallback engine.")
+            print("⚠️ Stockfish disabled on Render. Using built-in search engine.")
             self.use_fallback = True
+            depth, noise = strength_from_config(self.config)
+            stable = int(self.config.get("time_management", {}).get("stable_iterations", 3))
+            self._new_pool = lambda: EnginePool(
+                lambda: Searcher(max_depth=depth, noise=noise, stable_iterations=stable), size)
             return
 
         # 💻 WINDOWS / LOCAL → Stockfish
@@ -29,13 +128,49 @@ class EngineWrapper:
                 f"Invalid engine_path in config.json: {engine_path}"
             )
 
-        self.engine = chess.engine.SimpleEngine.popen_uci(engine_path)
-        self._configure_engine()
+        self.engine_path = engine_path
+        self._new_pool = lambda: self._start_stockfish(size)
 
-    def _configure_engine(self):
-        if not self.engine:
-            return
+    def _start_stockfish(self, size):
+        pool = EnginePool(
+            self._spawn_engine, size,
+            check=lambda engine: engine.ping(),
+            close=lambda engine: engine.close(),
+            health_interval=float(self.config.get("engine_health_interval", 30)),
+        )
+        print(f"♟️ Started {size} Stockfish process(es).")
+        return pool
 
+    def warm(self):
+        """Start the engine pool now instead of on the first search."""
+        if self.pool is None:
+            with self._pool_lock:
+                if self.pool is None:
+                    self.pool = self._new_pool()
+        return self.pool
+
+    def _make_cache(self, base_dir, system):
+        opts = self.config.get("analysis_cache", {})
+        if not opts.get("enabled", True):
+            return None
+        path = opts.get("path")
+        # Results are only reusable for the same engine at the same strength.
+        options = {k: self.config.get(k) for k in ("uci_elo", "skill_level", "limit_strength")}
+        options["engine"] = "builtin" if system == "linux" else os.path.basename(str(self.config.get("engine_path")))
+        return AnalysisCache(
+            max_entries=int(opts.get("max_entries", 20000)),
+            path=os.path.join(base_dir, path) if path else None,
+            options=options,
+        )
+
+    def _spawn_engine(self):
+        # SimpleEngine raises TimeoutError when a command overruns its limit by
+        # more than `timeout`, which is how hung engines get detected.
+        engine = chess.engine.SimpleEngine.popen_uci(self.engine_path, timeout=self.timeout)
+        self._configure_engine(engine)
+        return engine
+
+    def _configure_engine(self, engine):
         options = {}
 
         if "skill_level" in self.config:
@@ -46,16 +181,55 @@ class EngineWrapper:
             options["UCI_Elo"] = int(self.config["uci_elo"])
 
         if options:
-            self.engine.configure(options)
+            engine.configure(options)
+
+    def _run(self, method, board, limit, **kwargs):
+        # Fallback searchers and UCI processes both live in the pool; each
+        # search checks one out, so concurrent games run in parallel.
+        for attempt in range(2):
+            try:
+                with self.warm().checkout(timeout=self.timeout) as engine:
+                    return getattr(engine, method)(board, limit, **kwargs)
+            except ENGINE_FAILURES:
+                # The pool has already replaced the broken engine; retry once.
+                if attempt or self.use_fallback:
+                    raise
 
     def play(self, board, limit):
-        # 🎯 Fallback: random legal move
-        if self.use_fallback:
-            moves = list(board.legal_moves)
-            return chess.engine.PlayResult(random.choice(moves), None)
+        if self.endgames is not None:
+            result = self.endgames.play(board)
+            if result is not None:
+                return result
+        if self.cache is None:
+            return self._run("play", board, limit)
+        key = self.cache.key(board, limit)
+        hit = self.cache.get(key)
+        if hit is not None:
+            result = AnalysisCache.decode_play(hit, board)
+            if result is not None:
+                return result
+        result, elapsed = timed(self._run, "play", board, limit)
+        self.cache.put(key, AnalysisCache.encode_play(result, elapsed))
+        return result
 
-        return self.engine.play(board, limit)
+    def analyse(self, board, limit, multipv=1):
+        """Top `multipv` lines as a list of info dicts (score, pv, depth)."""
+        if self.endgames is not None:
+            infos = self.endgames.analyse(board, multipv)
+            if infos is not None:
+                return infos
+        if self.cache is None:
+            return self._run("analyse", board, limit, multipv=multipv)
+        key = self.cache.key(board, limit, multipv, kind="analyse")
+        hit = self.cache.get(key)
+        if hit is not None:
+            infos = AnalysisCache.decode_analysis(hit, board)
+            if infos is not None:
+                return infos
+        infos, elapsed = timed(self._run, "analyse", board, limit, multipv=multipv)
+        self.cache.put(key, AnalysisCache.encode_analysis(infos, elapsed))
+        return infos
 
     def quit(self):
-        if self.engine:
-            self.engine.quit()
+        if self.pool is not None:
+            self.pool.shutdown()
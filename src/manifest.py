@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+
+try:
+    from src.archive import is_pgn_path
+except ImportError:  # run as a script from src/
+    from archive import is_pgn_path
+
+# Manifest of PGN files already ingested by a trainer, so reruns only parse
+# what is new. Each entry records size, mtime and a SHA-256 of the content.
+# A file that grew but whose old bytes are unchanged (the usual case for
+# all_games.pgn or an archive) is resumed from its previous size.
+
+
+def expand_pgn_paths(paths):
+    """Files as given, directories expanded to the *.pgn / *.pgn.gz files below them."""
+    out = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                out.extend(os.path.join(root, name) for name in sorted(files) if is_pgn_path(name))
+        else:
+            out.append(path)
+    return [os.path.normpath(p) for p in out]
+
+
+def file_hash(path, upto=None):
+    h = hashlib.sha256()
+    remaining = upto
+    with open(path, "rb") as f:
+        while remaining is None or remaining > 0:
+            block = f.read(1 << 20 if remaining is None else min(1 << 20, remaining))
+            if not block:
+                break
+            h.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return h.hexdigest()
+
+
+def file_entry(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime": st.st_mtime, "sha256": file_hash(path)}
+
+
+def load_manifest(path):
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"files": {}}
+
+
+def save_manifest(path, manifest):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+
+
+def plan_ingest(paths, manifest):
+    """Work out what still needs parsing.
+
+    Returns (todo, stale): todo is a list of (path, start_offset) for new or
+    appended files; stale lists already-ingested files that were rewritten or
+    are no longer given, whose old counts can't be patched in place.
+    """
+    known = manifest.get("files", {})
+    todo, stale = [], []
+    for path in paths:
+        old = known.get(path)
+        st = os.stat(path)
+        if old is None:
+            todo.append((path, 0))
+        elif st.st_size == old["size"] and st.st_mtime == old["mtime"]:
+            continue
+        elif st.st_size >= old["size"] and file_hash(path, old["size"]) == old["sha256"]:
+            if st.st_size > old["size"]:
+                todo.append((path, old["size"]))
+        else:
+            stale.append(path)
+    stale.extend(sorted(set(known) - set(paths)))
+    return todo, stale
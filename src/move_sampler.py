@@ -0,0 +1,89 @@
+import math
+import random
+
+import chess
+import chess.engine
+
+# Human-looking engine moves from a single MultiPV search.
+#
+# Instead of always playing the best line (or, for variety, a uniformly random
+# legal move), run one search for the top k lines and sample among them with a
+# softmax over their centipawn scores. The temperature comes from the persona's
+# style: a more "random" player drifts further from the best move. Forcing
+# moves get a small bonus or penalty depending on how often the persona
+# captures and checks compared with a typical player, and lines starting with
+# a move the persona played in similar positions (the position index) get a
+# bonus in proportion to how often they played it.
+
+MATE_CP = 10000            # mate scores are clamped to this many centipawns
+TYPICAL_CAPTURES = 0.20    # captures per move in ordinary club games
+TYPICAL_CHECKS = 0.05      # checks per move
+
+
+def temperature_from_style(style):
+    """Softmax temperature in centipawns; style["temperature_cp"] overrides."""
+    if "temperature_cp" in style:
+        return max(1.0, float(style["temperature_cp"]))
+    # randomness 0.2 -> 40cp: a 40cp worse line is picked 1/e as often as the best
+    return 10.0 + 150.0 * float(style.get("randomness", 0.2))
+
+
+def forcing_bonuses(style):
+    """(capture_cp, check_cp) logit bonuses from the persona's tendencies."""
+    def clamp(x):
+        return max(-25.0, min(25.0, x))
+    capture = clamp(100.0 * (float(style.get("captures_per_move", TYPICAL_CAPTURES)) - TYPICAL_CAPTURES))
+    check = clamp(200.0 * (float(style.get("checks_per_move", TYPICAL_CHECKS)) - TYPICAL_CHECKS))
+    return capture, check
+
+
+class StyleSampler:
+    def __init__(self, eng, style, limit, multipv=3, max_loss_cp=200, rng=random, prior_cp=120.0):
+        self.eng = eng
+        self.limit = limit
+        self.multipv = max(1, int(multipv))
+        self.max_loss_cp = max_loss_cp  # never pick a line this much worse than the best
+        self.rng = rng
+        self.temperature = temperature_from_style(style)
+        self.capture_bonus, self.check_bonus = forcing_bonuses(style)
+        self.prior_cp = prior_cp  # bonus for a move every similar position agrees on
+
+    def candidates(self, board, infos, prior=None):
+        """(move, weight, info) for every line worth considering.
+
+        `prior` maps moves to how much the persona played them in similar positions.
+        """
+        total = sum(prior.values()) if prior else 0
+        scored = []
+        for info in infos:
+            pv = info.get("pv")
+            if not pv or "score" not in info:
+                continue
+            cp = info["score"].relative.score(mate_score=MATE_CP)
+            move = pv[0]
+            if board.is_capture(move):
+                cp += self.capture_bonus
+            if board.gives_check(move):
+                cp += self.check_bonus
+            if total:
+                cp += self.prior_cp * prior.get(move, 0) / total
+            scored.append((move, cp, info))
+        if not scored:
+            return []
+        best = max(cp for _, cp, _ in scored)
+        return [(move, math.exp((cp - best) / self.temperature), info)
+                for move, cp, info in scored if best - cp <= self.max_loss_cp]
+
+    def play(self, board, limit=None, prior=None):
+        """One MultiPV search, then a weighted pick; returns a chess.engine.PlayResult."""
+        limit = limit or self.limit
+        infos = self.eng.analyse(board, limit, multipv=self.multipv)
+        candidates = self.candidates(board, infos, prior)
+        if not candidates:
+            return self.eng.play(board, limit)
+        move, _, info = self.rng.choices(candidates, weights=[w for _, w, _ in candidates], k=1)[0]
+        pv = info["pv"]
+        ranked = [m for m, _, _ in sorted(candidates, key=lambda c: -c[1])]
+        return chess.engine.PlayResult(move, pv[1] if len(pv) > 1 else None,
+                                       info={"score": info["score"], "multipv": info.get("multipv"),
+                                             "candidates": ranked, "similar": bool(prior) and move in prior})
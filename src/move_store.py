@@ -0,0 +1,259 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+import chess
+import chess.polyglot
+
+# Learned move statistics ("move_db"): position → {san: count}.
+#
+# Backends share one small interface so the web app and the local CLI don't
+# care where counts live:
+#   lookup(board, ply=None) -> {san: count} for the position (may be empty);
+#                              `ply` is the game's cached Ply for it, if any
+#   record(pairs)           -> queue +1 for each (board, move) pair; bulk
+#                              loads (the trainer) persist on flush()/close()
+#   record_game(game)       -> queue +1 for every mainline move of a finished game
+#   record_plies(rows)      -> the same from (zobrist, fen, san) rows recorded
+#                              while the game was played, without replaying it
+#   claim_game(game_id)     -> True only for the first caller, in any process
+#                              sharing the store, to finish that game
+#   flush() / close()
+#
+# SqliteMoveStore is the default: a WAL database keyed by Zobrist hash with
+# upsert counters. Increments are buffered in memory and written in batches by
+# a background thread, so finishing a game never blocks on disk.
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+LEGACY_JSON = os.path.join(BASE_DIR, "data", "move_db.json")
+
+
+def signed_key(zobrist):
+    """A Zobrist hash as a signed 64-bit int (SQLite INTEGER)."""
+    return zobrist - (1 << 64) if zobrist >= (1 << 63) else zobrist
+
+
+def position_key(board):
+    return signed_key(chess.polyglot.zobrist_hash(board))
+
+
+def game_moves(game):
+    board = game.board()
+    for move in game.mainline_moves():
+        yield board, move
+        board.push(move)
+
+
+class JsonMoveStore:
+    """Legacy FEN-keyed move_db.json, loaded into memory and rewritten atomically on flush."""
+
+    def __init__(self, path=LEGACY_JSON):
+        self.path = path
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.db = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.db = json.load(f)
+        self.finished = set()  # one process rewrites the file, so memory is shared enough
+
+    def lookup(self, board, ply=None):
+        return dict(self.db.get(ply.fen() if ply else board.fen(), {}))
+
+    def record(self, pairs):
+        """+1 for each (board, move) pair, in memory until flush()."""
+        self._count((board.fen(), board.san(move)) for board, move in pairs)
+
+    def record_game(self, game):
+        self.record(game_moves(game))
+        self.flush()  # legacy behaviour: the file is current after every game
+
+    def record_plies(self, rows):
+        self._count((fen, san) for _, fen, san in rows)
+        self.flush()
+
+    def claim_game(self, game_id):
+        with self.lock:
+            if game_id in self.finished:
+                return False
+            self.finished.add(game_id)
+            return True
+
+    def _count(self, pairs):
+        with self.lock:
+            for fen, san in pairs:
+                moves = self.db.setdefault(fen, {})
+                moves[san] = moves.get(san, 0) + 1
+            self.dirty = True
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.db, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self.dirty = False
+
+    def close(self):
+        self.flush()
+
+
+class SqliteMoveStore:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS moves (
+            key INTEGER NOT NULL,
+            san TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (key, san)
+        ) WITHOUT ROWID
+    """
+    # Games already recorded, so a replayed stateless token can't record one
+    # again through another worker. One short row per game.
+    FINISHED = """
+        CREATE TABLE IF NOT EXISTS finished_games (game_id TEXT PRIMARY KEY) WITHOUT ROWID
+    """
+    UPSERT = """
+        INSERT INTO moves (key, san, count) VALUES (?, ?, ?)
+        ON CONFLICT (key, san) DO UPDATE SET count = count + excluded.count
+    """
+
+    def __init__(self, path, flush_interval=2.0, compact_interval=600.0,
+                 import_legacy=LEGACY_JSON):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self.pending = {}  # key -> Counter(san) not yet written
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.closed = threading.Event()
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(self.SCHEMA)
+        conn.execute(self.FINISHED)
+        conn.commit()
+        if import_legacy and os.path.exists(import_legacy):
+            empty = conn.execute("SELECT 1 FROM moves LIMIT 1").fetchone() is None
+            if empty:
+                self._import_json(import_legacy)
+
+        self.flusher = threading.Thread(target=self._run, name="move-store-flusher", daemon=True)
+        self.flusher.start()
+        atexit.register(self.close)
+
+    def _conn(self):
+        # sqlite3 connections are per thread; WAL lets readers run during a flush.
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def _import_json(self, path):
+        with open(path, "r") as f:
+            legacy = json.load(f)
+        rows = Counter()
+        for fen, moves in legacy.items():
+            key = position_key(chess.Board(fen))
+            for san, count in moves.items():
+                rows[(key, san)] += count
+        conn = self._conn()
+        with conn:
+            conn.executemany(self.UPSERT, [(k, san, c) for (k, san), c in rows.items()])
+
+    # -------------------------------
+    # reads / writes
+    # -------------------------------
+    def lookup(self, board, ply=None):
+        key = signed_key(ply.zobrist()) if ply else position_key(board)
+        rows = self._conn().execute("SELECT san, count FROM moves WHERE key = ?", (key,))
+        moves = dict(rows.fetchall())
+        with self.lock:  # read-your-writes for counts still waiting to be flushed
+            for san, count in self.pending.get(key, {}).items():
+                moves[san] = moves.get(san, 0) + count
+        return moves
+
+    def record(self, pairs):
+        """Queue +1 for each (board, move) pair. `board` must be positioned before `move`."""
+        self._queue([(position_key(board), board.san(move)) for board, move in pairs])
+
+    def record_game(self, game):
+        self.record(game_moves(game))
+
+    def record_plies(self, rows):
+        self._queue([(signed_key(zobrist), san) for zobrist, _, san in rows])
+
+    def claim_game(self, game_id):
+        # Written at once, not batched: every worker must see the claim.
+        conn = self._conn()
+        with conn:
+            cur = conn.execute("INSERT OR IGNORE INTO finished_games (game_id) VALUES (?)", (game_id,))
+        return cur.rowcount == 1
+
+    def _queue(self, batch):
+        with self.lock:
+            for key, san in batch:
+                self.pending.setdefault(key, Counter())[san] += 1
+
+    def flush(self):
+        with self.lock:
+            batch, self.pending = self.pending, {}
+        if not batch:
+            return
+        rows = [(key, san, c) for key, moves in batch.items() for san, c in moves.items()]
+        conn = self._conn()
+        try:
+            with conn:
+                conn.executemany(self.UPSERT, rows)
+        except sqlite3.Error:
+            with self.lock:  # keep the counts for the next attempt
+                for key, san, c in rows:
+                    self.pending.setdefault(key, Counter())[san] += c
+            raise
+
+    def compact(self):
+        conn = self._conn()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("PRAGMA optimize")
+
+    def _run(self):
+        last_compact = time.monotonic()
+        while not self.closed.wait(self.flush_interval):
+            try:
+                self.flush()
+                if time.monotonic() - last_compact >= self.compact_interval:
+                    self.compact()
+                    last_compact = time.monotonic()
+            except sqlite3.Error as e:
+                print(f"⚠️ move_db flush failed: {e}")
+
+    def close(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        self.flusher.join()
+        self.flush()
+
+
+def open_move_store(config, base_dir=BASE_DIR):
+    """Build the move_db backend described by config["move_db"]."""
+    opts = config.get("move_db", {})
+    backend = opts.get("backend", "sqlite")
+    if backend == "json":
+        return JsonMoveStore(os.path.join(base_dir, opts.get("path", "data/move_db.json")))
+    if backend == "sqlite":
+        return SqliteMoveStore(
+            os.path.join(base_dir, opts.get("path", "data/move_db.sqlite")),
+            flush_interval=float(opts.get("flush_interval", 2.0)),
+            compact_interval=float(opts.get("compact_interval", 600.0)),
+        )
+    raise ValueError(f"Unknown move_db backend in config.json: {backend}")
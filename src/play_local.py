@@ -1,11 +1,11 @@
 import chess
 import chess.engine
 import chess.pgn
-import json
 import random
-import os
 from datetime import datetime
 from engine_wrapper import EngineWrapper
+from move_store import open_move_store
+from archive import open_archive
 from colorama import Fore, Style, init
 import winsound
 
@@ -51,41 +51,18 @@ def say(category):
         print(Fore.CYAN + "💬 ReallyBot:" + Style.RESET_ALL, msg)
 
 # --- Move database handling ---
-MOVE_DB_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "move_db.json")
-
-def load_move_db():
-    if os.path.exists(MOVE_DB_FILE):
-        with open(MOVE_DB_FILE, "r") as f:
-            return json.load(f)
-    return {}
-
-def save_move_db(move_db):
-    with open(MOVE_DB_FILE, "w") as f:
-        json.dump(move_db, f, indent=2)
-
 def choose_from_db(board, move_db):
-    fen = board.fen()
-    if fen in move_db:
-        moves = []
-        for move, count in move_db[fen].items():
-            moves.extend([move] * count)
-        return random.choice(moves)
+    counts = move_db.lookup(board)
+    if counts:
+        return random.choices(list(counts), weights=list(counts.values()), k=1)[0]
     return None
 
-def update_db_from_game(game, move_db):
-    board = game.board()
-    for move in game.mainline_moves():
-        move_san = board.san(move)
-        fen = board.fen()
-        move_db.setdefault(fen, {})
-        move_db[fen][move_san] = move_db[fen].get(move_san, 0) + 1
-        board.push(move)
-
 # --- Main game loop ---
 def main():
     config_path = "config.json"
     eng = EngineWrapper(config_path)
-    move_db = load_move_db()
+    move_db = open_move_store(eng.config)
+    archive = open_archive(eng.config)
 
     board = chess.Board()
     game = chess.pgn.Game()
@@ -145,22 +122,18 @@ def main():
         game.headers["White"] = "You" if user_is_white else "ReallyBot"
         game.headers["Black"] = "ReallyBot" if user_is_white else "You"
 
-        filename = f"game_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pgn"
-        with open(filename, "w", encoding="utf-8") as f:
-            try:
-                print(game, file=f)
-            except Exception as e:
-                print(Fore.RED + f"[Warning] Could not fully save PGN: {e}")
-                f.write("[Result \"*\"]\n")  # fallback header
-
-        print(Fore.YELLOW + f"\n✅ Game saved as {filename}")
+        if archive:
+            game_id = archive.submit(game)
+            print(Fore.YELLOW + f"\n✅ Game saved to {archive.directory} (id {game_id})")
 
         # --- Auto-learn ---
-        update_db_from_game(game, move_db)
-        save_move_db(move_db)
-        print(Fore.GREEN + "📚 ReallyBot has learned from this game and updated move_db.json!")
+        move_db.record_game(game)
+        print(Fore.GREEN + f"📚 ReallyBot has learned from this game and updated the move database ({move_db.path})!")
 
     finally:
+        if archive:
+            archive.close()
+        move_db.close()
         eng.quit()
 
 # --- Bot move logic ---
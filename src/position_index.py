@@ -0,0 +1,337 @@
+import argparse
+import io
+import os
+import time
+from collections import Counter, defaultdict
+
+import chess
+import chess.pgn
+
+try:
+    import numpy as np
+except ImportError:  # optional: without numpy there is no index and the bot uses the engine
+    np = None
+
+try:
+    from src.archive import read_text
+    from src.manifest import expand_pgn_paths
+except ImportError:  # run as a script from src/
+    from archive import read_text
+    from manifest import expand_pgn_paths
+
+# "What would I play here?" for positions the opening book and move_db have
+# never seen. Every position of the corpus where the persona was to move is
+# stored as a fixed-length bit vector, with the moves played from it; at
+# move time the k nearest stored positions (Hamming distance) vote for their
+# moves. Feature bits:
+#
+#     0..767     piece-square: 12 planes (colour x piece type) of 64 squares
+#     768..895   pawn structure, twice so it weighs double: per colour, files
+#                with a pawn / doubled pawns / an isolated pawn / a passed pawn
+#     896..955   material, twice: per colour, counts in unary (8 P, 2 N, 2 B,
+#                2 R, 1 Q), so the Hamming distance is the count difference
+#     956..960   side to move, castling rights
+#
+# Positions are stored column-wise as 16 uint64 words each. A lookup XORs the
+# query against every column and popcounts. Large indexes also get bit-
+# sampling LSH tables: each table keys positions by a few sampled feature
+# bits, and only positions sharing a key with the query in some table are
+# compared.
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+INDEX_FILE = "position_index.npz"
+WORDS = 16
+LSH_MIN_ROWS = 20000  # below this a full scan is already sub-millisecond
+
+PAWN_BITS, MATERIAL_BITS, EXTRA_BITS = 768, 896, 956
+MATERIAL_CAPS = ((chess.PAWN, 8), (chess.KNIGHT, 2), (chess.BISHOP, 2), (chess.ROOK, 2), (chess.QUEEN, 1))
+
+
+def _front_spans():
+    """FRONT[color][square]: squares ahead of a pawn on its own and adjacent files."""
+    spans = {chess.WHITE: [], chess.BLACK: []}
+    for sq in chess.SQUARES:
+        file, rank = chess.square_file(sq), chess.square_rank(sq)
+        files = 0
+        for f in range(max(0, file - 1), min(7, file + 1) + 1):
+            files |= chess.BB_FILES[f]
+        ahead = sum(chess.BB_RANKS[r] for r in range(rank + 1, 8))
+        behind = sum(chess.BB_RANKS[r] for r in range(rank))
+        spans[chess.WHITE].append(files & ahead)
+        spans[chess.BLACK].append(files & behind)
+    return spans
+
+
+FRONT = _front_spans()
+
+
+def pawn_structure(board, color):
+    """32 bits: files with a pawn, doubled, isolated, passed (8 each)."""
+    pawns = board.pieces_mask(chess.PAWN, color)
+    enemy = board.pieces_mask(chess.PAWN, not color)
+    has = doubled = passed = 0
+    for f in range(8):
+        on_file = pawns & chess.BB_FILES[f]
+        if on_file:
+            has |= 1 << f
+            if on_file & (on_file - 1):
+                doubled |= 1 << f
+    isolated = has & ~((has << 1) | (has >> 1))
+    for sq in chess.scan_forward(pawns):
+        if not FRONT[color][sq] & enemy:
+            passed |= 1 << chess.square_file(sq)
+    return has | doubled << 8 | isolated << 16 | passed << 24
+
+
+def material(board, color):
+    bits, shift = 0, 0
+    for piece_type, cap in MATERIAL_CAPS:
+        count = min(cap, chess.popcount(board.pieces_mask(piece_type, color)))
+        bits |= ((1 << count) - 1) << shift
+        shift += cap
+    return bits
+
+
+def features(board):
+    """The position as a 1024-bit int (layout above)."""
+    v = 0
+    for plane, (color, piece_type) in enumerate((c, p) for c in chess.COLORS for p in chess.PIECE_TYPES):
+        v |= board.pieces_mask(piece_type, color) << (64 * plane)
+    pawns = pawn_structure(board, chess.WHITE) | pawn_structure(board, chess.BLACK) << 32
+    v |= (pawns | pawns << 64) << PAWN_BITS
+    mat = material(board, chess.WHITE) | material(board, chess.BLACK) << 15
+    v |= (mat | mat << 30) << MATERIAL_BITS
+    extra = (board.turn
+             | board.has_kingside_castling_rights(chess.WHITE) << 1
+             | board.has_queenside_castling_rights(chess.WHITE) << 2
+             | board.has_kingside_castling_rights(chess.BLACK) << 3
+             | board.has_queenside_castling_rights(chess.BLACK) << 4)
+    return v | extra << EXTRA_BITS
+
+
+def encode_move(move):
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def _words(values):
+    """(WORDS, n) uint64 from a list of feature ints."""
+    raw = b"".join(v.to_bytes(WORDS * 8, "little") for v in values)
+    return np.frombuffer(raw, dtype="<u8").reshape(len(values), WORDS).T.copy()
+
+
+_LUT16 = None
+
+
+def _popcount(words):
+    if hasattr(np, "bitwise_count"):  # numpy >= 2.0
+        return np.bitwise_count(words)
+    global _LUT16
+    if _LUT16 is None:
+        _LUT16 = np.array([bin(i).count("1") for i in range(1 << 16)], dtype=np.uint8)
+    return _LUT16[words.view(np.uint16)].reshape(words.shape + (4,)).sum(axis=-1, dtype=np.uint8)
+
+
+class PositionIndex:
+    def __init__(self, arrays):
+        self.words = arrays["words"]  # (WORDS, n) uint64, one column per position
+        self.move_start = arrays["move_start"]  # moves of row r: [move_start[r], move_start[r + 1])
+        self.codes = arrays["codes"]  # encode_move() of each stored move
+        self.counts = arrays["counts"]
+        self.lsh_bits = arrays.get("lsh_bits")  # (tables, bits) sampled feature bits
+        self.lsh_keys = arrays.get("lsh_keys")  # (tables, n) keys, sorted per table
+        self.lsh_rows = arrays.get("lsh_rows")  # (tables, n) row of each sorted key
+
+    def __len__(self):
+        return self.words.shape[1]
+
+    # -------------------------------
+    # building
+    # -------------------------------
+    @classmethod
+    def build(cls, positions, tables=8, bits=14, seed=0):
+        """`positions`: {features(board): Counter(encode_move(move))}."""
+        values = list(positions)
+        arrays = {"words": _words(values)}
+        start, codes, counts = [0], [], []
+        for v in values:
+            for code, count in sorted(positions[v].items(), key=lambda mc: -mc[1]):
+                codes.append(code)
+                counts.append(count)
+            start.append(len(codes))
+        arrays["move_start"] = np.array(start, dtype=np.int32)
+        arrays["codes"] = np.array(codes, dtype=np.uint16)
+        arrays["counts"] = np.array(counts, dtype=np.uint32)
+        if len(values) >= LSH_MIN_ROWS and tables:
+            arrays.update(cls._lsh_tables(arrays["words"], tables, bits, seed))
+        return cls(arrays)
+
+    @staticmethod
+    def _lsh_tables(words, tables, bits, seed):
+        # Sample from bits that actually vary across the corpus; a bit that is
+        # nearly always 0 (a queen on a2) puts every position in one bucket.
+        n = words.shape[1]
+        freq = np.array([((words[b // 64] >> np.uint64(b % 64)) & np.uint64(1)).sum()
+                         for b in range(WORDS * 64)]) / n
+        useful = np.flatnonzero((freq >= 0.1) & (freq <= 0.9))
+        rng = np.random.default_rng(seed)
+        bits = min(bits, len(useful))
+        sampled = np.stack([rng.choice(useful, bits, replace=False) for _ in range(tables)])
+        keys = np.zeros((tables, n), dtype=np.uint32)
+        for t in range(tables):
+            for j, b in enumerate(sampled[t]):
+                bit = (words[b // 64] >> np.uint64(b % 64)) & np.uint64(1)
+                keys[t] |= bit.astype(np.uint32) << np.uint32(j)
+        rows = np.argsort(keys, axis=1, kind="stable").astype(np.int32)
+        return {"lsh_bits": sampled.astype(np.int16),
+                "lsh_keys": np.take_along_axis(keys, rows, axis=1), "lsh_rows": rows}
+
+    def save(self, path):
+        arrays = {name: getattr(self, name) for name in
+                  ("words", "move_start", "codes", "counts", "lsh_bits", "lsh_keys", "lsh_rows")
+                  if getattr(self, name) is not None}
+        tmp = path + ".tmp"  # a running server may be loading the old file
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, **arrays)  # sparse bits: ~10x smaller, and quicker to load
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls({name: data[name] for name in data.files})
+
+    # -------------------------------
+    # lookups
+    # -------------------------------
+    def candidates(self, v, k):
+        """Rows sharing an LSH bucket with feature int `v`, or None to scan everything."""
+        if self.lsh_keys is None:
+            return None
+        hit = np.zeros(len(self), dtype=bool)
+        for t, sampled in enumerate(self.lsh_bits):
+            key = 0
+            for j, b in enumerate(sampled.tolist()):
+                key |= ((v >> b) & 1) << j
+            lo, hi = np.searchsorted(self.lsh_keys[t], [key, key + 1])
+            hit[self.lsh_rows[t, lo:hi]] = True
+        rows = np.flatnonzero(hit)
+        return rows if len(rows) >= k else None
+
+    def nearest(self, board, k=16, exact=False):
+        """(rows, distances) of the `k` stored positions closest to `board`, closest first."""
+        v = features(board)
+        query = _words([v])[:, 0]
+        rows = None if exact else self.candidates(v, k)
+        if rows is None:
+            dist = self._scan(query)
+        else:
+            dist = _popcount(self.words[:, rows] ^ query[:, None]).sum(axis=0, dtype=np.uint16)
+        k = min(k, len(dist))
+        if k == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint16)
+        best = np.argpartition(dist, k - 1)[:k]
+        best = best[np.argsort(dist[best], kind="stable")]
+        return (best if rows is None else rows[best]), dist[best]
+
+    def _scan(self, query):
+        # Word by word into one buffer: no (WORDS, n) temporaries.
+        xor = np.empty(len(self), dtype=np.uint64)
+        dist = np.zeros(len(self), dtype=np.uint16)
+        for w in range(WORDS):
+            np.bitwise_xor(self.words[w], query[w], out=xor)
+            dist += _popcount(xor)
+        return dist
+
+    def moves(self, board, ply=None, k=16, max_distance=24):
+        """[(move, weight)] the persona played in the nearest positions, heaviest first.
+
+        Each neighbour within `max_distance` votes with its move counts,
+        scaled by 1 / (1 + distance); moves illegal here are dropped.
+        """
+        if not len(self):
+            return []
+        legal = {encode_move(m): m for m in (ply.legal() if ply else board.legal_moves)}
+        weights = defaultdict(float)
+        rows, dist = self.nearest(board, k)
+        for row, d in zip(rows.tolist(), dist.tolist()):
+            if d > max_distance:
+                break
+            lo, hi = self.move_start[row], self.move_start[row + 1]
+            for code, count in zip(self.codes[lo:hi].tolist(), self.counts[lo:hi].tolist()):
+                move = legal.get(code)
+                if move is not None:
+                    weights[move] += count / (1 + d)
+        return sorted(weights.items(), key=lambda mw: -mw[1])
+
+
+def open_position_index(config, directory):
+    """The index in `directory` described by config["neighbours"], or None."""
+    if np is None or not config.get("neighbours", {}).get("enabled", True):
+        return None
+    path = os.path.join(directory, INDEX_FILE)
+    if not os.path.exists(path):
+        return None
+    return PositionIndex.load(path)
+
+
+# -------------------------------
+# building from PGN
+# -------------------------------
+def corpus_player(paths):
+    """The name that appears in the most games: whose moves the persona imitates."""
+    names = Counter()
+    for path in paths:
+        stream = io.StringIO(read_text(path))
+        while (headers := chess.pgn.read_headers(stream)) is not None:
+            names.update({headers.get("White"), headers.get("Black")} - {None, "?", ""})
+    return names.most_common(1)[0][0] if names else None
+
+
+def record_game(positions, game, player=None):
+    """Add the positions `player` (None: anyone) moved from in `game` to `positions`."""
+    colors = {c for c, tag in ((chess.WHITE, "White"), (chess.BLACK, "Black"))
+              if player is None or game.headers.get(tag) == player}
+    board = game.board()
+    for move in game.mainline_moves():
+        if board.turn in colors:
+            positions[features(board)][encode_move(move)] += 1
+        board.push(move)
+
+
+def collect_positions(paths, player=None):
+    """{features: Counter(move code)} over every game in `paths`, and the game count."""
+    positions = defaultdict(Counter)
+    games = 0
+    for path in paths:
+        stream = io.StringIO(read_text(path))
+        while (game := chess.pgn.read_game(stream)) is not None:
+            record_game(positions, game, player)
+            games += 1
+    return positions, games
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build the persona's nearest-neighbour position index.")
+    ap.add_argument("--pgn", nargs="+", default=[os.path.join(BASE_DIR, "data", "all_games.pgn")],
+                    help="PGN files or directories of *.pgn files")
+    ap.add_argument("--out", default=os.path.join(BASE_DIR, "persona"))
+    ap.add_argument("--player", default=None,
+                    help="whose moves to store (default: the most frequent player; '' for everyone)")
+    ap.add_argument("--tables", type=int, default=8, help="LSH tables (0: always scan)")
+    ap.add_argument("--bits", type=int, default=14, help="sampled bits per LSH table")
+    args = ap.parse_args()
+    if np is None:
+        raise SystemExit("numpy is required to build the position index (pip install numpy).")
+
+    paths = expand_pgn_paths(args.pgn)
+    player = corpus_player(paths) if args.player is None else (args.player or None)
+    t0 = time.perf_counter()
+    positions, games = collect_positions(paths, player)
+    index = PositionIndex.build(positions, args.tables, args.bits)
+    path = os.path.join(args.out, INDEX_FILE)
+    index.save(path)
+    print(f"Indexed {len(index)} positions ({len(index.codes)} moves) of {player or 'every player'} "
+          f"from {games} games in {time.perf_counter() - t0:.1f}s → {path}")
+
+
+if __name__ == "__main__":
+    main()
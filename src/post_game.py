@@ -0,0 +1,337 @@
+import argparse
+import hashlib
+import io
+import json
+import math
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import chess
+import chess.engine
+import chess.pgn
+
+try:
+    from src.archive import read_games
+    from src.engine_wrapper import EngineWrapper
+    from src.manifest import expand_pgn_paths, file_hash, load_manifest, plan_ingest, save_manifest
+except ImportError:  # run as a script from src/
+    from archive import read_games
+    from engine_wrapper import EngineWrapper
+    from manifest import expand_pgn_paths, file_hash, load_manifest, plan_ingest, save_manifest
+
+# Post-game analysis, run offline next to the web app (never from end_game).
+#
+# Finished games are picked up from the game archive (or any PGN given), and
+# every position of each is evaluated by a full-strength engine: one engine
+# per worker process, Stockfish or the built-in searcher on Linux. Each game
+# comes out as annotated PGN (evals, ?! / ? / ?? marks, the better move for
+# mistakes, per-side accuracy) plus a one-line JSON summary.
+#
+# Evaluations go through the engine wrapper's analysis cache, so a position
+# already analysed (openings repeat, and so do games re-read after a crash)
+# costs a lookup rather than a search. The summaries file is the journal: a
+# game counts as done once its summary line is written, and a restart
+# truncates anything written after the last complete one.
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+CONFIG_PATH = os.path.join(BASE_DIR, "config.json")
+
+MATE_CP = 1000  # mate scores count as this much for centipawn loss
+# Drop in the mover's winning chances, in percentage points, that marks a move.
+MARKS = ((30, "Blunder", chess.pgn.NAG_BLUNDER),
+         (20, "Mistake", chess.pgn.NAG_MISTAKE),
+         (10, "Inaccuracy", chess.pgn.NAG_DUBIOUS_MOVE))
+
+
+def win_percent(score, color):
+    """Winning chances for `color` in 0..100 from a PovScore (the usual logistic on cp)."""
+    cp = score.pov(color).score(mate_score=MATE_CP * 10)
+    return 50 + 50 * (2 / (1 + math.exp(-0.00368208 * cp)) - 1)
+
+
+def centipawns(score, color):
+    return max(-MATE_CP, min(MATE_CP, score.pov(color).score(mate_score=MATE_CP)))
+
+
+def move_accuracy(drop):
+    """0..100 for a move that lost `drop` points of winning chances."""
+    return max(0.0, min(100.0, 103.1668 * math.exp(-0.04354 * drop) - 3.1669))
+
+
+def game_key(game):
+    """Archive id, or a content hash for games from before the archive had ids."""
+    return game.headers.get("GameId") or hashlib.sha1(str(game).encode("utf-8")).hexdigest()[:16]
+
+
+def analysis_config(config):
+    """config.json as the analysing engine should see it: full strength, one engine."""
+    config = dict(config)
+    config.pop("uci_elo", None)
+    config.pop("skill_level", None)
+    config["limit_strength"] = False
+    config["engine_pool_size"] = 1
+    return config
+
+
+class GameAnalyzer:
+    def __init__(self, config, depth=14, seconds=0.5):
+        self.eng = EngineWrapper(CONFIG_PATH, analysis_config(config))
+        # The same limit for every position keeps analysis cache keys repeating.
+        self.limit = chess.engine.Limit(depth=depth, time=seconds)
+
+    def evaluate(self, board):
+        """(score, best move, its SAN, reused?) for `board`."""
+        if board.is_checkmate():
+            return chess.engine.PovScore(chess.engine.Mate(0), board.turn), None, None, False
+        if board.is_game_over():
+            return chess.engine.PovScore(chess.engine.Cp(0), board.turn), None, None, False
+        info = self.eng.analyse(board, self.limit)[0]
+        best = info["pv"][0] if info.get("pv") else None
+        reused = bool(info.get("cached") or info.get("tablebase"))
+        return info["score"], best, board.san(best) if best else None, reused
+
+    def annotate(self, game):
+        """Evaluate every position of `game` and mark its moves in place; returns the summary."""
+        moves = list(game.mainline_moves())
+        board = game.board()
+        first = board.turn
+        evals = []
+        for i in range(len(moves) + 1):
+            if i < len(moves) and board.legal_moves.count() == 1:
+                evals.append(None)  # forced: scored from the position it leads to
+            else:
+                evals.append(self.evaluate(board))
+            if i < len(moves):
+                board.push(moves[i])
+        forced = [e is None for e in evals]
+        for i in reversed(range(len(moves))):
+            if forced[i]:
+                evals[i] = (evals[i + 1][0], None, None, True)
+
+        sides = {chess.WHITE: [], chess.BLACK: []}
+        for i, node in enumerate(game.mainline()):
+            color = first if i % 2 == 0 else not first
+            (before, best, best_san, _), after = evals[i], evals[i + 1][0]
+            drop = max(0.0, win_percent(before, color) - win_percent(after, color))
+            loss = max(0, centipawns(before, color) - centipawns(after, color))
+            label = None
+            if best is not None and best != node.move:
+                for threshold, label, nag in MARKS:
+                    if drop >= threshold:
+                        node.nags.add(nag)
+                        node.comment = f"{node.comment} {label}. {best_san} was best.".strip()
+                        break
+                else:
+                    label = None
+            if not forced[i]:
+                sides[color].append((drop, loss, label))
+            node.set_eval(after)
+
+        summary = {"plies": len(moves),
+                   "positions": len(evals) - sum(forced),
+                   "reused": sum(1 for e, f in zip(evals, forced) if not f and e[3])}
+        for key in ("White", "Black", "Result", "Persona"):
+            summary[key.lower()] = game.headers.get(key)
+        for color, name in ((chess.WHITE, "White"), (chess.BLACK, "Black")):
+            stats = side_summary(sides[color])
+            summary[name.lower() + "_stats"] = stats
+            if stats["accuracy"] is not None:
+                game.headers[f"{name}Accuracy"] = f"{stats['accuracy']:.1f}"
+        game.headers["Annotator"] = "post_game"
+        return summary
+
+
+def side_summary(moves):
+    """Accuracy, average centipawn loss and mark counts from one side's (drop, loss, mark)."""
+    stats = {"moves": len(moves), "accuracy": None, "acpl": None}
+    if moves:
+        stats["accuracy"] = round(sum(move_accuracy(d) for d, _, _ in moves) / len(moves), 1)
+        stats["acpl"] = round(sum(loss for _, loss, _ in moves) / len(moves), 1)
+    for _, label, _ in MARKS:
+        stats[label.lower()] = sum(1 for _, _, mark in moves if mark == label)
+    return stats
+
+
+# -------------------------------
+# worker processes
+# -------------------------------
+_analyzer = None
+
+
+def _start_worker(config, depth, seconds):
+    global _analyzer
+    _analyzer = GameAnalyzer(config, depth, seconds)
+
+
+def _analyse_pgn(key, text):
+    game = chess.pgn.read_game(io.StringIO(text))
+    start = time.perf_counter()
+    summary = {"game_id": key, **_analyzer.annotate(game)}
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    return str(game), summary
+
+
+# -------------------------------
+# output
+# -------------------------------
+class Journal:
+    """annotated.pgn + summaries.jsonl in `directory`."""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.pgn_path = os.path.join(directory, "annotated.pgn")
+        self.summary_path = os.path.join(directory, "summaries.jsonl")
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.done = set()
+        good = pgn_end = 0
+        if os.path.exists(self.summary_path):
+            with open(self.summary_path, "rb") as f:
+                for line in f:
+                    try:
+                        summary = json.loads(line) if line.endswith(b"\n") else None
+                    except ValueError:
+                        summary = None
+                    if summary is None:
+                        break  # torn last line from a crash
+                    good += len(line)
+                    pgn_end = summary["pgn_end"]
+                    self.done.add(summary["game_id"])
+            os.truncate(self.summary_path, good)
+        if os.path.exists(self.pgn_path) and os.path.getsize(self.pgn_path) > pgn_end:
+            os.truncate(self.pgn_path, pgn_end)  # games written without their summary
+
+    def write(self, pgn, summary):
+        summary["pgn_end"] = self._append(self.pgn_path, pgn + "\n\n")
+        self._append(self.summary_path, json.dumps(summary) + "\n")  # the game is done from here
+        self.done.add(summary["game_id"])
+
+    @staticmethod
+    def _append(path, text):
+        with open(path, "ab") as f:
+            f.write(text.encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+            return f.tell()
+
+
+class Progress:
+    def __init__(self, every=10.0):
+        self.every = every
+        self.start = self.last = time.monotonic()
+        self.games = self.positions = self.reused = 0
+
+    def add(self, summary):
+        self.games += 1
+        self.positions += summary["positions"]
+        self.reused += summary["reused"]
+        if time.monotonic() - self.last >= self.every:
+            self.last = time.monotonic()
+            print(self.line())
+
+    def line(self):
+        elapsed = max(1e-9, time.monotonic() - self.start)
+        share = self.reused / self.positions if self.positions else 0.0
+        return (f"{self.games} games, {self.positions} positions in {elapsed:.1f}s: "
+                f"{self.positions / elapsed:.1f} positions/s ({share:.0%} reused)")
+
+
+class Runner:
+    """Hands games to `workers` engine processes (or analyses inline with one)."""
+
+    def __init__(self, journal, progress, config, workers, depth, seconds):
+        self.journal = journal
+        self.progress = progress
+        self.workers = workers
+        self.pending = set()
+        if workers > 1:
+            self.pool = ProcessPoolExecutor(workers, initializer=_start_worker,
+                                            initargs=(config, depth, seconds))
+        else:
+            self.pool = None
+            _start_worker(config, depth, seconds)
+
+    def submit(self, key, text):
+        if self.pool is None:
+            self._finish(*_analyse_pgn(key, text))
+            return
+        while len(self.pending) >= self.workers * 2:
+            self.drain(FIRST_COMPLETED)
+        self.pending.add(self.pool.submit(_analyse_pgn, key, text))
+
+    def drain(self, return_when="ALL_COMPLETED"):
+        done, self.pending = wait(self.pending, return_when=return_when)
+        for future in done:
+            self._finish(*future.result())
+
+    def _finish(self, pgn, summary):
+        self.journal.write(pgn, summary)
+        self.progress.add(summary)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+
+def analyse_round(paths, journal, runner):
+    """Analyse every game in `paths` not done yet; returns how many were submitted."""
+    manifest = load_manifest(journal.manifest_path)
+    todo, stale = plan_ingest(paths, manifest)
+    # Unlike training counts, analysis is keyed per game, so rewritten files are simply re-read.
+    todo += [(path, 0) for path in stale if path in paths]
+    files = dict(manifest.get("files", {}))
+    submitted = 0
+    for path, start in todo:
+        st = os.stat(path)
+        try:
+            games = list(read_games(path, start, st.st_size))
+        except (EOFError, OSError) as e:
+            print(f"Skipping {path} for now: {e}")  # e.g. a gzip member still being written
+            continue
+        for game in games:
+            key = game_key(game)
+            if key not in journal.done:
+                runner.submit(key, str(game))
+                submitted += 1
+        files[path] = {"size": st.st_size, "mtime": st.st_mtime, "sha256": file_hash(path, st.st_size)}
+    runner.drain()
+    save_manifest(journal.manifest_path, {"files": files})
+    return submitted
+
+
+def main():
+    with open(CONFIG_PATH, encoding="utf-8") as f:
+        config = json.load(f)
+    opts = config.get("post_game_analysis", {})
+    archive_dir = os.path.join(BASE_DIR, config.get("archive", {}).get("dir", "data/archive"))
+
+    ap = argparse.ArgumentParser(description="Annotate finished games with engine analysis.")
+    ap.add_argument("pgn", nargs="*", default=[archive_dir], help="PGN files or directories")
+    ap.add_argument("--out", default=os.path.join(BASE_DIR, opts.get("dir", "data/analysis")))
+    ap.add_argument("--workers", type=int, default=int(opts.get("workers", 2)))
+    ap.add_argument("--depth", type=int, default=int(opts.get("depth", 14)))
+    ap.add_argument("--time", type=float, default=float(opts.get("time", 0.5)), help="seconds per position")
+    ap.add_argument("--watch", action="store_true", help="keep picking up newly finished games")
+    ap.add_argument("--interval", type=float, default=float(opts.get("poll_interval", 30)))
+    args = ap.parse_args()
+
+    journal = Journal(args.out)
+    progress = Progress()
+    runner = Runner(journal, progress, config, max(1, args.workers), args.depth, args.time)
+    print(f"{len(journal.done)} games already analysed in {args.out}.")
+    try:
+        while True:
+            paths = [p for p in expand_pgn_paths(args.pgn) if os.path.isfile(p)]
+            if analyse_round(paths, journal, runner) or not args.watch:
+                print(progress.line())
+            if not args.watch:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print(f"Interrupted; rerun to resume. {progress.line()}")
+    finally:
+        runner.close()
+
+
+if __name__ == "__main__":
+    main()
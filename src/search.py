@@ -0,0 +1,590 @@
+import chess
+import chess.engine
+import random
+import time
+
+# In-process alpha-beta engine used when no UCI binary is available (Linux/Render).
+# Iterative deepening negamax with a Zobrist-keyed transposition table,
+# MVV-LVA / killer / history move ordering, null-move pruning, quiescence
+# search and a tapered piece-square evaluation.
+
+MATE = 100000
+MATE_BOUND = MATE - 1000
+INF = MATE + 1
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+PIECE_VALUES = [0, 100, 320, 330, 500, 900, 0]
+
+# Piece-square tables from White's point of view, a8 first (so index with sq ^ 56).
+# Values are the "simplified evaluation function" tables; the king gets a
+# separate endgame table and is tapered by game phase.
+PST = {
+    chess.PAWN: [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5, 5, 10, 25, 25, 10, 5, 5,
+        0, 0, 0, 20, 20, 0, 0, 0,
+        5, -5, -10, 0, 0, -10, -5, 5,
+        5, 10, 10, -20, -20, 10, 10, 5,
+        0, 0, 0, 0, 0, 0, 0, 0,
+    ],
+    chess.KNIGHT: [
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20, 0, 0, 0, 0, -20, -40,
+        -30, 0, 10, 15, 15, 10, 0, -30,
+        -30, 5, 15, 20, 20, 15, 5, -30,
+        -30, 0, 15, 20, 20, 15, 0, -30,
+        -30, 5, 10, 15, 15, 10, 5, -30,
+        -40, -20, 0, 5, 5, 0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50,
+    ],
+    chess.BISHOP: [
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 10, 10, 5, 0, -10,
+        -10, 5, 5, 10, 10, 5, 5, -10,
+        -10, 0, 10, 10, 10, 10, 0, -10,
+        -10, 10, 10, 10, 10, 10, 10, -10,
+        -10, 5, 0, 0, 0, 0, 5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20,
+    ],
+    chess.ROOK: [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 10, 10, 10, 10, 10, 10, 5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        0, 0, 0, 5, 5, 0, 0, 0,
+    ],
+    chess.QUEEN: [
+        -20, -10, -10, -5, -5, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 5, 5, 5, 0, -10,
+        -5, 0, 5, 5, 5, 5, 0, -5,
+        0, 0, 5, 5, 5, 5, 0, -5,
+        -10, 5, 5, 5, 5, 5, 0, -10,
+        -10, 0, 5, 0, 0, 0, 0, -10,
+        -20, -10, -10, -5, -5, -10, -10, -20,
+    ],
+    chess.KING: [
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20, 20, 0, 0, 0, 0, 20, 20,
+        20, 30, 10, 0, 0, 10, 30, 20,
+    ],
+}
+
+KING_ENDGAME = [
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10, 0, 0, -10, -20, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -30, 0, 0, 0, 0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50,
+]
+
+PHASE_WEIGHTS = [0, 0, 1, 1, 2, 4, 0]
+MAX_PHASE = 24
+
+
+def _square_tables():
+    # TABLES[color][piece_type][square] = material + PST, from that colour's side
+    tables = {}
+    for color in (chess.WHITE, chess.BLACK):
+        tables[color] = {}
+        for pt, pst in PST.items():
+            if color == chess.WHITE:
+                row = [PIECE_VALUES[pt] + pst[sq ^ 56] for sq in chess.SQUARES]
+            else:
+                row = [PIECE_VALUES[pt] + pst[sq] for sq in chess.SQUARES]
+            tables[color][pt] = row
+        tables[color]["king_eg"] = [
+            KING_ENDGAME[sq ^ 56] if color == chess.WHITE else KING_ENDGAME[sq]
+            for sq in chess.SQUARES
+        ]
+    return tables
+
+
+TABLES = _square_tables()
+
+
+def evaluate(board):
+    """Static evaluation in centipawns from the side to move's point of view."""
+    score = 0
+    phase = 0
+    king_mg = king_eg = 0
+    for color in (chess.WHITE, chess.BLACK):
+        sign = 1 if color == chess.WHITE else -1
+        own = board.occupied_co[color]
+        tables = TABLES[color]
+        side = 0
+        for pt, bb in ((chess.PAWN, board.pawns), (chess.KNIGHT, board.knights),
+                       (chess.BISHOP, board.bishops), (chess.ROOK, board.rooks),
+                       (chess.QUEEN, board.queens)):
+            row = tables[pt]
+            for sq in chess.scan_forward(bb & own):
+                side += row[sq]
+                phase += PHASE_WEIGHTS[pt]
+        if chess.popcount(board.bishops & own) >= 2:
+            side += 30
+        score += sign * side
+        ksq = chess.msb(board.kings & own)
+        king_mg += sign * tables[chess.KING][ksq]
+        king_eg += sign * tables["king_eg"][ksq]
+    phase = min(phase, MAX_PHASE)
+    score += (king_mg * phase + king_eg * (MAX_PHASE - phase)) // MAX_PHASE
+    return score if board.turn == chess.WHITE else -score
+
+
+# -------------------------------
+# Zobrist keys
+# -------------------------------
+_rng = random.Random(0x5EED)
+PIECE_KEYS = [[_rng.getrandbits(64) for _ in chess.SQUARES] for _ in range(12)]
+CASTLE_KEYS = {sq: _rng.getrandbits(64) for sq in (chess.A1, chess.H1, chess.A8, chess.H8)}
+EP_KEYS = [_rng.getrandbits(64) for _ in range(8)]
+TURN_KEY = _rng.getrandbits(64)
+
+
+def _piece_index(piece_type, color):
+    return piece_type - 1 + (0 if color else 6)
+
+
+def piece_key(board):
+    key = 0
+    for sq, piece in board.piece_map().items():
+        key ^= PIECE_KEYS[_piece_index(piece.piece_type, piece.color)][sq]
+    return key
+
+
+def state_key(board):
+    key = TURN_KEY if board.turn == chess.BLACK else 0
+    rights = board.castling_rights
+    if rights:
+        for sq in chess.scan_forward(rights):
+            key ^= CASTLE_KEYS.get(sq, 0)
+    if board.ep_square is not None:
+        key ^= EP_KEYS[chess.square_file(board.ep_square)]
+    return key
+
+
+def piece_delta(board, move):
+    """XOR to apply to the piece part of the key when `move` is pushed."""
+    color = board.turn
+    frm, to = move.from_square, move.to_square
+    pt = board.piece_type_at(frm)
+    idx = _piece_index(pt, color)
+    delta = PIECE_KEYS[idx][frm]
+    if pt == chess.KING and board.is_castling(move):
+        rank = chess.square_rank(frm)
+        rook = PIECE_KEYS[_piece_index(chess.ROOK, color)]
+        if board.is_kingside_castling(move):
+            king_to, rook_from, rook_to = chess.square(6, rank), chess.square(7, rank), chess.square(5, rank)
+        else:
+            king_to, rook_from, rook_to = chess.square(2, rank), chess.square(0, rank), chess.square(3, rank)
+        return delta ^ PIECE_KEYS[idx][king_to] ^ rook[rook_from] ^ rook[rook_to]
+    if move.promotion:
+        delta ^= PIECE_KEYS[_piece_index(move.promotion, color)][to]
+    else:
+        delta ^= PIECE_KEYS[idx][to]
+    captured = board.piece_type_at(to)
+    if captured:
+        delta ^= PIECE_KEYS[_piece_index(captured, not color)][to]
+    elif pt == chess.PAWN and to == board.ep_square:
+        cap_sq = to - 8 if color == chess.WHITE else to + 8
+        delta ^= PIECE_KEYS[_piece_index(chess.PAWN, not color)][cap_sq]
+    return delta
+
+
+# -------------------------------
+# strength settings
+# -------------------------------
+def strength_from_config(config):
+    """Map uci_elo / skill_level from config.json to a depth cap and eval noise (cp)."""
+    if config.get("limit_strength", True) and "uci_elo" in config:
+        elo = int(config["uci_elo"])
+        depth = max(1, min(64, 1 + (elo - 800) // 250))
+        noise = max(0, (2400 - elo) // 10)
+        return depth, noise
+    if "skill_level" in config:
+        skill = max(0, min(20, int(config["skill_level"])))
+        return 1 + skill // 2, (20 - skill) * 8
+    return 64, 0
+
+
+class _Timeout(Exception):
+    pass
+
+
+class Searcher:
+    def __init__(self, max_depth=64, noise=0, tt_size=1 << 18, seed=None, stable_iterations=0):
+        self.max_depth = max_depth
+        self.noise = noise
+        # Stop a timed search once the best move has survived this many
+        # deeper iterations (0: always use the whole budget).
+        self.stable_iterations = stable_iterations
+        self.tt_size = tt_size
+        self.tt = {}
+        self.rng = random.Random(seed)
+        self.nodes = 0
+
+    # -------------------------------
+    # public API
+    # -------------------------------
+    def play(self, board, limit):
+        """Search `board` within a chess.engine.Limit and return a PlayResult."""
+        lines, depth, board = self._search(board, limit, 1)
+        score, best = lines[0]
+        ponder = self._ponder_move(board, best) if depth else None
+        info = {
+            "depth": depth,
+            "nodes": self.nodes,
+            "score": chess.engine.PovScore(self._to_score(score), board.turn),
+        }
+        return chess.engine.PlayResult(best, ponder, info=info)
+
+    def analyse(self, board, limit, multipv=1):
+        """Top `multipv` root moves, best first, as chess.engine-style info dicts."""
+        lines, depth, board = self._search(board, limit, multipv)
+        return [{
+            "multipv": i + 1,
+            "depth": depth,
+            "nodes": self.nodes,
+            "score": chess.engine.PovScore(self._to_score(score), board.turn),
+            "pv": self._pv(board, move),
+        } for i, (score, move) in enumerate(lines)]
+
+    def _search(self, board, limit, multipv):
+        moves = list(board.legal_moves)
+        if not moves:
+            raise chess.engine.EngineError("no legal moves in position")
+        self.nodes = 0
+        if len(moves) == 1:
+            return [(0, moves[0])], 0, board
+
+        board = board.copy(stack=True)
+        budget = self._time_budget(board, limit)
+        self.deadline = time.monotonic() + budget if budget is not None else None
+        self.node_limit = limit.nodes if limit and limit.nodes else None
+        depth_limit = min(self.max_depth, limit.depth) if limit and limit.depth else self.max_depth
+        self.killers = [[None, None] for _ in range(128)]
+        self.history = {}
+        self.noise_seed = self.rng.getrandbits(64)
+        if self.noise or len(self.tt) > self.tt_size:
+            self.tt.clear()  # noisy evals are only consistent within one search
+        self.path = self._game_history(board)
+        self.multipv = max(1, min(multipv, len(moves)))
+
+        lines, depth = [(0, moves[0])], 0
+        self.root_order = None
+        stable = 0
+        pkey = piece_key(board)
+        for d in range(1, depth_limit + 1):
+            self.enforce_limits = d > 1  # always finish depth 1 so we have a real move
+            self.partial = None
+            try:
+                scored = self._root(board, d, pkey)
+            except _Timeout:
+                # The previous best is searched first, so anything that beat it
+                # in the unfinished iteration is still an improvement. Scores
+                # from different depths don't mix, so MultiPV keeps the last
+                # complete iteration.
+                if self.partial is not None and self.multipv == 1:
+                    lines = [self.partial]
+                break
+            stable = stable + 1 if depth and scored[0][1] == lines[0][1] else 0
+            lines, depth = scored[:self.multipv], d
+            self.root_order = [move for _, move in scored]
+            if abs(lines[0][0]) >= MATE_BOUND:
+                break
+            if not self.deadline:
+                continue
+            # Don't start an iteration we are unlikely to finish.
+            remaining = self.deadline - time.monotonic()
+            if remaining < budget * 0.5:
+                break
+            # A best move that keeps surviving deeper searches is unlikely to
+            # change; bank the rest of the budget once a quarter is spent.
+            if self.stable_iterations and stable >= self.stable_iterations and d >= 4 \
+                    and remaining < budget * 0.75:
+                break
+        return lines[:self.multipv], depth, board
+
+    # -------------------------------
+    # search
+    # -------------------------------
+    def _time_budget(self, board, limit):
+        if limit is None:
+            return None
+        if limit.time is not None:
+            return float(limit.time)
+        clock = limit.white_clock if board.turn == chess.WHITE else limit.black_clock
+        if clock is not None:
+            inc = (limit.white_inc if board.turn == chess.WHITE else limit.black_inc) or 0
+            return max(0.05, clock / 30 + inc / 2)
+        return None
+
+    def _game_history(self, board):
+        # Keys of earlier positions since the last irreversible move, for repetition detection.
+        keys = []
+        probe = board.copy(stack=True)
+        for _ in range(min(board.halfmove_clock, len(probe.move_stack))):
+            probe.pop()
+            keys.append(piece_key(probe) ^ state_key(probe))
+        keys.reverse()
+        return keys
+
+    def _check_limits(self):
+        if not self.enforce_limits:
+            return
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise _Timeout
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise _Timeout
+
+    def _root(self, board, depth, pkey):
+        """Score every root move; the best `multipv` scores are exact."""
+        key = pkey ^ state_key(board)
+        if self.root_order is not None:
+            moves = self.root_order  # best-first from the previous iteration
+        else:
+            moves = self._ordered(board, list(board.legal_moves), key, 0)
+        scored = []
+        bound = -INF  # score the k-th best line has to beat
+        for move in moves:
+            delta = piece_delta(board, move)
+            board.push(move)
+            self.path.append(key)
+            try:
+                if bound == -INF:
+                    score = -self._negamax(board, depth - 1, -INF, INF, 1, pkey ^ delta)
+                else:
+                    # Null-window test first; only re-search moves that enter the top k.
+                    score = -self._negamax(board, depth - 1, -bound - 1, -bound, 1, pkey ^ delta)
+                    if score > bound:
+                        score = -self._negamax(board, depth - 1, -INF, -bound, 1, pkey ^ delta)
+            finally:
+                board.pop()
+                self.path.pop()
+            if scored and score > scored[0][0]:
+                self.partial = (score, move)
+            scored.append((score, move))
+            scored.sort(key=lambda x: x[0], reverse=True)
+            if len(scored) >= self.multipv:
+                bound = scored[self.multipv - 1][0]
+        self._store(key, depth, scored[0][0], EXACT, scored[0][1])
+        return scored
+
+    def _negamax(self, board, depth, alpha, beta, ply, pkey):
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self._check_limits()
+
+        key = pkey ^ state_key(board)
+        clock = board.halfmove_clock
+        if clock >= 100 or (clock >= 4 and key in self.path[-clock:]):
+            return 0
+
+        in_check = board.is_check()
+        if in_check:
+            depth += 1
+        if depth <= 0:
+            return self._quiesce(board, alpha, beta, ply, 0)
+
+        alpha_orig = alpha
+        entry = self.tt.get(key)
+        tt_move = None
+        if entry is not None:
+            e_depth, e_flag, e_score, tt_move = entry
+            if e_depth >= depth:
+                e_score = self._score_from_tt(e_score, ply)
+                if e_flag == EXACT:
+                    return e_score
+                if e_flag == LOWER and e_score >= beta:
+                    return e_score
+                if e_flag == UPPER and e_score <= alpha:
+                    return e_score
+
+        # Null-move pruning: skip a move and see if we still beat beta.
+        if (depth >= 3 and not in_check and beta < MATE_BOUND
+                and board.occupied_co[board.turn] & ~(board.pawns | board.kings)):
+            board.push(chess.Move.null())
+            self.path.append(key)
+            try:
+                score = -self._negamax(board, depth - 3, -beta, -beta + 1, ply + 1, pkey)
+            finally:
+                board.pop()
+                self.path.pop()
+            if score >= beta:
+                return beta
+
+        moves = list(board.legal_moves)
+        if not moves:
+            return -MATE + ply if in_check else 0
+
+        best_score, best_move = -INF, None
+        for i, move in enumerate(self._ordered(board, moves, key, ply, tt_move)):
+            quiet = not board.is_capture(move) and not move.promotion
+            delta = piece_delta(board, move)
+            board.push(move)
+            self.path.append(key)
+            try:
+                if i == 0:
+                    score = -self._negamax(board, depth - 1, -beta, -alpha, ply + 1, pkey ^ delta)
+                else:
+                    # Principal variation search: prove later moves are worse with a null window.
+                    score = -self._negamax(board, depth - 1, -alpha - 1, -alpha, ply + 1, pkey ^ delta)
+                    if alpha < score < beta:
+                        score = -self._negamax(board, depth - 1, -beta, -alpha, ply + 1, pkey ^ delta)
+            finally:
+                board.pop()
+                self.path.pop()
+            if score > best_score:
+                best_score, best_move = score, move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                if quiet:
+                    killers = self.killers[min(ply, 127)]
+                    if killers[0] != move:
+                        killers[1], killers[0] = killers[0], move
+                    hkey = (board.turn, move.from_square, move.to_square)
+                    self.history[hkey] = self.history.get(hkey, 0) + depth * depth
+                break
+
+        if best_score <= alpha_orig:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self._store(key, depth, self._score_to_tt(best_score, ply), flag, best_move)
+        return best_score
+
+    def _quiesce(self, board, alpha, beta, ply, qdepth):
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self._check_limits()
+
+        in_check = board.is_check()
+        if in_check and qdepth < 4:
+            moves = list(board.legal_moves)
+            if not moves:
+                return -MATE + ply
+        else:
+            stand_pat = self._evaluate(board)
+            if stand_pat >= beta:
+                return stand_pat
+            if stand_pat > alpha:
+                alpha = stand_pat
+            moves = list(board.generate_legal_captures())
+
+        for move in self._ordered(board, moves, None, ply):
+            board.push(move)
+            try:
+                score = -self._quiesce(board, -beta, -alpha, ply + 1, qdepth + 1)
+            finally:
+                board.pop()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def _evaluate(self, board):
+        score = evaluate(board)
+        if self.noise:
+            # Deterministic per position within one search so the TT stays consistent.
+            h = (hash(board._transposition_key()) ^ self.noise_seed) * 0x9E3779B97F4A7C15
+            score += (h >> 32) % (2 * self.noise + 1) - self.noise
+        return score
+
+    # -------------------------------
+    # move ordering
+    # -------------------------------
+    def _ordered(self, board, moves, key, ply, tt_move=None):
+        if tt_move is None and key is not None:
+            entry = self.tt.get(key)
+            if entry is not None:
+                tt_move = entry[3]
+        killers = self.killers[min(ply, 127)]
+        turn = board.turn
+
+        def rank(move):
+            if move == tt_move:
+                return 1 << 30
+            victim = board.piece_type_at(move.to_square)
+            if victim or move.promotion:
+                attacker = board.piece_type_at(move.from_square)
+                gain = PIECE_VALUES[victim or 0] + (PIECE_VALUES[move.promotion] if move.promotion else 0)
+                return (1 << 20) + gain * 10 - PIECE_VALUES[attacker]
+            if board.is_en_passant(move):
+                return (1 << 20) + 900
+            if move == killers[0]:
+                return (1 << 19) + 1
+            if move == killers[1]:
+                return 1 << 19
+            return self.history.get((turn, move.from_square, move.to_square), 0)
+
+        return sorted(moves, key=rank, reverse=True)
+
+    # -------------------------------
+    # transposition table helpers
+    # -------------------------------
+    def _store(self, key, depth, score, flag, move):
+        old = self.tt.get(key)
+        if old is None or old[0] <= depth:
+            self.tt[key] = (depth, flag, score, move)
+
+    @staticmethod
+    def _score_to_tt(score, ply):
+        if score >= MATE_BOUND:
+            return score + ply
+        if score <= -MATE_BOUND:
+            return score - ply
+        return score
+
+    @staticmethod
+    def _score_from_tt(score, ply):
+        if score >= MATE_BOUND:
+            return score - ply
+        if score <= -MATE_BOUND:
+            return score + ply
+        return score
+
+    def _pv(self, board, move, max_len=8):
+        pv = [move]
+        probe = board.copy(stack=False)
+        probe.push(move)
+        seen = set()
+        while len(pv) < max_len:
+            key = piece_key(probe) ^ state_key(probe)
+            entry = self.tt.get(key)
+            if key in seen or entry is None or entry[3] is None or not probe.is_legal(entry[3]):
+                break
+            seen.add(key)
+            pv.append(entry[3])
+            probe.push(entry[3])
+        return pv
+
+    def _ponder_move(self, board, best):
+        pv = self._pv(board, best, max_len=2)
+        return pv[1] if len(pv) > 1 else None
+
+    @staticmethod
+    def _to_score(score):
+        if score >= MATE_BOUND:
+            return chess.engine.Mate((MATE - score + 1) // 2)
+        if score <= -MATE_BOUND:
+            return chess.engine.Mate(-((MATE + score) // 2))
+        return chess.engine.Cp(score)
@@ -0,0 +1,68 @@
+import hashlib
+import marshal
+import os
+
+# Persona snapshot: style and the FEN opening book in one marshal file.
+#
+# The web app used to parse style.json and opening_book.json and then rebuild
+# the book's cumulative weights on every start. build_persona.py now writes
+# the finished in-memory form as well, and loading it is a single
+# marshal.load. The JSON files stay the source of truth: the snapshot records
+# their hashes and is ignored once either changes (say, after hand-editing
+# style.json). Hashes rather than mtimes, so a fresh checkout still uses it.
+# opening_book.bin is hashed too: it is derived from opening_book.json and is
+# only trusted while a current snapshot vouches they came from one build.
+
+FORMAT = 2
+SNAPSHOT = "persona.marshal"
+SOURCES = ("style.json", "opening_book.json", "opening_book.bin")
+
+
+def book_positions(book):
+    """{fen: (sans, cumulative counts)} from the opening_book.json layout."""
+    positions = {}
+    for fen, moves in book.items():
+        if moves:
+            sans, cum, total = [], [], 0
+            for m in moves:
+                total += m["count"]
+                sans.append(m["san"])
+                cum.append(total)
+            positions[fen] = (tuple(sans), tuple(cum))
+    return positions
+
+
+def source_hashes(directory):
+    hashes = {}
+    for name in SOURCES:
+        try:
+            with open(os.path.join(directory, name), "rb") as f:
+                hashes[name] = hashlib.sha1(f.read()).hexdigest()
+        except OSError:
+            hashes[name] = None
+    return hashes
+
+
+def write_snapshot(directory, style, book):
+    """Call after style.json, opening_book.json and opening_book.bin are written."""
+    path = os.path.join(directory, SNAPSHOT)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        marshal.dump({"format": FORMAT, "sources": source_hashes(directory),
+                      "style": style, "positions": book_positions(book)}, f)
+    os.replace(tmp, path)
+    return path
+
+
+def load_snapshot(directory):
+    """The snapshot dict ("style", "positions"), or None if missing or stale."""
+    try:
+        with open(os.path.join(directory, SNAPSHOT), "rb") as f:
+            data = marshal.loads(f.read())  # much faster than marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(data, dict) or data.get("format") != FORMAT:
+        return None
+    if data.get("sources") != source_hashes(directory):
+        return None
+    return data
@@ -0,0 +1,180 @@
+import collections
+import threading
+import time
+
+import chess
+import chess.engine
+
+# Per-move time allocation for the bot.
+#
+# A fixed time_limit spends as long on a forced recapture as on a sharp
+# middlegame. The allocation starts from config["think_time"] and is scaled
+# by what the position looks like: how many legal moves there are, whether
+# captures and checks are available, how long since the game left the book
+# and whether the material balance has already decided things. The result is
+# then capped by two budgets: one per game (so a long game can't run away)
+# and one per process (so a burst of games shares the engines instead of each
+# one taking its full slice).
+#
+# The built-in searcher additionally stops early once its best move has been
+# stable for a few iterations (see Searcher.stable_iterations).
+
+QUANTUM = 0.05  # allocations are rounded to this so analysis cache keys still repeat
+PIECE_VALUES = {chess.PAWN: 1, chess.KNIGHT: 3, chess.BISHOP: 3, chess.ROOK: 5, chess.QUEEN: 9}
+
+
+def material_balance(board):
+    """Material for the side to move minus the opponent's, in pawns."""
+    total = 0
+    for piece_type, value in PIECE_VALUES.items():
+        total += value * (len(board.pieces(piece_type, board.turn))
+                          - len(board.pieces(piece_type, not board.turn)))
+    return total
+
+
+def last_move_captured(board):
+    if not board.move_stack:
+        return None
+    last = board.pop()
+    try:
+        return last if board.is_capture(last) else None
+    finally:
+        board.push(last)
+
+
+def position_features(board):
+    moves = list(board.legal_moves)
+    captured_on = last_move_captured(board)
+    return {
+        "legal": len(moves),
+        "in_check": board.is_check(),
+        "captures": sum(1 for m in moves if board.is_capture(m)),
+        "checks": sum(1 for m in moves if board.gives_check(m)),
+        "recapture": captured_on is not None and any(
+            m.to_square == captured_on.to_square and board.is_capture(m) for m in moves),
+        "material": material_balance(board),
+    }
+
+
+def complexity(features, plies_out_of_book=None):
+    """Multiplier on the base think time; 1.0 is an ordinary position."""
+    legal = features["legal"]
+    if legal <= 1:
+        return 0.0
+    if features["in_check"] and legal <= 3:
+        return 0.25  # a forced reply: one of a handful of king moves or blocks
+    factor = min(1.5, max(0.5, (legal / 30) ** 0.5))
+    factor *= 1 + 0.05 * min(features["captures"] + features["checks"], 8)
+    if features["recapture"] and features["captures"] <= 2:
+        factor *= 0.5  # taking back is nearly always right and quick to confirm
+    if plies_out_of_book is not None and plies_out_of_book < 4:
+        factor *= 1.3  # first moves out of book set the course of the middlegame
+    if abs(features["material"]) >= 6:
+        factor *= 0.6  # the game is decided either way
+    return factor
+
+
+class ProcessBudget:
+    """Engine seconds per wall second this process may spend across all games.
+
+    Tracks a sliding window of recent spend; as usage approaches the rate,
+    `factor()` shrinks new allocations instead of letting searches queue up.
+    """
+
+    def __init__(self, rate, window=10.0):
+        self.rate = rate
+        self.window = window
+        self.spent = collections.deque()  # (timestamp, seconds)
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+    def _trim(self, now):
+        while self.spent and self.spent[0][0] < now - self.window:
+            self.total -= self.spent.popleft()[1]
+
+    def spend(self, seconds):
+        now = time.monotonic()
+        with self.lock:
+            self.spent.append((now, seconds))
+            self.total += seconds
+            self._trim(now)
+
+    def pressure(self):
+        with self.lock:
+            self._trim(time.monotonic())
+            return max(0.0, self.total) / (self.rate * self.window)
+
+    def factor(self):
+        # Full allocations up to half the budget, then down to a quarter at 100%+.
+        return max(0.25, min(1.0, 1.5 - self.pressure()))
+
+
+class GameClock:
+    """Engine time one game may still use; spread over the moves likely left."""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.used = 0.0
+
+    def share(self, ply):
+        if self.budget is None:
+            return None
+        moves_left = max(10, 40 - ply // 4)
+        return max(0.0, self.budget - self.used) / moves_left * 2  # up to twice an even share
+
+    def spend(self, seconds):
+        self.used += seconds
+
+
+class TimeManager:
+    def __init__(self, config, process_budget=None):
+        opts = config.get("time_management", {})
+        self.enabled = opts.get("enabled", True)
+        self.fixed = float(config["time_limit"])
+        self.base = float(config.get("think_time", self.fixed))
+        self.min_time = float(opts.get("min_time", 0.05))
+        self.max_time = float(opts.get("max_time", max(self.fixed, self.base)))
+        self.game_budget = opts.get("game_budget", 60)
+        self.process = process_budget
+
+    def clock(self):
+        return GameClock(float(self.game_budget) if self.game_budget else None)
+
+    def allocate(self, board, clock=None, plies_out_of_book=None, scale=1.0):
+        """Seconds to search `board` for; `scale` comes from the caller's load shedding."""
+        if not self.enabled:
+            return max(self.min_time, self.fixed * scale)
+        seconds = self.base * scale * complexity(position_features(board), plies_out_of_book)
+        if self.process is not None:
+            seconds *= self.process.factor()
+        if clock is not None:
+            share = clock.share(len(board.move_stack))
+            if share is not None:
+                seconds = min(seconds, share)
+        seconds = round(seconds / QUANTUM) * QUANTUM
+        return round(min(self.max_time, max(self.min_time, seconds)), 3)
+
+    def limit(self, board, clock=None, plies_out_of_book=None, scale=1.0):
+        return chess.engine.Limit(time=self.allocate(board, clock, plies_out_of_book, scale))
+
+    def spend(self, seconds, clock=None):
+        if clock is not None:
+            clock.spend(seconds)
+        if self.process is not None:
+            self.process.spend(seconds)
+
+
+_process_budget = None
+_process_lock = threading.Lock()
+
+
+def process_budget(config):
+    """The per-process budget, sized from config; shared by every TimeManager."""
+    global _process_budget
+    if _process_budget is None:
+        with _process_lock:
+            if _process_budget is None:
+                opts = config.get("time_management", {})
+                rate = opts.get("process_rate", config.get("engine_pool_size", 1))
+                _process_budget = ProcessBudget(float(rate), float(opts.get("window", 10.0)))
+    return _process_budget
@@ -1,33 +1,54 @@
-import os
-import chess.pgn
+import argparse
 import json
-from collections import defaultdict
+import os
+
+from archive import read_games
+from manifest import expand_pgn_paths, file_entry, load_manifest, plan_ingest, save_manifest
+from move_store import game_moves, open_move_store
 
-PGN_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "pgns")
-OUTPUT_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "move_db.json")
+BASE_DIR = os.path.join(os.path.dirname(__file__), "..")
+PGN_DIR = os.path.join(BASE_DIR, "data", "pgns")
+MANIFEST_FILE = os.path.join(BASE_DIR, "data", "train_manifest.json")
 
-def train_from_pgns():
-    move_db = defaultdict(lambda: defaultdict(int))
+def train_from_pgns(pgn_paths, full=False):
+    with open(os.path.join(BASE_DIR, "config.json"), encoding="utf-8") as f:
+        config = json.load(f)
+    move_db = open_move_store(config, BASE_DIR)
 
-    for filename in os.listdir(PGN_DIR):
-        if filename.endswith(".pgn"):
-            filepath = os.path.join(PGN_DIR, filename)
-            with open(filepath) as f:
-                game = chess.pgn.read_game(f)
-                board = game.board()
+    paths = expand_pgn_paths(pgn_paths)
+    manifest = load_manifest(MANIFEST_FILE)
+    if full:
+        todo = [(p, 0) for p in paths]
+    else:
+        todo, stale = plan_ingest(paths, manifest)
+        # move_db counts are additive and also hold games learned live, so a
+        # rewritten file can't be un-learned. Leave it alone and say so.
+        for path in stale:
+            if path not in paths:
+                continue
+            print(f"Skipping {path}: changed since it was learned (use --full to re-read).")
 
-                for move in game.mainline_moves():
-                    move_san = board.san(move)
-                    fen = board.fen()
-                    move_db[fen][move_san] += 1
-                    board.push(move)
+    games = 0
+    try:
+        for path, start in todo:
+            for game in read_games(path, start):
+                move_db.record(game_moves(game))
+                games += 1
+    finally:
+        move_db.close()
 
-    # Save as JSON
-    with open(OUTPUT_FILE, "w") as f:
-        json.dump(move_db, f, indent=2)
+    files = dict(manifest.get("files", {}))
+    for path, _ in todo:
+        files[path] = file_entry(path)
+    save_manifest(MANIFEST_FILE, {"files": files})
 
-    print(f"Training complete! Learned from {len(os.listdir(PGN_DIR))} PGN files.")
-    print(f"Database saved to {OUTPUT_FILE}")
+    print(f"Training complete! Learned from {games} new games in {len(todo)} PGN files.")
+    print(f"Database updated via the {config.get('move_db', {}).get('backend', 'sqlite')} move_db backend.")
 
 if __name__ == "__main__":
-    train_from_pgns()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("pgn", nargs="*", default=[PGN_DIR], help="PGN files or directories")
+    ap.add_argument("--full", action="store_true",
+                    help="ignore the manifest and re-read everything (adds the counts again)")
+    args = ap.parse_args()
+    train_from_pgns(args.pgn, args.full)
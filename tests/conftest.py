@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+# Scripts in src/ and web/ import their neighbours by bare module name.
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+for path in (ROOT, os.path.join(ROOT, "src"), os.path.join(ROOT, "web")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+@pytest.fixture
+def assets(tmp_path, monkeypatch):
+    """The process-wide PersonaAssets, with every file they write kept in tmp_path."""
+    import bot_core
+    assets = bot_core.PersonaAssets()
+    config = assets.config
+    config["analysis_cache"]["path"] = str(tmp_path / "analysis_cache.sqlite")
+    config["move_db"]["path"] = str(tmp_path / "move_db.sqlite")
+    config["archive"]["dir"] = str(tmp_path / "archive")
+    config["persona_reload"]["enabled"] = False
+    monkeypatch.setattr(bot_core, "_assets", assets)
+    yield assets
+    for name in ("move_db", "archive"):
+        if assets.__dict__.get(name) is not None:
+            assets.__dict__[name].close()
@@ -0,0 +1,93 @@
+import threading
+import time
+
+import chess
+import pytest
+
+import app as web_app
+import bot_core
+from tokens import GameTokens
+
+
+@pytest.fixture
+def client(assets, monkeypatch):
+    recorded = []
+    monkeypatch.setattr(bot_core.BotGame, "_update_db", lambda game: recorded.append(game.game))
+    monkeypatch.setattr(assets.archive, "submit", recorded.append)
+    web_app.app.config["TESTING"] = True
+    client = web_app.app.test_client()
+    client.recorded = recorded
+    return client
+
+
+def current_slot(client):
+    with client.session_transaction() as session:
+        return web_app.games.get(session["gid"])
+
+
+def test_game_ended_by_a_move_is_not_recorded_again_by_resign(client):
+    assert client.post("/new", json={"color": "b"}).get_json()["ok"]
+    game = current_slot(client).game
+    game.restore("b", [chess.Move.from_uci(u) for u in ("f2f3", "e7e5", "g2g4")])
+
+    reply = client.post("/move", json={"uci": "d8h4"}).get_json()
+    assert reply["result"] == "0-1" and game.ended
+    assert len(client.recorded) == 2  # archived once, learned from once
+
+    reply = client.post("/resign").get_json()
+    assert reply == {"ok": False, "error": "No active game"}
+    assert game.end_game() == ("0-1", None)
+    assert len(client.recorded) == 2
+
+
+def test_resign_records_a_live_game_once(client):
+    client.post("/new", json={"color": "w"})
+    reply = client.post("/resign").get_json()
+    assert reply["ok"] and reply["result"] == "0-1"
+    assert client.post("/resign").get_json()["ok"] is False
+    assert len(client.recorded) == 2
+
+
+def test_stateless_replay_on_another_worker_is_not_recorded_again(client, monkeypatch):
+    monkeypatch.setattr(web_app, "STATELESS", True)
+    monkeypatch.setattr(web_app, "tokens", GameTokens("secret"))
+    token = client.post("/new", json={"color": "w"}).get_json()["token"]
+    reply = client.post("/move", json={"uci": "e2e4", "token": token}).get_json()
+    assert reply["ok"]
+
+    assert client.post("/resign", json={"token": reply["token"]}).get_json()["ok"]
+    assert len(client.recorded) == 2
+    # A fresh worker has never seen the game end; move_db still knows
+    monkeypatch.setattr(web_app, "tokens", GameTokens("secret"))
+    for stale in (token, reply["token"]):
+        assert client.post("/resign", json={"token": stale}).get_json()["ok"] is False
+    assert len(client.recorded) == 2
+
+
+def test_requests_do_not_wait_for_the_bots_search(client, monkeypatch):
+    searching, release = threading.Event(), threading.Event()
+    select_move = bot_core.BotGame.select_move
+
+    def slow_select_move(game):
+        searching.set()
+        assert release.wait(10)
+        return select_move(game)
+
+    monkeypatch.setattr(web_app, "ASYNC_MOVES", True)
+    monkeypatch.setattr(bot_core.BotGame, "select_move", slow_select_move)
+    client.post("/new", json={"color": "w"})
+    slot = current_slot(client)
+    try:
+        assert client.post("/move", json={"uci": "e2e4"}).get_json()["pending"]
+        assert searching.wait(5)
+        start = time.monotonic()
+        reply = client.post("/move", json={"uci": "d2d4"}).get_json()
+        assert reply["ok"] is False and reply["pending"]
+        assert client.get("/bot_move").get_json()["pending"]
+        assert client.post("/resign").get_json()["ok"]
+        assert time.monotonic() - start < 5  # none of them waited for the search
+    finally:
+        release.set()
+    # The search finishes after the resign and must not move
+    assert slot.job.result(timeout=10)["bot_move"] is None
+    assert [m.uci() for m in slot.game.board.move_stack] == ["e2e4"]
@@ -0,0 +1,65 @@
+import sys
+
+import chess
+import pytest
+
+import bot_core
+import build_persona
+
+PGN = """[Event "t"]
+[White "a"]
+[Black "b"]
+[Result "*"]
+
+1. {} *
+
+"""
+
+
+def build(tmp_path, monkeypatch, first_move, *flags):
+    pgn = tmp_path / "games.pgn"
+    pgn.write_text(PGN.format(first_move) * 3)
+    out = tmp_path / "persona"
+    monkeypatch.setattr(sys, "argv", ["build_persona.py", "--pgn", str(pgn), "--out", str(out),
+                                      "--workers", "1", *flags])
+    build_persona.main()
+    monkeypatch.setattr(bot_core, "PERSONA_DIR", str(out))
+    return out
+
+
+def first_move(book):
+    return book.choose(chess.Board()).uci()
+
+
+def test_every_build_rewrites_the_binary_book(tmp_path, monkeypatch):
+    build(tmp_path, monkeypatch, "e4")
+    _, book = bot_core.load_persona()
+    assert isinstance(book, bot_core.BinaryBook) and first_move(book) == "e2e4"
+
+    build(tmp_path, monkeypatch, "d4")
+    _, book = bot_core.load_persona()
+    assert isinstance(book, bot_core.BinaryBook) and first_move(book) == "d2d4"
+
+
+def test_stale_binary_book_is_ignored(tmp_path, monkeypatch):
+    out = build(tmp_path, monkeypatch, "e4")
+    stale = (out / "opening_book.bin").read_bytes()
+    build(tmp_path, monkeypatch, "d4", "--no-binary")
+    assert not (out / "opening_book.bin").exists()
+
+    # A .bin from an older build put back next to the new JSON, e.g. by a
+    # partial deploy: the snapshot no longer vouches for it
+    (out / "opening_book.bin").write_bytes(stale)
+    _, book = bot_core.load_persona()
+    assert isinstance(book, bot_core.JsonBook) and first_move(book) == "d2d4"
+
+
+@pytest.mark.parametrize("name", ["persona.marshal", "opening_book.json"])
+def test_binary_book_needs_a_current_snapshot(tmp_path, monkeypatch, name):
+    out = build(tmp_path, monkeypatch, "e4")
+    if name == "persona.marshal":
+        (out / name).unlink()
+    else:
+        (out / name).write_text('{"%s": [{"san": "d4", "count": 1}]}' % chess.STARTING_FEN)
+    _, book = bot_core.load_persona()
+    assert isinstance(book, bot_core.JsonBook)
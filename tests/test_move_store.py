@@ -0,0 +1,20 @@
+from move_store import JsonMoveStore, SqliteMoveStore
+
+
+def test_only_the_first_worker_claims_a_finished_game(tmp_path):
+    path = str(tmp_path / "move_db.sqlite")
+    workers = [SqliteMoveStore(path, import_legacy=None) for _ in range(2)]
+    try:
+        assert workers[0].claim_game("g1")
+        assert not workers[1].claim_game("g1")
+        assert not workers[0].claim_game("g1")
+        assert workers[1].claim_game("g2")
+    finally:
+        for store in workers:
+            store.close()
+
+
+def test_json_store_claims_each_game_once(tmp_path):
+    store = JsonMoveStore(str(tmp_path / "move_db.json"))
+    assert store.claim_game("g1")
+    assert not store.claim_game("g1")
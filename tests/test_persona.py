@@ -0,0 +1,17 @@
+import bot_core
+from persona import PersonaManager
+from test_load_book import build
+
+
+def test_reload_picks_up_a_snapshot_written_after_the_books(tmp_path, monkeypatch):
+    out = build(tmp_path, monkeypatch, "e4")
+    snapshot = (out / "persona.marshal").read_bytes()
+    (out / "persona.marshal").unlink()  # a reload between the books and the snapshot
+
+    manager = PersonaManager(str(out), bot_core.load_persona, interval=0)
+    first = manager.get()
+    assert isinstance(first.book, bot_core.JsonBook)
+
+    (out / "persona.marshal").write_bytes(snapshot)
+    assert manager.reload() != first.version
+    assert isinstance(manager.get().book, bot_core.BinaryBook)
@@ -0,0 +1,67 @@
+import threading
+
+import chess
+import chess.engine
+
+from ponder import Ponderer
+
+E4, D4 = chess.Move.from_uci("e2e4"), chess.Move.from_uci("d2d4")
+
+
+class SlowSearch:
+    """Answers ...e5 once released; records which positions it was asked about."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.boards = []
+
+    def __call__(self, board):
+        self.boards.append(board.fen())
+        self.started.set()
+        assert self.release.wait(5)
+        return chess.engine.PlayResult(board.parse_san("e5"), None)
+
+
+def ponder_on(search, candidates):
+    ponderer = Ponderer(search, workers=1)
+    ponderer.start(chess.Board(), candidates)
+    assert search.started.wait(5)
+    return ponderer
+
+
+def test_running_search_for_the_played_move_is_waited_on():
+    search = SlowSearch()
+    ponderer = ponder_on(search, [E4, D4])
+    ponderer.resolve(E4)
+    assert ponderer.pending is not None and ponderer.hits == 1
+
+    board = chess.Board()
+    board.push(E4)
+    threading.Timer(0.05, search.release.set).start()
+    result = ponderer.take(board, wait=5)
+    assert result is not None and result.move == chess.Move.from_uci("e7e5")
+    assert len(search.boards) == 1  # d4's queued search never ran
+
+
+def test_search_still_running_after_the_moves_time_is_dropped():
+    search = SlowSearch()
+    ponderer = ponder_on(search, [E4])
+    ponderer.resolve(E4)
+    board = chess.Board()
+    board.push(E4)
+    try:
+        assert ponderer.take(board, wait=0.05) is None
+        assert ponderer.pending is None
+    finally:
+        search.release.set()
+
+
+def test_queued_search_for_the_played_move_is_not_kept():
+    search = SlowSearch()
+    ponderer = ponder_on(search, [E4, D4])
+    try:
+        ponderer.resolve(D4)  # e4 is searching on the only worker, d4 still queued
+        assert ponderer.pending is None and ponderer.misses == 1
+    finally:
+        search.release.set()
@@ -0,0 +1,83 @@
+import threading
+import time
+
+import chess
+import pytest
+
+import bot_core
+from scheduler import NORMAL, REJECT, EngineScheduler, Overloaded
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def full_queue():
+    """A one-engine scheduler whose engine is busy and whose queue of 2 is full."""
+    sched = EngineScheduler(slots=1, max_queue=2, shed_at=2)
+    held = sched.slot("busy", 1.0)
+    held.__enter__()
+    done = []
+
+    def search(owner):
+        with sched.slot(owner, 1.0):
+            done.append(owner)
+
+    waiters = [threading.Thread(target=search, args=(f"g{i}",)) for i in range(2)]
+    for t in waiters:
+        t.start()
+    wait_for(lambda: sched.depth() == 2)
+    yield sched
+    held.__exit__(None, None, None)
+    for t in waiters:
+        t.join(5)
+    assert sorted(done) == ["g0", "g1"]
+
+
+def test_slot_refuses_to_queue_past_max_queue(full_queue):
+    assert full_queue.level() == REJECT
+    with pytest.raises(Overloaded) as e:
+        with full_queue.slot("late", 1.0):
+            pytest.fail("got an engine past a full queue")
+    assert e.value.retry_after > 0
+    assert full_queue.depth() == 2
+
+
+def test_move_admitted_before_the_queue_filled_is_shed(full_queue, assets, monkeypatch):
+    game = bot_core.BotGame(assets=assets, ponder=False)
+    game.scheduler = full_queue
+    monkeypatch.setattr(full_queue, "level", lambda: 0)  # it was NORMAL when the move started
+    game.board = chess.Board("rnbqkbnr/1ppppppp/8/p6Q/4P3/8/PPPP1PPP/RNB1KBNR b KQkq - 1 2")
+    monkeypatch.setattr(game.book, "choose", lambda board, ply=None: None)
+    monkeypatch.setattr(game.move_db, "lookup", lambda board, ply=None: {})
+    game.style = {"blunder_chance": 0}
+
+    move, source, _ = game.select_move()
+    assert source == "shed"
+    assert game.board.is_legal(move)
+    assert full_queue.depth() == 2
+
+
+def test_waiting_behind_pondering_is_not_load():
+    sched = EngineScheduler(slots=1, shrink_at=1, shed_at=2)
+    ponder = sched.slot("ponder", 1.0, background=True)
+    ponder.__enter__()
+    move = sched.slot("move", 1.0)
+    got = threading.Event()
+
+    def search():
+        with move:
+            got.set()
+
+    waiter = threading.Thread(target=search)
+    waiter.start()
+    wait_for(lambda: sched.depth() == 1)
+    assert sched.level() == NORMAL and sched.time_factor() == 1.0
+    ponder.__exit__(None, None, None)
+    assert got.wait(5)
+    waiter.join(5)
+    assert sched.background == 0 and sched.busy() == 0
@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+import chess
+import pytest
+
+from tokens import BadToken, GameOver, GameTokens
+
+
+def game(*sans, used=0.0, book_ply=None):
+    board = chess.Board()
+    for san in sans:
+        board.push_san(san)
+    return SimpleNamespace(board=board, user_is_white=True, persona=SimpleNamespace(version="v1"),
+                           is_over=board.is_game_over, clock=SimpleNamespace(used=used),
+                           book_ply=book_ply)
+
+
+def test_round_trip():
+    tokens = GameTokens("secret")
+    color, game_id, version, moves, board, state = tokens.load(tokens.dump(game("e4", "e5"), "g1"))
+    assert (color, game_id, version) == ("w", "g1", "v1")
+    assert state == {"used": 0.0, "book_ply": None}
+    assert [m.uci() for m in moves] == ["e2e4", "e7e5"]
+    assert board.fen() == game("e4", "e5").board.fen()
+
+
+def test_time_manager_state_travels_with_the_game():
+    tokens = GameTokens("secret")
+    *_, state = tokens.load(tokens.dump(game("e4", "e5", used=3.25, book_ply=1), "g1"))
+    assert state == {"used": 3.25, "book_ply": 1}
+
+
+def test_forged_token_is_refused():
+    with pytest.raises(BadToken):
+        GameTokens("secret").load(GameTokens("other").dump(game("e4"), "g1"))
+
+
+def test_token_of_an_ended_game_is_refused_by_any_worker():
+    mate = GameTokens("secret").dump(game("f3", "e5", "g4", "Qh4#"), "g1")
+    with pytest.raises(GameOver):
+        GameTokens("secret").load(mate)
+
+
+def test_earlier_token_is_refused_once_the_game_is_finished():
+    tokens = GameTokens("secret")
+    token = tokens.dump(game("e4"), "g1")
+    assert tokens.finish("g1")
+    assert not tokens.finish("g1")  # a replay cannot end it twice
+    with pytest.raises(GameOver):
+        tokens.load(token)
+
+
+def test_finished_games_are_bounded():
+    tokens = GameTokens("secret", finished_size=2)
+    for game_id in ("g1", "g2", "g3"):
+        tokens.finish(game_id)
+    assert list(tokens.finished) == ["g2", "g3"]
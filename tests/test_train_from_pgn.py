@@ -0,0 +1,28 @@
+import json
+
+import chess
+
+import train_from_pgn
+
+PGN = """[Event "t"]
+[White "a"]
+[Black "b"]
+[Result "1-0"]
+
+1. e4 e5 2. Qh5 Nc6 3. Bc4 Nf6 4. Qxf7# 1-0
+
+"""
+
+
+def test_trainer_with_json_backend(tmp_path, monkeypatch):
+    (tmp_path / "config.json").write_text(json.dumps({"move_db": {"backend": "json", "path": "move_db.json"}}))
+    pgn = tmp_path / "games.pgn"
+    pgn.write_text(PGN * 2)
+    monkeypatch.setattr(train_from_pgn, "BASE_DIR", str(tmp_path))
+    monkeypatch.setattr(train_from_pgn, "MANIFEST_FILE", str(tmp_path / "manifest.json"))
+
+    train_from_pgn.train_from_pgns([str(pgn)])
+
+    db = json.loads((tmp_path / "move_db.json").read_text())
+    assert db[chess.STARTING_FEN] == {"e4": 2}
+    assert sum(sum(moves.values()) for moves in db.values()) == 14
@@ -1,9 +1,112 @@
-from flask import Flask, render_template, request, jsonify
-from bot_core import BotGame
+import hmac, os, time, uuid
+from flask import Flask, Response, g, render_template, request, jsonify, session
+from bot_core import BotGame, shared_assets
+from sessions import GameStore
+from jobs import BoundedExecutor, Busy
+from scheduler import Overloaded
+from tokens import BadToken, GameOver, GameTokens
+from src.archive import new_game_id
+import metrics
 
 app = Flask(__name__, template_folder="templates")
+app.secret_key = os.environ.get("SECRET_KEY") or os.urandom(24)
 
-game = BotGame()
+config = shared_assets().config  # assets themselves load on first use
+games = GameStore(
+    BotGame,
+    max_games=int(config.get("max_live_games", 500)),
+    idle_ttl=float(config.get("game_idle_ttl", 1800)),
+)
+
+ASYNC_MOVES = bool(config.get("async_moves", True))
+bot_workers = BoundedExecutor(
+    max_workers=int(config.get("bot_workers", 4)),
+    max_pending=int(config.get("max_pending_moves", 64)),
+)
+
+# Stateless mode: the game travels in a signed token instead of living here,
+# so any worker can serve any move. Every worker must share SECRET_KEY.
+STATELESS = bool(config.get("stateless", False))
+tokens = None
+if STATELESS:
+    if not os.environ.get("SECRET_KEY"):
+        print("⚠️ Stateless mode without SECRET_KEY: tokens only verify in this process.")
+    tokens = GameTokens(app.secret_key, int(config.get("token_cache_size", 2000)))
+    metrics.REGISTRY.gauge("token_board_cache_hits", "Stateless moves that skipped replaying the game",
+                           lambda: tokens.cache.hits)
+    metrics.REGISTRY.gauge("token_board_cache_misses", "Stateless moves rebuilt from the move list",
+                           lambda: tokens.cache.misses)
+
+# Scrape-time gauges for state owned by other components
+metrics.REGISTRY.gauge("live_games", "Games currently held in memory", lambda: len(games))
+metrics.REGISTRY.gauge("bot_jobs_in_flight", "Bot replies queued or running",
+                       lambda: bot_workers.in_flight)
+metrics.REGISTRY.gauge("engine_queue_depth", "Searches waiting for a free engine",
+                       lambda: shared_assets().scheduler.depth())
+metrics.REGISTRY.gauge("engine_slots_busy", "Engines currently searching",
+                       lambda: shared_assets().scheduler.busy())
+metrics.REGISTRY.gauge("engine_load_level", "0 normal, 1 shorter searches, 2 no engine, 3 refusing moves",
+                       lambda: shared_assets().scheduler.level())
+def _cache_stat(name):
+    cache = shared_assets().eng.cache
+    return cache.stats()[name] if cache is not None else 0
+
+if config.get("analysis_cache", {}).get("enabled", True):
+    for _name, _help in (("hits", "Analysis cache hits (memory or disk)"),
+                         ("disk_hits", "Analysis cache hits served from SQLite"),
+                         ("misses", "Analysis cache misses"),
+                         ("engine_seconds_saved", "Engine time saved by cache hits")):
+        metrics.REGISTRY.gauge(f"analysis_cache_{_name}", _help, lambda _name=_name: _cache_stat(_name))
+
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+
+@app.after_request
+def record_latency(response):
+    started = g.pop("started", None)
+    if started is not None and request.endpoint != "prometheus_metrics":
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started,
+                                        endpoint=request.endpoint or "unknown",
+                                        status=response.status_code)
+    version = g.pop("persona_version", None)
+    if version is not None:
+        response.headers["X-Persona-Version"] = version
+    return response
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+def served_by(game):
+    """Tag the response with the persona version this game is playing with."""
+    g.persona_version = game.persona.version
+    return game
+
+def respond(payload, status=200):
+    with metrics.span("json"):
+        return jsonify(payload), status
+
+def busy(retry_after):
+    """503 asking the client to send the same move again later."""
+    response, status = respond({"ok": False, "error": "Server busy, try that move again.",
+                                "retry_after": retry_after}, 503)
+    response.headers["Retry-After"] = str(max(1, round(retry_after)))
+    return response, status
+
+def admit():
+    """None if a new move can be taken on, else the busy response to send."""
+    try:
+        shared_assets().scheduler.admit()
+    except Overloaded as e:
+        metrics.LOAD_SHED.inc(action="reject")
+        return busy(e.retry_after)
+    return None
+
+def session_id():
+    if "gid" not in session:
+        session["gid"] = uuid.uuid4().hex
+    return session["gid"]
 
 @app.route("/")
 def index():
@@ -13,8 +116,12 @@ def index():
 def new_game():
     data = request.get_json()
     color = data.get("color", "w")
-    fen, chat, bot_san, bot_chat = game.new_game(color)
-    return jsonify({
+    if STATELESS:
+        return stateless_new(color)
+    slot = games.create(session_id())
+    with slot.lock:
+        fen, chat, bot_san, bot_chat = served_by(slot.game).new_game(color)
+    return respond({
         "ok": True,
         "fen": fen,
         "chat": chat,
@@ -22,47 +129,220 @@ def new_game():
         "botChat": bot_chat
     })
 
+def bot_reply(game, choice=None):
+    """Let the bot move and describe the result for the client."""
+    bot_san, fen, bot_chat = game.bot_move(choice)
+    last_move = game.board.move_stack[-1].uci()  # ✅ bot squares
+    reply = {
+        "fen": fen,
+        "bot_san": bot_san,
+        "bot_chat": bot_chat,
+        "bot_move": {"from": last_move[0:2], "to": last_move[2:4]},
+    }
+    # if the bot's reply ended the game, include result + chat
+    if game.is_over():
+        res, end_chat = game.end_game()
+        reply["result"] = res
+        reply["chat"] = end_chat
+    return reply
+
+def user_move_response(game, uci):
+    """Describe an accepted user move, finishing the game if it ended it."""
+    response = {
+        "ok": True,
+        "fen": game.fen(),
+        "chat": f"You played {uci}",
+        "bot_san": None,
+        "bot_chat": None,
+        "user_move": {"from": uci[0:2], "to": uci[2:4]},  # ✅ user squares
+        "bot_move": None
+    }
+    # if game ends after user move
+    if game.is_over():
+        res, end_chat = game.end_game()
+        response["result"] = res
+        response["chat"] = end_chat or response["chat"]
+    return response
+
+def run_bot_reply(slot):
+    # The lock is held to read the position and to play the move, not for the
+    # search, so /move and /resign never wait out the bot's think. Nothing
+    # else moves on this board while slot.job is pending.
+    with slot.lock:
+        game = slot.game
+        ply = len(game.board.move_stack)
+    with metrics.span("bot_move"):
+        choice = game.select_move()
+    with slot.lock:
+        if game.ended or len(game.board.move_stack) != ply:
+            return {"fen": game.fen(), "bot_san": None, "bot_chat": None, "bot_move": None}
+        return bot_reply(game, choice)
+
+def thinking(slot):
+    return slot.job is not None and not slot.job.done()
+
+def still_thinking():
+    return respond({"ok": False, "pending": True, "error": "Hold on, I'm still thinking!"})
+
 @app.route("/move", methods=["POST"])
 def move():
     data = request.get_json()
     uci = data.get("uci")
+    if STATELESS:
+        return stateless_move(data.get("token"), uci)
+
+    slot = games.get(session.get("gid"))
+    if slot is None:
+        return respond({"ok": False, "error": "No active game. Start a new one!"})
+    if thinking(slot):  # checked before the lock too, so the answer never waits
+        return still_thinking()
+
+    with slot.lock:
+        if thinking(slot):
+            return still_thinking()
+        refused = admit()
+        if refused:
+            return refused
+
+        game = served_by(slot.game)
+        with metrics.span("user_move"):
+            ok, msg = game.user_move(uci)
+        if not ok:
+            return respond({"ok": False, "error": msg})
+
+        response = user_move_response(game, uci)
+        if "result" in response:
+            return respond(response)  # the user's move ended the game
+        if ASYNC_MOVES:
+            # Reply is computed off the request; the client polls /bot_move.
+            try:
+                slot.job = bot_workers.submit(run_bot_reply, slot)
+            except Busy:
+                game.undo_move()
+                return busy(1)
+            response["pending"] = True
+        else:
+            reply = bot_reply(game)
+            response.update(reply)
+            response["chat"] = reply.get("chat") or response["chat"]
+
+    return respond(response)
+
+@app.route("/bot_move", methods=["GET"])
+def poll_bot_move():
+    slot = games.get(session.get("gid"))
+    if slot is None or slot.job is None:
+        return respond({"ok": False, "error": "No move pending"})
+    served_by(slot.game)
+    if not slot.job.done():
+        return respond({"ok": True, "pending": True})
+    job, slot.job = slot.job, None
+    try:
+        reply = job.result()
+    except Exception as e:
+        return respond({"ok": False, "error": f"Bot failed to move: {e}"})
+    return respond({"ok": True, "pending": False, **reply})
+
+@app.route("/resign", methods=["POST"])
+def resign():
+    if STATELESS:
+        return stateless_resign((request.get_json(silent=True) or {}).get("token"))
+    sid = session.get("gid")
+    slot = games.get(sid)
+    if slot is None:
+        return respond({"ok": False, "error": "No active game"})
+    with slot.lock:
+        game = served_by(slot.game)
+        if game.ended:  # already over (and recorded) through /move or /bot_move
+            games.discard(sid)
+            return respond({"ok": False, "error": "No active game"})
+        result, chat = game.resign()
+    games.discard(sid)
+    return respond({"ok": True, "result": result, "chat": chat})
+
+@app.route("/admin/reload_persona", methods=["POST"])
+def reload_persona():
+    """Pick up rebuilt persona files now instead of at the next watcher poll.
+
+    Only reaches the worker that serves it; the others follow within
+    persona_reload.interval. Disabled unless ADMIN_TOKEN is set.
+    """
+    expected = os.environ.get("ADMIN_TOKEN")
+    if not expected or not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), expected):
+        return respond({"ok": False, "error": "Not found"}, 404)
+    manager = shared_assets().persona
+    previous = manager.current.version
+    return respond({"ok": True, "version": manager.reload(), "previous": previous})
 
-    fen, msg, bot_san, bot_chat = game.make_move(uci)
+# -------------------------------
+# stateless mode
+# -------------------------------
+def load_game(token):
+    """Rebuild the BotGame a token describes (raises BadToken)."""
+    color, game_id, version, moves, board, state = tokens.load(token)
+    game = served_by(BotGame(ponder=False, persona=shared_assets().persona.find(version)))
+    game.restore(color, moves, board, game_id, **state)
+    game.claim_end = lambda: claim_end(game_id)  # archive and learn from it once
+    return game, game_id
 
-    if fen is None:
-        return jsonify({"ok": False, "error": msg})
+def claim_end(game_id):
+    """True for the first request, in any worker, to end this game."""
+    return tokens.finish(game_id) and shared_assets().move_db.claim_game(game_id)
 
-    user_move = {"from": uci[0:2], "to": uci[2:4]}  # ✅ user squares
+def bad_token():
+    return respond({"ok": False, "error": "No active game. Start a new one!"}, 400)
 
-    bot_move = None
-    if bot_san:  # ✅ if bot replied
-        last_move = game.board.move_stack[-1]  # chess.Move object
-        bot_move = {"from": last_move.uci()[0:2], "to": last_move.uci()[2:4]}
+def game_over():
+    return respond({"ok": False, "error": "This game is over. Start a new one!"}, 400)
 
-    return jsonify({
+def stateless_new(color):
+    game = served_by(BotGame(ponder=False))
+    fen, chat, bot_san, bot_chat = game.new_game(color)
+    return respond({
         "ok": True,
         "fen": fen,
-        "chat": msg,
-        "bot_san": bot_san,
-        "bot_chat": bot_chat,
-        "user_move": user_move,
-        "bot_move": bot_move
+        "chat": chat,
+        "botSAN": bot_san,
+        "botChat": bot_chat,
+        "token": tokens.dump(game, new_game_id()),
     })
 
+def stateless_move(token, uci):
+    # The reply is computed inline: a pending job would tie the game to this worker.
+    refused = admit()
+    if refused:
+        return refused
+    try:
+        with metrics.span("token_load"):
+            game, game_id = load_game(token)
+    except GameOver:
+        return game_over()
+    except BadToken:
+        return bad_token()
+    with metrics.span("user_move"):
+        ok, msg = game.user_move(uci)
+    if not ok:
+        return respond({"ok": False, "error": msg})
+    response = user_move_response(game, uci)
+    if "result" not in response:
+        reply = bot_reply(game)
+        response.update(reply)
+        response["chat"] = reply.get("chat") or response["chat"]
+    response["token"] = tokens.dump(game, game_id)
+    return respond(response)
 
-    # NEW: if game ended, include result + chat
-    if game.board.is_game_over():
-        res, end_chat = game.end_game()
-        response["result"] = res
-        response["chat"] = end_chat or msg
-
-    return jsonify(response)
-
-@app.route("/resign", methods=["POST"])
-def resign():
+def stateless_resign(token):
+    try:
+        game, game_id = load_game(token)
+    except GameOver:
+        return game_over()
+    except BadToken:
+        return bad_token()
+    if game.is_over() or not claim_end(game_id):
+        return game_over()
+    game.claim_end = None  # claimed just above
     result, chat = game.resign()
-    return jsonify({"ok": True, "result": result, "chat": chat})
+    return respond({"ok": True, "result": result, "chat": chat})
 
 if __name__ == "__main__":
     app.run(debug=True)
-
@@ -2,9 +2,21 @@ import sys, os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 # web/bot_core.py
-import chess, chess.engine, chess.pgn, json, random
-from datetime import datetime
+import chess, chess.engine, chess.pgn, chess.polyglot, json, random, threading, time
+import bisect, mmap, struct
 from src.engine_wrapper import EngineWrapper
+from src.move_store import open_move_store
+from src.archive import open_archive
+from src.move_sampler import StyleSampler
+from src.time_manager import TimeManager, process_budget
+from src.search import Searcher
+from src.snapshot import book_positions, load_snapshot
+from src.position_index import open_position_index
+from ponder import Ponderer
+from persona import PersonaManager
+from plies import PlyLog
+from scheduler import NORMAL, SHED, Overloaded, scheduler_from_config
+from metrics import LOAD_SHED, MOVE_SOURCE, span
 
 BLUNDER_RATE = 0.01
 
@@ -25,56 +37,346 @@ def say(category):
         return random.choice(TRASH_TALK[category])
     return None
 
-# Move DB path
-MOVE_DB_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "move_db.json")
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 
-def load_move_db():
-    if os.path.exists(MOVE_DB_FILE):
-        with open(MOVE_DB_FILE, "r") as f:
-            return json.load(f)
-    return {}
+PERSONA_DIR = os.path.join(BASE_DIR, "persona")
 
-def save_move_db(move_db):
-    with open(MOVE_DB_FILE, "w") as f:
-        json.dump(move_db, f, indent=2)
+def load_style(snapshot=None):
+    if snapshot is not None:
+        return snapshot["style"]
+    path = os.path.join(PERSONA_DIR, "style.json")
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    return {"blunder_chance": 0.01} # Default
+
+# -------------------------------
+# opening books
+# -------------------------------
+class JsonBook:
+    """FEN-keyed book from opening_book.json with precomputed cumulative weights."""
+    def __init__(self, positions):
+        self.positions = positions  # fen -> (sans, cumulative counts), see src/snapshot.py
+
+    @classmethod
+    def from_json(cls, raw):
+        # book format: "fen": [{"san": "e4", "count": 10}, ...]
+        return cls(book_positions(raw))
+
+    def __len__(self):
+        return len(self.positions)
+
+    def moves(self, board, ply=None):
+        """All book moves for the position as (move, weight), most played first."""
+        entry = self.positions.get(ply.fen() if ply else board.fen())
+        if entry is None:
+            return []
+        sans, cum = entry
+        out = []
+        for i, san in enumerate(sans):
+            try:
+                out.append((board.parse_san(san), cum[i] - (cum[i - 1] if i else 0)))
+            except ValueError:
+                pass
+        return out
+
+    def choose(self, board, rng=random, ply=None):
+        entry = self.positions.get(ply.fen() if ply else board.fen())
+        if entry is None:
+            return None
+        sans, cum = entry
+        san = sans[bisect.bisect_right(cum, rng.randrange(cum[-1]))]
+        try:
+            return board.parse_san(san)
+        except ValueError:
+            return None
+
+class BinaryBook:
+    """Memory-mapped Polyglot book written by build_persona.py.
+
+    Entries are sorted by Zobrist key and store the running weight total of
+    their position in the learn field, so a weighted pick is two binary
+    searches over the mapped file and nothing is copied into the heap.
+    """
+    ENTRY = struct.Struct(">QHHI")
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = len(self.data) // self.ENTRY.size
+
+    def __len__(self):
+        return self.size
+
+    def _key_at(self, i):
+        return self.ENTRY.unpack_from(self.data, i * self.ENTRY.size)[0]
+
+    def _range(self, key):
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        start, hi = lo, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid) <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return start, lo
+
+    def _decode(self, board, raw):
+        to_sq, from_sq, promo = raw & 0x3F, (raw >> 6) & 0x3F, (raw >> 12) & 0x7
+        # Polyglot castling is "king takes own rook"; python-chess wants e1g1.
+        if board.kings & chess.BB_SQUARES[from_sq] and board.rooks & board.occupied_co[board.turn] & chess.BB_SQUARES[to_sq]:
+            to_sq = chess.square(6 if to_sq > from_sq else 2, chess.square_rank(from_sq))
+        move = chess.Move(from_sq, to_sq, promo + 1 if promo else None)
+        return move if board.is_legal(move) else None
+
+    def moves(self, board, ply=None):
+        """All book moves for the position as (move, weight), most played first."""
+        start, end = self._range(ply.zobrist() if ply else chess.polyglot.zobrist_hash(board))
+        out = []
+        for i in range(start, end):
+            _, raw, weight, _ = self.ENTRY.unpack_from(self.data, i * self.ENTRY.size)
+            move = self._decode(board, raw)
+            if move is not None:
+                out.append((move, weight))
+        return out
+
+    def choose(self, board, rng=random, ply=None):
+        start, end = self._range(ply.zobrist() if ply else chess.polyglot.zobrist_hash(board))
+        if start == end:
+            return None
+        total = self.ENTRY.unpack_from(self.data, (end - 1) * self.ENTRY.size)[3]
+        r = rng.randrange(total)
+        lo, hi = start, end - 1
+        while lo < hi:  # first entry whose running total exceeds r
+            mid = (lo + hi) // 2
+            if self.ENTRY.unpack_from(self.data, mid * self.ENTRY.size)[3] <= r:
+                lo = mid + 1
+            else:
+                hi = mid
+        return self._decode(board, self.ENTRY.unpack_from(self.data, lo * self.ENTRY.size)[1])
+
+def load_book(snapshot=None):
+    # The .bin is only used with a current snapshot, whose hashes show it was
+    # built from this opening_book.json; otherwise it may be stale.
+    if snapshot is not None:
+        bin_path = os.path.join(PERSONA_DIR, "opening_book.bin")
+        if os.path.exists(bin_path):
+            return BinaryBook(bin_path)
+        return JsonBook(snapshot["positions"])
+    path = os.path.join(PERSONA_DIR, "opening_book.json")
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return JsonBook.from_json(json.load(f))
+    return JsonBook({})
+
+def load_persona():
+    """(style, book) from persona/, via the snapshot when it is current."""
+    snapshot = load_snapshot(PERSONA_DIR)
+    return load_style(snapshot), load_book(snapshot)
+
+# -------------------------------
+# shared, per-process assets
+# -------------------------------
+class lazy:
+    """Attribute built on first access, under the owner's lock, then cached on the instance."""
+    def __init__(self, build):
+        self.build = build
+        self.name = build.__name__
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        with obj._lock:
+            if self.name not in obj.__dict__:
+                obj.__dict__[self.name] = self.build(obj)
+        return obj.__dict__[self.name]
+
+class PersonaAssets:
+    """Engine and persona data shared by every game in the process.
+
+    Nothing is loaded until first use. preload() loads the read-only parts
+    (persona, endgame tables, position index) so a preforking server can share them
+    copy-on-write; the parts that own threads, processes or connections
+    (engine pool, move_db, archive, persona watcher) always start in the
+    process using them.
+    """
+    def __init__(self):
+        self.config_path = os.path.join(BASE_DIR, "config.json")
+        with open(self.config_path, encoding="utf-8") as f:
+            self.config = json.load(f)
+        self._lock = threading.RLock()
+
+    @lazy
+    def eng(self):
+        return EngineWrapper(self.config_path, self.config)
+
+    @lazy
+    def persona(self):
+        opts = self.config.get("persona_reload", {})
+        interval = float(opts.get("interval", 5.0)) if opts.get("enabled", True) else 0
+        return PersonaManager(PERSONA_DIR, load_persona, interval) # style + book, hot-reloaded
+
+    @lazy
+    def neighbours(self):
+        return open_position_index(self.config, PERSONA_DIR) # what I played in similar positions, or None
+
+    @lazy
+    def scheduler(self):
+        return scheduler_from_config(self.config) # fair queue + load levels in front of the engines
+
+    @lazy
+    def move_db(self):
+        return open_move_store(self.config, BASE_DIR) # legacy DB: fallback + learning
+
+    @lazy
+    def archive(self):
+        return open_archive(self.config, BASE_DIR) # finished games, written in the background
+
+    def preload(self):
+        for name in ("eng", "persona", "neighbours"):
+            getattr(self, name)
+        return self
+
+_assets = None
+_assets_lock = threading.Lock()
+
+def shared_assets():
+    global _assets
+    if _assets is None:
+        with _assets_lock:
+            if _assets is None:
+                _assets = PersonaAssets()
+    return _assets
 
 class BotGame:
-    def __init__(self, user_is_white=True):
+    def __init__(self, user_is_white=True, assets=None, ponder=True, persona=None):
         self.board = chess.Board()
+        self.plies = PlyLog(self.board)  # FEN, key, legal moves and SAN, once per ply
         self.user_is_white = user_is_white
-        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-        self.eng = EngineWrapper(os.path.join(base_dir, "config.json"))
-
-        # Load style and book
-        self.style = self.load_style()
-        self.book = self.load_book()
-        self.move_db = load_move_db() # Keep legacy DB for now as fallback/learning
+        self.assets = assets or shared_assets()
+        self.eng = self.assets.eng
+        self.scheduler = self.assets.scheduler
+        self.owner = id(self)  # whose engine time a search counts against
+
+        # Style and book are pinned for the whole game, even if the persona
+        # is reloaded meanwhile; DB and archive are shared read-mostly references
+        self.persona = persona or self.assets.persona.get()
+        self.style = self.persona.style
+        self.book = self.persona.book
+        self.move_db = self.assets.move_db
+        self.archive = self.assets.archive
+        self.neighbours = self.assets.neighbours
 
         self.game = chess.pgn.Game()
         self.node = self.game
 
-    def load_style(self):
-        path = os.path.join(os.path.dirname(__file__), "..", "persona", "style.json")
-        if os.path.exists(path):
-            with open(path, "r") as f:
-                return json.load(f)
-        return {"blunder_chance": 0.01} # Default
-
-    def load_book(self):
-        path = os.path.join(os.path.dirname(__file__), "..", "persona", "opening_book.json")
-        if os.path.exists(path):
-            with open(path, "r") as f:
-                return json.load(f)
-        return {}
+        # One MultiPV search + softmax pick instead of best-move-or-random-blunder
+        opts = self.eng.config.get("sampler", {})
+        self.sampler = None
+        if opts.get("enabled", True) and int(self.eng.config.get("multipv", 1)) > 1:
+            self.sampler = StyleSampler(
+                self.eng, self.style,
+                chess.engine.Limit(time=self.eng.config.get("think_time", self.eng.config["time_limit"])),
+                multipv=int(self.eng.config["multipv"]),
+                max_loss_cp=float(opts.get("max_loss_cp", 200)),
+                prior_cp=float(self.eng.config.get("neighbours", {}).get("bonus_cp", 120)),
+            )
+
+        # Search time sized per position, within per-game and per-process budgets
+        self.time_manager = TimeManager(self.eng.config, process_budget(self.eng.config))
+        self.clock = self.time_manager.clock()
+        self.book_ply = None  # ply of the bot's last book move
+
+        # Background search on the user's likely replies while they think
+        # (off for throwaway stateless games, whose next move may hit another worker)
+        opts = self.eng.config.get("ponder", {})
+        self.ponderer = None
+        if ponder and opts.get("enabled", True):
+            self.ponderer = Ponderer(
+                self.engine_reply,
+                workers=int(opts.get("workers", 1)),
+                max_candidates=int(opts.get("candidates", 3)),
+                budget=float(opts.get("budget", 20)),
+            )
+        self.predicted = None  # engine's expected user reply after its last move
+        self.last_source = None  # stage that chose the bot's last move
+        self.ended = False  # archived and learned from; end_game() is a no-op after
+        # Stateless games: called once the game ends, False if another request
+        # already ended it (a replayed token), in which case it is not recorded again
+        self.claim_end = None
+
+    def engine_reply(self, board, clock=None):
+        """Engine move for `board`; `clock` is charged for real moves, not pondering.
+
+        Waits for an engine slot from the scheduler; pondering (no clock) only
+        runs on an idle engine and raises Overloaded otherwise.
+        """
+        limit, scale = self.search_limit(board, clock)
+        if scale < 1:
+            LOAD_SHED.inc(action="shrink")
+        prior = self.similar_moves(board)
+        with self.scheduler.slot(self.owner, limit.time, background=clock is None):
+            start = time.perf_counter()
+            result = self.sampler.play(board, limit, prior) if self.sampler else self.eng.play(board, limit)
+            self.time_manager.spend(time.perf_counter() - start, clock)
+        return result
+
+    def search_limit(self, board, clock=None):
+        """(Limit, load scale) for searching `board`; shorter while moves queue for an engine."""
+        out_of_book = len(board.move_stack) - self.book_ply if self.book_ply is not None else None
+        scale = self.scheduler.time_factor()
+        return self.time_manager.limit(board, clock, out_of_book, scale), scale
+
+    def similar_moves(self, board):
+        """{move: weight} I played in the corpus positions nearest `board`; steers the sampler."""
+        if self.neighbours is None or self.sampler is None:
+            return None
+        opts = self.eng.config.get("neighbours", {})
+        with span("similar"):
+            return dict(self.neighbours.moves(board, k=int(opts.get("k", 16)),
+                                              max_distance=int(opts.get("max_distance", 32))))
+
+    def quick_reply(self, board):
+        """A shallow in-process search, for when the engines are backed up."""
+        return Searcher(max_depth=2).play(board, chess.engine.Limit(time=0.05))
+
+    def ply(self):
+        """Cached facts about the current position."""
+        return self.plies.current(self.board)
+
+    def fen(self):
+        return self.ply().fen()
+
+    def is_over(self):
+        return self.ply().game_over()
+
+    def push(self, move):
+        """Play `move` on the board and in the PGN; returns its SAN."""
+        san = self.plies.push(self.board, move)
+        self.node = self.node.add_variation(move)
+        return san
 
     # -------------------------------
     # start new game
     # -------------------------------
     def new_game(self, color):
         self.board.reset()
+        self.plies.reset(self.board)
         self.user_is_white = (color == "w")
         self.game = chess.pgn.Game()
         self.node = self.game
+        self.clock = self.time_manager.clock()
+        self.book_ply = None
+        self.ended = False
+        if self.ponderer:
+            self.ponderer.cancel()
 
         chat = f"Game started! You’re playing {'White' if color == 'w' else 'Black'}."
         bot_san, bot_chat = None, None
@@ -84,7 +386,31 @@ class BotGame:
             bot_san, fen, bot_chat = self.bot_move()
             return fen, chat, bot_san, bot_chat
 
-        return self.board.fen(), chat, None, None
+        return self.fen(), chat, None, None
+
+    def restore(self, color, moves, board=None, game_id=None, used=0.0, book_ply=None):
+        """Rebuild a game from its move list (stateless mode).
+
+        `board`, if given, must be the position after `moves`; it saves replaying them.
+        `used` (engine seconds this game has spent) and `book_ply` carry the
+        time manager's per-game state over from the previous request.
+        """
+        self.user_is_white = (color == "w")
+        self.game = chess.pgn.Game()
+        if game_id:
+            self.game.headers["GameId"] = game_id
+            self.owner = game_id  # one BotGame per request, so charge the game itself
+        self.node = self.game
+        for move in moves:
+            self.node = self.node.add_variation(move)
+        if board is None:
+            board = chess.Board()
+            for move in moves:
+                board.push(move)
+        self.board = board
+        self.plies.reset(board)
+        self.clock.used = used
+        self.book_ply = book_ply
 
     # -------------------------------
     # handle a user move
@@ -95,9 +421,9 @@ class BotGame:
             return None, msg, None, None
 
         # if game ends after user move
-        if self.board.is_game_over():
+        if self.is_over():
             res, chat = self.end_game()
-            return self.board.fen(), chat, None, None
+            return self.fen(), chat, None, None
 
         # bot replies
         bot_san, fen, bot_chat = self.bot_move()
@@ -107,43 +433,50 @@ class BotGame:
     def user_move(self, uci):
         try:
             move = chess.Move.from_uci(uci)
-            if move not in self.board.legal_moves:
+            if not self.ply().is_legal(move):
                 return False, "Illegal move"
-            self.board.push(move)
-            self.node = self.node.add_variation(move)
+            self.push(move)
+            if self.ponderer:
+                self.ponderer.resolve(move)
             return True, None
         except:
             return False, "Invalid move"
 
-    def bot_move(self):
-        move = None
-        fen = self.board.fen()
-        
+    def undo_move(self):
+        """Take back the last move, e.g. when its reply could not be scheduled."""
+        self.plies.pop(self.board)
+        self.node = self.node.parent
+        self.node.variations.pop()
+
+    def select_move(self):
+        """Pick the bot's move for the current position without playing it.
+
+        Returns (move, source, candidates): source is the stage that decided
+        (book, move_db, blunder, ponder, similar, engine or shed) and
+        candidates are the moves that stage chose between, likeliest first.
+        """
+        ply = self.ply()
+
         # 1. Try Persona Book (Weighted)
-        # book format: "fen": [{"san": "e4", "count": 10}, ...]
-        if fen in self.book:
-            moves_data = self.book[fen]
-            # Weighted random choice
-            population = [m["san"] for m in moves_data]
-            weights = [m["count"] for m in moves_data]
-            if population:
-                san = random.choices(population, weights=weights, k=1)[0]
-                try:
-                    move = self.board.parse_san(san)
-                except:
-                    pass
+        source = "book"
+        with span("book"):
+            move = self.book.choose(self.board, ply=ply)
+            candidates = [m for m, _ in sorted(self.book.moves(self.board, ply), key=lambda mw: -mw[1])] if move else []
 
         # 2. Fallback to Legacy DB (if enabled/needed)
-        if move is None and fen in self.move_db:
-             san_moves = list(self.move_db[fen].keys())
-             if san_moves:
+        if move is None:
+             source = "move_db"
+             with span("move_db"):
+                 counts = self.move_db.lookup(self.board, ply)
+             if counts:
                  try:
-                     move = self.board.parse_san(random.choice(san_moves))
+                     move = self.board.parse_san(random.choice(list(counts)))
+                     candidates = [self.board.parse_san(san) for san in sorted(counts, key=counts.get, reverse=True)]
                  except:
-                     pass
+                     move = None
 
-        # 3. Blunder check (using loaded style)
-        blunder_rate = self.style.get("blunder_chance", 0.01)
+        # 3. Blunder check (using loaded style); the sampler supplies its own variety
+        blunder_rate = 0 if self.sampler else self.style.get("blunder_chance", 0.01)
         
         # If we picked a move but RNG says blunder, discard it
         if move is not None and random.random() < blunder_rate:
@@ -153,28 +486,89 @@ class BotGame:
         # 4. Engine or Random Blunder
         if move is None:
             if random.random() < blunder_rate:
-                move = random.choice(list(self.board.legal_moves))
-                chat = say("blunder")
+                move = random.choice(ply.legal())
+                source = "blunder"
+                candidates = [move]
             else:
-                result = self.eng.play(self.board, chess.engine.Limit(time=self.eng.config["time_limit"]))
+                result = None
+                if self.ponderer:
+                    # A still-running search for this position may use this move's time
+                    result = self.ponderer.take(self.board, self.search_limit(self.board, self.clock)[0].time)
+                source = "ponder" if result else "engine"
+                if not result and self.scheduler.level() < SHED:
+                    try:
+                        with span("engine"):
+                            result = self.engine_reply(self.board, self.clock)
+                    except Overloaded:
+                        result = None  # the queue filled up after the check
+                    else:
+                        if (result.info or {}).get("similar"):
+                            source = "similar"  # an engine line I played in similar positions
+                if not result:
+                    # Engines backed up: answer now rather than join the queue
+                    source = "shed"
+                    LOAD_SHED.inc(action="shed")
+                    with span("shed"):
+                        result = self.quick_reply(self.board)
                 move = result.move
-                chat = say("engine")
-        else:
-            chat = say("engine")
+                self.predicted = result.ponder
+                candidates = (result.info or {}).get("candidates") or [move]
 
-        # ✅ FIX: get SAN before pushing the move
-        san = self.board.san(move)
-        self.board.push(move)
-        self.node = self.node.add_variation(move)
+        return move, source, candidates
+
+    def bot_move(self, choice=None):
+        """Play the bot's move: `choice` is a select_move() result if it was made already."""
+        if choice is not None:
+            return self._bot_move(choice)
+        with span("bot_move"):
+            return self._bot_move(self.select_move())
+
+    def _bot_move(self, choice):
+        move, source, _ = choice
+        self.last_source = source
+        if source == "book":
+            self.book_ply = len(self.board.move_stack)
+        chat = say("blunder") if source == "blunder" else say("engine")
+
+        san = self.push(move)
 
         if self.board.is_check():
             chat = say("check")
         elif random.random() < 0.1:
             chat = say("random")
 
-        return san, self.board.fen(), chat
+        MOVE_SOURCE.inc(source=source)
+
+        if self.ponderer and not self.is_over() and self.scheduler.level() == NORMAL:
+            with span("ponder_start"):
+                self.ponderer.start(self.board, self.likely_replies())
+
+        return san, self.fen(), chat
+
+    def likely_replies(self):
+        """User moves worth pondering on: engine prediction, then book, then move_db."""
+        candidates = []
+        if self.predicted is not None and self.board.is_legal(self.predicted):
+            candidates.append(self.predicted)
+        ply = self.ply()
+        candidates += [m for m, _ in self.book.moves(self.board, ply)]
+        counts = self.move_db.lookup(self.board, ply)
+        for san in sorted(counts, key=counts.get, reverse=True):
+            try:
+                candidates.append(self.board.parse_san(san))
+            except ValueError:
+                pass
+        self.predicted = None
+        return list(dict.fromkeys(candidates))
 
     def end_game(self, resigned=False):
+        with span("end_game"):
+            return self._end_game(resigned)
+
+    def _end_game(self, resigned):
+        if self.ended:
+            return self.game.headers["Result"], None
+        self.ended = True
         res = "*"
         chat = None
         if resigned:
@@ -188,22 +582,23 @@ class BotGame:
             chat = "Draw? Boring, but I’ll take it 😴"
 
         self.game.headers["Result"] = res
-        filename = f"game_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pgn"
-        with open(filename, "w", encoding="utf-8") as f:
-            print(self.game, file=f)
-
-        self._update_db()
+        self.game.headers["White"] = "You" if self.user_is_white else "ReallyBot"
+        self.game.headers["Black"] = "ReallyBot" if self.user_is_white else "You"
+        self.game.headers["Persona"] = self.persona.version
+        if self.claim_end is not None and not self.claim_end():
+            return res, chat
+        if self.archive:
+            with span("archive"):
+                self.archive.submit(self.game)
+
+        with span("db_update"):
+            self._update_db()
         return res, chat
 
     def _update_db(self):
-        board = self.game.board()
-        for move in self.game.mainline_moves():
-            san = board.san(move)
-            fen = board.fen()
-            self.move_db.setdefault(fen, {})
-            self.move_db[fen][san] = self.move_db[fen].get(san, 0) + 1
-            board.push(move)
-        save_move_db(self.move_db)
+        # Keys and SANs were recorded as the game was played, so nothing is
+        # replayed here. Queued in memory; the store's flusher writes it to disk.
+        self.move_db.record_plies(self.plies.rows(self.game))
 
     # -------------------------------
     # resign shortcut
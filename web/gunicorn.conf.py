@@ -0,0 +1,40 @@
+import gc, json, os
+
+# web/gunicorn.conf.py
+# gunicorn -c gunicorn.conf.py app:app
+#
+# The master imports the app and loads the read-only persona data once, then
+# forks; workers share those pages copy-on-write instead of each parsing the
+# same files. Engines, move_db and the archive writer own threads, processes
+# or connections, so each worker starts its own on first use.
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config.json"), encoding="utf-8") as f:
+    STATELESS = bool(json.load(f).get("stateless", False))
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+# Live games sit in the memory of the worker that created them, so without
+# stateless tokens every request must reach that one worker: scale with
+# threads instead. Stateless games can be served by any worker.
+workers = int(os.environ.get("WEB_CONCURRENCY", 2 if STATELESS else 1))
+if workers > 1 and not STATELESS:
+    print(f"⚠️ {workers} workers need \"stateless\": true in config.json "
+          "(games live in one worker's memory); starting 1 worker.")
+    workers = 1
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+timeout = 60
+preload_app = True
+
+
+def when_ready(server):
+    # Runs in the master after the app is imported and before any worker forks.
+    import bot_core
+    bot_core.shared_assets().preload()
+    # Move everything loaded so far out of the collector's view: otherwise the
+    # first collection in each worker touches (and so copies) every page.
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    # Start this worker's engines before it takes requests, not on the first move.
+    import bot_core
+    bot_core.shared_assets().eng.warm()
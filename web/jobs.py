@@ -0,0 +1,36 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# web/jobs.py
+# Bounded pool for bot replies. Requests hand the engine search off here and
+# return at once, so a web worker is never held for the bot's think time.
+
+
+class Busy(Exception):
+    """Raised when too many bot replies are already queued or running."""
+
+
+class BoundedExecutor:
+    def __init__(self, max_workers=4, max_pending=64):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bot-move")
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.in_flight = 0  # queued + running, for /metrics
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            raise Busy
+        try:
+            future = self.pool.submit(fn, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.in_flight += 1
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, _future):
+        with self.lock:
+            self.in_flight -= 1
+        self.slots.release()
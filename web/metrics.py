@@ -0,0 +1,149 @@
+import bisect, threading, time
+from contextlib import contextmanager
+
+# web/metrics.py
+# Small in-process metrics registry rendered in the Prometheus text format.
+# Counters and histograms are a dict lookup, a bisect and a lock per
+# observation, cheap enough to leave on permanently. Gauges are callbacks
+# read at scrape time so other components don't have to push values.
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[n] for n in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            yield self.name + _labels(self.labelnames, key), value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}  # label values -> [per-bucket counts (+Inf last), sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[n] for n in self.labelnames)
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self.lock:
+            items = sorted((k, (list(c), s)) for k, (c, s) in self.values.items())
+        for key, (counts, total) in items:
+            running = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                running += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield self.name + "_bucket" + _labels(self.labelnames, key, f'le="{le}"'), running
+            yield self.name + "_sum" + _labels(self.labelnames, key), round(total, 6)
+            yield self.name + "_count" + _labels(self.labelnames, key), running
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, help, fn):
+        self.name, self.help, self.fn = name, help, fn
+
+    def samples(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return  # a broken callback shouldn't take the whole scrape down
+        if value is not None:
+            yield self.name, value
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _add(self, metric):
+        with self.lock:
+            # Re-registering (e.g. a module imported twice) returns the existing one.
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name, help, fn):
+        with self.lock:
+            self.metrics[name] = Gauge(name, help, fn)  # latest callback wins
+            return self.metrics[name]
+
+    def render(self):
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name} {value}" for name, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "bot_stage_seconds", "Time spent in each stage of move handling", ("stage",))
+MOVE_SOURCE = REGISTRY.counter(
+    "bot_moves_total", "Bot moves by the source that chose them", ("source",))
+PONDER_RESULTS = REGISTRY.counter(
+    "bot_ponder_total", "Whether a pondered reply matched the user's move (late: its search "
+    "was still running when the move's time ran out)", ("result",))
+ENGINE_WAIT = REGISTRY.histogram(
+    "engine_queue_wait_seconds", "Time a search waited for a free engine", ("kind",))
+LOAD_SHED = REGISTRY.counter(
+    "bot_load_shed_total", "Moves degraded or refused because the engines were backed up", ("action",))
+PERSONA_RELOADS = REGISTRY.counter(
+    "persona_reloads_total", "Persona reloads that swapped in new files, or failed", ("result",))
+REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_seconds", "Request latency per endpoint", ("endpoint", "status"))
+
+
+def span(stage):
+    """`with span("book"): ...` times one stage into bot_stage_seconds."""
+    return STAGE_SECONDS.time(stage=stage)
@@ -0,0 +1,115 @@
+import hashlib, os, threading, time
+from metrics import PERSONA_RELOADS
+
+# web/persona.py
+# Hot-reloadable persona (style + opening book). Each load produces an
+# immutable Persona tagged with a version derived from the files' contents;
+# the manager swaps its `current` reference in one assignment. Games keep the
+# Persona they started with, so a reload never changes the book under a game
+# in progress, and new games pick up the new one. A watcher thread polls the
+# directory's mtimes and reloads off the request path once the files have
+# stopped changing; reload() is also the admin trigger.
+
+HISTORY = 4  # recent versions kept so stateless games can stay on theirs
+WATCHED = ("style.json", "opening_book.json", "opening_book.bin", "persona.marshal")
+
+
+class Persona:
+    __slots__ = ("version", "style", "book", "loaded_at")
+
+    def __init__(self, version, style, book):
+        self.version = version
+        self.style = style
+        self.book = book
+        self.loaded_at = time.time()
+
+
+def persona_version(directory):
+    """Short content hash of the persona files; equal files, equal version.
+
+    The snapshot counts too: it decides whether the .bin book is trusted, and
+    build_persona.py writes it last, so a reload that ran before it arrived
+    must run again once it does.
+    """
+    digest = hashlib.sha1()
+    for name in WATCHED:
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                digest.update(name.encode() + hashlib.sha1(f.read()).digest())
+    return digest.hexdigest()[:12]
+
+
+class PersonaManager:
+    def __init__(self, directory, load, interval=5.0):
+        """`load()` returns (style, book) read from `directory`."""
+        self.directory = directory
+        self.load = load
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.current = None
+        self.recent = []  # newest last
+        self.watcher_pid = None
+        self.reload()
+
+    def get(self):
+        """The live Persona. Starts this process's watcher on first use after a fork."""
+        if self.interval and self.watcher_pid != os.getpid():
+            with self.lock:
+                if self.watcher_pid != os.getpid():
+                    self.watcher_pid = os.getpid()
+                    threading.Thread(target=self._watch, name="persona-watcher", daemon=True).start()
+        return self.current
+
+    def find(self, version):
+        """The Persona with this version if still around, else the live one."""
+        for persona in self.recent:
+            if persona.version == version:
+                return persona
+        return self.get()
+
+    def reload(self):
+        """Load the files now; swaps only if the content changed. Returns the live version."""
+        with self.lock:
+            try:
+                version = persona_version(self.directory)
+                if self.current is not None and version == self.current.version:
+                    return version
+                style, book = self.load()
+            except (OSError, ValueError) as e:
+                # Half-written or broken files: keep serving what we have.
+                PERSONA_RELOADS.inc(result="error")
+                if self.current is None:
+                    raise
+                print(f"⚠️ Persona reload failed, keeping {self.current.version}: {e}")
+                return self.current.version
+            self.current = Persona(version, style, book)
+            self.recent = (self.recent + [self.current])[-HISTORY:]
+            PERSONA_RELOADS.inc(result="ok")
+            return version
+
+    def _signature(self):
+        sig = []
+        for name in WATCHED:
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+                sig.append((name, st.st_mtime_ns, st.st_size))
+            except OSError:
+                sig.append((name, None, None))
+        return sig
+
+    def _watch(self):
+        seen = self._signature()
+        pending = None
+        while True:
+            time.sleep(self.interval)
+            sig = self._signature()
+            if sig != seen:
+                # Wait for one quiet interval so a rebuild that writes several
+                # files is picked up as a whole, not file by file.
+                if sig == pending:
+                    self.reload()
+                    seen, pending = sig, None
+                else:
+                    pending = sig
+
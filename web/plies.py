@@ -0,0 +1,102 @@
+import chess, chess.polyglot
+
+# web/plies.py
+# Per-ply position cache for a BotGame. One /move used to ask the board for
+# its FEN, legal moves and game-over status several times over (each of those
+# regenerates moves), and finishing a game replayed it from the start to get
+# FENs and SANs that were already known when the moves were played. PlyLog
+# computes each of those at most once per ply and keeps what learning needs
+# (position key, FEN, SAN) as the game goes.
+
+
+class Ply:
+    """One position of the game. Lazy fields are only valid while it is current."""
+    __slots__ = ("board", "_fen", "_zobrist", "_legal", "_legal_set", "_over", "san")
+
+    def __init__(self, board):
+        self.board = board
+        self._fen = self._zobrist = self._legal = self._legal_set = self._over = None
+        self.san = None  # of the move played from here, once there is one
+
+    def fen(self):
+        if self._fen is None:
+            self._fen = self.board.fen()
+        return self._fen
+
+    def zobrist(self):
+        if self._zobrist is None:
+            self._zobrist = chess.polyglot.zobrist_hash(self.board)
+        return self._zobrist
+
+    def legal(self):
+        if self._legal is None:
+            self._legal = list(self.board.legal_moves)
+        return self._legal
+
+    def is_legal(self, move):
+        if self._legal_set is None:
+            self._legal_set = frozenset(self.legal())
+        return move in self._legal_set
+
+    def game_over(self):
+        """board.is_game_over() without generating moves again."""
+        if self._over is None:
+            board = self.board
+            self._over = (not self.legal() or board.is_insufficient_material()
+                          or board.is_seventyfive_moves()
+                          # five occurrences need at least 16 reversible plies
+                          or (board.halfmove_clock >= 16 and board.is_fivefold_repetition()))
+        return self._over
+
+
+class PlyLog:
+    def __init__(self, board):
+        self.reset(board)
+
+    def reset(self, board):
+        """Start over from `board`; plies before it are unknown (see rows())."""
+        self.board = board
+        self.base = len(board.move_stack)
+        self.plies = [Ply(board)]
+
+    def current(self, board):
+        # Anything that changed the board behind our back (tests, benchmarks
+        # that set game.board) just starts a fresh log.
+        if board is not self.board or len(board.move_stack) != self.base + len(self.plies) - 1:
+            self.reset(board)
+        return self.plies[-1]
+
+    def push(self, board, move):
+        """Play `move` on `board`, returning its SAN."""
+        ply = self.current(board)
+        ply.san = board.san(move)
+        # keep what learning needs before the board moves on
+        ply.fen()
+        ply.zobrist()
+        ply.board = None
+        board.push(move)
+        self.plies.append(Ply(board))
+        return ply.san
+
+    def pop(self, board):
+        self.current(board)
+        board.pop()
+        if len(self.plies) > 1:
+            self.plies.pop()
+            ply = self.plies[-1]
+            ply.board, ply.san = board, None
+        else:
+            self.reset(board)
+
+    def rows(self, game):
+        """(zobrist, fen, san) for every mainline move of `game`, the game this log follows."""
+        rows = [(p._zobrist, p._fen, p.san) for p in self.plies if p.san is not None]
+        if self.base:
+            # Moves from before the log started (a restored stateless game): replay just those.
+            board = game.board()
+            prefix = []
+            for move in list(game.mainline_moves())[:self.base]:
+                prefix.append((chess.polyglot.zobrist_hash(board), board.fen(), board.san(move)))
+                board.push(move)
+            rows = prefix + rows
+        return rows
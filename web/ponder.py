@@ -0,0 +1,110 @@
+import threading, time
+from concurrent.futures import ThreadPoolExecutor
+from metrics import PONDER_RESULTS
+
+# web/ponder.py
+# Speculative replies computed while the human is thinking. After the bot
+# moves, the likeliest user replies (engine's predicted move, book, move_db)
+# are searched in the background; if the user plays one of them the bot's
+# answer is already there, or nearly: a search for the played move that is
+# still running is kept and waited on within the move's own time allocation.
+# A shared, small pool plus a per-game CPU budget keeps pondering from
+# starving real moves.
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def ponder_pool(workers):
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ponder")
+    return _pool
+
+
+class Ponderer:
+    def __init__(self, search, workers=1, max_candidates=3, budget=20.0):
+        self.search = search  # board -> chess.engine.PlayResult
+        self.workers = workers
+        self.max_candidates = max_candidates
+        self.budget = budget  # engine seconds this game may spend speculating
+        self.spent = 0.0
+        self.epoch = 0
+        self.jobs = {}  # predicted user move -> Future[PlayResult]
+        self.hit = None
+        self.pending = None  # search for the played move, still running when it was played
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def start(self, board, candidates):
+        """Search bot replies to each candidate user move from `board` (user to move)."""
+        self.cancel()
+        if self.spent >= self.budget:
+            return
+        pool = ponder_pool(self.workers)
+        epoch = self.epoch
+        for move in candidates[:self.max_candidates]:
+            after = board.copy(stack=True)
+            after.push(move)
+            if after.is_game_over():
+                continue
+            self.jobs[move] = pool.submit(self._search, after, epoch)
+
+    def _search(self, board, epoch):
+        # Skip work that was invalidated while it sat in the queue.
+        if epoch != self.epoch or self.spent >= self.budget:
+            return None
+        start = time.perf_counter()
+        try:
+            return self.search(board)
+        finally:
+            with self.lock:
+                self.spent += time.perf_counter() - start
+
+    def resolve(self, played):
+        """The user played `played`: keep its reply (if any) and drop the rest."""
+        if not self.jobs:
+            return
+        job = self.jobs.pop(played, None)
+        self.cancel()
+        if job is None or job.cancelled():
+            pass
+        elif job.done():
+            if job.exception() is None:
+                self.hit = job.result()
+        elif job.running():
+            self.pending = job  # nearly there; a fresh search would only queue behind it
+        else:
+            job.cancel()  # never started: nothing to keep
+        if self.hit is not None or self.pending is not None:
+            self.hits += 1
+            PONDER_RESULTS.inc(result="hit")
+        else:
+            self.misses += 1
+            PONDER_RESULTS.inc(result="miss")
+
+    def take(self, board, wait=0.0):
+        """Pondered reply for the current position, or None.
+
+        A search still running for it gets up to `wait` seconds to finish.
+        """
+        result, self.hit = self.hit, None
+        job, self.pending = self.pending, None
+        if result is None and job is not None:
+            try:
+                result = job.result(timeout=wait)
+            except Exception:  # timed out, cancelled or failed: search afresh
+                PONDER_RESULTS.inc(result="late")
+                result = None
+        if result is not None and result.move is not None and board.is_legal(result.move):
+            return result
+        return None
+
+    def cancel(self):
+        self.epoch += 1
+        for job in self.jobs.values():
+            job.cancel()  # queued jobs never start; running ones are discarded
+        self.jobs = {}
+        self.hit = None
+        self.pending = None  # a running search can't be stopped; its result is dropped
@@ -0,0 +1,149 @@
+import threading, time
+from contextlib import contextmanager
+from metrics import ENGINE_WAIT
+
+# web/scheduler.py
+# Admission control and fair queueing in front of the engines. Every engine
+# search a game makes takes one of `slots` (the engine pool size) first. When
+# none is free the search waits in a bounded queue, and a freed slot goes to
+# the waiter with the lowest score:
+#
+#     recent engine seconds of its game + its own time limit - seconds waited
+#
+# so games that have been searching a lot yield to the others, short searches
+# go first, and nothing waits forever. Pondering only runs on idle engines.
+#
+# The queue length also sets the load level the bot uses to degrade: shorter
+# searches (SHRINK), then no engine search at all (SHED), then refusing new
+# moves with a retry hint (REJECT). Searches waiting only because pondering
+# holds an engine don't count: that engine frees up within one ponder search.
+
+NORMAL, SHRINK, SHED, REJECT = range(4)
+
+
+class Overloaded(Exception):
+    """Raised when the engine queue is full (or, for pondering, not empty)."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"engines overloaded, retry in {retry_after:g}s")
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("owner", "cost", "since", "event")
+
+    def __init__(self, owner, cost):
+        self.owner = owner
+        self.cost = cost
+        self.since = time.monotonic()
+        self.event = threading.Event()
+
+
+class EngineScheduler:
+    def __init__(self, slots=1, max_queue=32, shrink_at=1, shed_at=8, retry_after=2.0, half_life=30.0):
+        self.slots = slots
+        self.free = slots
+        self.max_queue = max_queue
+        self.shrink_at = shrink_at
+        self.shed_at = shed_at
+        self.retry_after = retry_after
+        self.half_life = half_life
+        self.waiting = []
+        self.background = 0  # engines held by pondering
+        self.usage = {}  # owner -> (engine seconds, as of monotonic time)
+        self.lock = threading.Lock()
+
+    def depth(self):
+        return len(self.waiting)
+
+    def busy(self):
+        return self.slots - self.free
+
+    def load(self):
+        """Queued searches, less those only waiting behind pondering."""
+        return max(0, len(self.waiting) - self.background)
+
+    def level(self):
+        queued = self.load()
+        if queued >= self.max_queue:
+            return REJECT
+        if queued >= self.shed_at:
+            return SHED
+        if queued >= self.shrink_at:
+            return SHRINK
+        return NORMAL
+
+    def time_factor(self):
+        """Scale for new time limits: shorter searches as the queue grows."""
+        queued = self.load()
+        if queued < self.shrink_at:
+            return 1.0
+        return max(0.25, self.slots / (self.slots + queued))
+
+    def admit(self):
+        """Raise Overloaded if a new move should be turned away."""
+        if self.level() == REJECT:
+            raise Overloaded(self._retry_hint())
+
+    def _retry_hint(self):
+        return self.retry_after * (1 + self.load() // max(1, self.slots * 4))
+
+    @contextmanager
+    def slot(self, owner, cost, background=False):
+        """Hold an engine for one search. `cost` is the search's time limit.
+
+        Raises Overloaded instead of queueing past max_queue: moves admitted
+        before the queue filled must not grow it without bound.
+        """
+        waiter = _Waiter(owner, cost or 0.0)
+        with self.lock:
+            if self.free and not self.waiting:
+                self.free -= 1
+                self.background += background
+                waiter.event.set()
+            elif background:
+                raise Overloaded(self.retry_after)
+            elif len(self.waiting) >= self.max_queue:
+                raise Overloaded(self._retry_hint())
+            else:
+                self.waiting.append(waiter)
+        waiter.event.wait()
+        started = time.monotonic()
+        ENGINE_WAIT.observe(started - waiter.since, kind="ponder" if background else "move")
+        try:
+            yield
+        finally:
+            self._release(owner, time.monotonic() - started, background)
+
+    def _release(self, owner, seconds, background=False):
+        with self.lock:
+            self.background -= background
+            now = time.monotonic()
+            self.usage[owner] = (self._usage(owner, now) + seconds, now)
+            if len(self.usage) > 4096:
+                self.usage = {k: v for k, v in self.usage.items() if self._usage(k, now) > 0.01}
+            if self.waiting:
+                nxt = min(self.waiting, key=lambda w: self._score(w, now))
+                self.waiting.remove(nxt)
+                nxt.event.set()  # the slot passes straight to the next search
+            else:
+                self.free += 1
+
+    def _usage(self, owner, now):
+        seconds, stamp = self.usage.get(owner, (0.0, now))
+        return seconds * 0.5 ** ((now - stamp) / self.half_life)
+
+    def _score(self, waiter, now):
+        return self._usage(waiter.owner, now) + waiter.cost - (now - waiter.since)
+
+
+def scheduler_from_config(config):
+    opts = config.get("scheduler", {})
+    return EngineScheduler(
+        slots=max(1, int(config.get("engine_pool_size", 1))),
+        max_queue=int(opts.get("max_queue", 32)),
+        shrink_at=int(opts.get("shrink_at", 1)),
+        shed_at=int(opts.get("shed_at", 8)),
+        retry_after=float(opts.get("retry_after", 2.0)),
+        half_life=float(opts.get("half_life", 30.0)),
+    )
@@ -0,0 +1,63 @@
+import threading, time
+from collections import OrderedDict
+
+# web/sessions.py
+# Session-keyed registry of live games. Each browser session owns one BotGame;
+# a per-game lock serialises requests for the same game while different games
+# proceed in parallel.
+
+
+class GameSlot:
+    def __init__(self, game):
+        self.game = game
+        self.lock = threading.Lock()
+        self.job = None  # Future for a bot reply still being computed
+        self.last_seen = time.monotonic()
+
+
+class GameStore:
+    def __init__(self, factory, max_games=500, idle_ttl=1800):
+        self.factory = factory
+        self.max_games = max_games
+        self.idle_ttl = idle_ttl
+        self._slots = OrderedDict()  # least recently used first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def get(self, sid):
+        """Return the live slot for `sid`, or None if it expired or never existed."""
+        if sid is None:
+            return None
+        with self._lock:
+            self._evict()
+            slot = self._slots.get(sid)
+            if slot is not None:
+                slot.last_seen = time.monotonic()
+                self._slots.move_to_end(sid)
+            return slot
+
+    def create(self, sid):
+        """Start a fresh game for `sid`, replacing any game it already had."""
+        slot = GameSlot(self.factory())
+        with self._lock:
+            self._slots.pop(sid, None)
+            self._evict()
+            while len(self._slots) >= self.max_games:
+                self._slots.popitem(last=False)
+            self._slots[sid] = slot
+        return slot
+
+    def discard(self, sid):
+        with self._lock:
+            self._slots.pop(sid, None)
+
+    def _evict(self):
+        # Slots are kept in LRU order, so expired games are always at the front.
+        cutoff = time.monotonic() - self.idle_ttl
+        while self._slots:
+            sid, slot = next(iter(self._slots.items()))
+            if slot.last_seen >= cutoff:
+                break
+            self._slots.popitem(last=False)
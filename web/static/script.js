@@ -5,6 +5,7 @@ const statusBox = document.getElementById('status');
 let game = new Chess();
 let board = null;
 let userColor = 'w'; // default
+let gameToken = null; // signed game state when the server runs stateless
 
 // History State
 let historyStack = [];
@@ -204,10 +205,11 @@ function onDrop(source, target) {
     fetch("/move", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ uci: source + target })
+        body: JSON.stringify({ uci: source + target, token: gameToken })
     })
         .then(r => r.json())
         .then(data => {
+            if (data.token) gameToken = data.token;
             if (data.error) {
                 alert("Error: " + data.error);
                 // revert
@@ -218,27 +220,58 @@ function onDrop(source, target) {
                 return;
             }
 
-            // Human-like delay 400-800ms
-            const delay = Math.floor(Math.random() * 400) + 400;
-
-            setTimeout(() => {
-                game.load(data.fen);
-                board.position(data.fen);
-
-                if (data.bot_move) {
-                    highlightMove(data.bot_move.from, data.bot_move.to);
-                }
-                if (data.bot_san) {
-                    pushMove(data.bot_san); // Pushes bot move to stack
-                    appendChat(`Played ${data.bot_san}. ${data.bot_chat || ""}`, true);
-                }
-
-                checkGameOver();
-            }, delay);
+            if (data.pending) {
+                // Bot reply is being computed on the server; poll for it.
+                setStatus("ReallyBot is thinking...");
+                pollBotMove();
+                return;
+            }
+            showBotReply(data);
         })
         .catch(err => console.error(err));
 }
 
+function pollBotMove() {
+    fetch("/bot_move")
+        .then(r => r.json())
+        .then(data => {
+            if (!data.ok) {
+                setStatus(data.error || "Lost the bot's reply.", false);
+                return;
+            }
+            if (data.pending) {
+                setTimeout(pollBotMove, 250);
+                return;
+            }
+            setStatus("Your move.");
+            showBotReply(data);
+        })
+        .catch(err => {
+            console.error(err);
+            setTimeout(pollBotMove, 1000);
+        });
+}
+
+function showBotReply(data) {
+    // Human-like delay 400-800ms
+    const delay = Math.floor(Math.random() * 400) + 400;
+
+    setTimeout(() => {
+        game.load(data.fen);
+        board.position(data.fen);
+
+        if (data.bot_move) {
+            highlightMove(data.bot_move.from, data.bot_move.to);
+        }
+        if (data.bot_san) {
+            pushMove(data.bot_san); // Pushes bot move to stack
+            appendChat(`Played ${data.bot_san}. ${data.bot_chat || ""}`, true);
+        }
+
+        checkGameOver();
+    }, delay);
+}
+
 function checkGameOver() {
     if (game.game_over()) {
         let msg = "Game Over: ";
@@ -293,6 +326,7 @@ async function newGame(color) {
             body: JSON.stringify({ color })
         });
         const data = await res.json();
+        gameToken = data.token || null;
 
         if (!data.ok) {
             setStatus("Failed to start", false);
@@ -328,7 +362,11 @@ async function resign() {
     if (game.game_over()) return; // Already over
 
     try {
-        const res = await fetch('/resign', { method: 'POST' });
+        const res = await fetch('/resign', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ token: gameToken })
+        });
         const data = await res.json();
         if (data.ok) {
             appendChat(data.chat || "You resigned.", true);
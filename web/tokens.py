@@ -0,0 +1,126 @@
+import base64, struct, threading
+from collections import OrderedDict
+import chess
+from itsdangerous import BadSignature, URLSafeSerializer
+
+# web/tokens.py
+# Stateless game protocol. The whole game travels with the client as a signed
+# token (colour, game id, packed move list, engine time spent, last book ply),
+# so any worker can serve any move.
+# A per-process LRU of recently rebuilt boards skips replaying the move list
+# when the same worker sees the next move of a game, the common case.
+
+MOVE = struct.Struct(">H")
+
+
+class BadToken(Exception):
+    """Raised for tokens that are forged, corrupted or describe an illegal game."""
+
+
+class GameOver(BadToken):
+    """Raised for tokens of a game that has already ended."""
+
+
+def pack_moves(moves):
+    # 6 bits from, 6 bits to, 3 bits promotion piece: two bytes per ply.
+    raw = b"".join(MOVE.pack(m.from_square | m.to_square << 6 | (m.promotion or 0) << 12)
+                   for m in moves)
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def unpack_moves(packed):
+    raw = base64.urlsafe_b64decode(packed + "=" * (-len(packed) % 4))
+    moves = []
+    for (v,) in MOVE.iter_unpack(raw):
+        moves.append(chess.Move(v & 63, v >> 6 & 63, (v >> 12) or None))
+    return moves
+
+
+class BoardCache:
+    """Recently rebuilt boards, keyed by packed move list."""
+
+    def __init__(self, max_entries=2000):
+        self.max_entries = max_entries
+        self.boards = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            board = self.boards.get(key)
+            if board is None:
+                self.misses += 1
+                return None
+            self.boards.move_to_end(key)
+            self.hits += 1
+            return board.copy()
+
+    def put(self, key, board):
+        board = board.copy()
+        with self.lock:
+            self.boards[key] = board
+            self.boards.move_to_end(key)
+            while len(self.boards) > self.max_entries:
+                self.boards.popitem(last=False)
+
+
+class GameTokens:
+    def __init__(self, secret, cache_size=2000, finished_size=20000):
+        self.signer = URLSafeSerializer(secret, salt="game-token")
+        self.cache = BoardCache(cache_size)
+        # Games this worker has ended, oldest first: an earlier token of the
+        # game replayed here must not resign or record it a second time.
+        self.finished = OrderedDict()
+        self.finished_size = finished_size
+        self.lock = threading.Lock()
+
+    def dump(self, game, game_id):
+        packed = pack_moves(game.board.move_stack)
+        self.cache.put(packed, game.board)
+        data = {"c": "w" if game.user_is_white else "b", "g": game_id, "m": packed,
+                "p": game.persona.version}
+        if game.clock.used:
+            data["t"] = round(game.clock.used, 3)  # the per-game engine budget spans requests
+        if game.book_ply is not None:
+            data["b"] = game.book_ply
+        if game.is_over():
+            data["f"] = 1  # signed, so any worker refuses to continue it
+        return self.signer.dumps(data)
+
+    def finish(self, game_id):
+        """Mark a game ended; False if this worker had already ended it.
+
+        Only a fast local check: workers share the claim through move_db.
+        """
+        with self.lock:
+            if game_id in self.finished:
+                return False
+            self.finished[game_id] = True
+            while len(self.finished) > self.finished_size:
+                self.finished.popitem(last=False)
+            return True
+
+    def load(self, token):
+        """Return (color, game_id, persona version, moves, board, state) for a token issued by `dump`.
+
+        `state` holds the keyword arguments BotGame.restore() takes besides those.
+        """
+        try:
+            data = self.signer.loads(token)
+            moves = unpack_moves(data["m"])
+        except (BadSignature, KeyError, TypeError, ValueError) as e:
+            raise BadToken(str(e)) from None
+        if data.get("f") or data["g"] in self.finished:
+            raise GameOver(data["g"])
+        board = self.cache.get(data["m"])
+        if board is None:
+            # The signature vouches for the moves; checking legality on a
+            # cache miss is cheap next to a search and guards against bugs.
+            board = chess.Board()
+            for move in moves:
+                if not board.is_legal(move):
+                    raise BadToken(f"illegal move {move.uci()} in token")
+                board.push(move)
+            self.cache.put(data["m"], board)
+        state = {"used": float(data.get("t", 0.0)), "book_ply": data.get("b")}
+        return data["c"], data["g"], data.get("p"), moves, board, state